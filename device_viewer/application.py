@@ -8,6 +8,7 @@ from dropbot_controller.consts import START_DEVICE_MONITORING
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
 # Local imports.
 from .preferences import DeviceViewerPreferences
+from .utils.parsed_device_cache import ParsedDeviceCache
 
 # Enthought library imports.
 from envisage.ui.tasks.api import TasksApplication
@@ -98,4 +99,8 @@ class DeviceViewerApplication(TasksApplication):
 
     @observe('started')
     def _on_application_started(self, event):
+        # parsed devices are cached along with the other application generated files
+        if self.app_data_dir:
+            ParsedDeviceCache.shared().cache_dir = os.path.join(self.app_data_dir, "device_cache")
+
         publish_message(message="", topic=START_DEVICE_MONITORING)
@@ -3,7 +3,9 @@ from collections import defaultdict
 
 # local
 from ..utils.dmf_utils import SvgUtil
+from ..utils.parsed_device_cache import ParsedDeviceCache
 from microdrop_utils._logger import get_logger
+from microdrop_utils.channels_states_bitset import pack_channels_states
 
 # enthought
 from traits.api import HasTraits, Int, Bool, Array, Float, Any, Dict, Str, Instance, Property, File, cached_property, List, observe
@@ -63,6 +65,9 @@ class Electrodes(HasTraits):
     #: Map of the unique channels and their states, True means actuated.
     channels_states_map = Property(Dict(Int, Bool), observe='_electrodes:items:channel, _electrodes:items:state')
 
+    #: The channels states map packed into a bitset payload, the compact format to publish channel states in.
+    channels_states_bitset = Property(Dict, observe='_electrodes:items:channel, _electrodes:items:state')
+
     # -------------------Magic methods ----------------------------------------------------------------------
     def __getitem__(self, item: Str) -> Electrode:
         return self._electrodes[item]
@@ -93,6 +98,9 @@ class Electrodes(HasTraits):
     def _get_channels_states_map(self):
         return dict(zip(self.electrode_channels, self.electrode_states))
 
+    def _get_channels_states_bitset(self):
+        return pack_channels_states(self.channels_states_map)
+
     @cached_property
     def _get_channels_electrode_ids_map(self):
         channel_to_electrode_ids_map = defaultdict(list)
@@ -119,5 +127,5 @@ class Electrodes(HasTraits):
         :return: Dictionary of electrodes
         """
 
-        self.svg_model = SvgUtil(svg_file)
+        self.svg_model = SvgUtil(svg_file, cache=ParsedDeviceCache.shared())
         logger.debug(f"Setting electrodes from SVG file: {svg_file}")
\ No newline at end of file
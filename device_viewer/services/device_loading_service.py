@@ -0,0 +1,138 @@
+import threading
+from pathlib import Path
+
+from traits.api import HasTraits, Instance, Callable, Any
+
+from microdrop_utils._logger import get_logger
+from device_viewer.models.electrodes import Electrodes
+from device_viewer.utils.dmf_utils import SvgUtil
+from device_viewer.utils.parsed_device_cache import ParsedDeviceCache
+
+logger = get_logger(__name__)
+
+
+class DeviceLoadCancelled(Exception):
+    """
+    Raised in the loading thread when the device load it runs is cancelled.
+    """
+
+
+class DeviceLoadingService(HasTraits):
+    """
+    Service loading devices from their SVG files in a worker thread, to keep the GUI responsive while large devices
+    load.
+
+    A device is loaded in two stages, each handed over through dispatch once done:
+
+    - on_electrodes_loaded is called with the electrodes model as soon as the electrode polygons are parsed,
+    - on_connections_loaded is called with the same model once the neighbours and connections of the electrodes are
+      found, which takes most of the time of a load.
+
+    on_progress is called with the fraction of the load done and a message along the way, and on_failed with the
+    error if the load fails. Starting a new load, or calling cancel, cancels the load running: none of its callbacks
+    are called past that point, even those already dispatched.
+    """
+
+    #: The cache of parsed devices
+    cache = Instance(ParsedDeviceCache, desc="The cache devices are loaded from and stored in")
+
+    #: Function calling the callbacks on the thread results are handed to, e.g. pyface GUI.invoke_later for the GUI
+    #: thread. Called with a callback followed by its arguments. The callbacks are called directly by default.
+    dispatch = Callable(desc="Function called with each callback, followed by its arguments, to call it")
+
+    on_progress = Callable(desc="Called with the fraction of the load done and a message")
+
+    on_electrodes_loaded = Callable(desc="Called with the electrodes model once its electrodes are parsed")
+
+    on_connections_loaded = Callable(desc="Called with the electrodes model once its connections are found")
+
+    on_failed = Callable(desc="Called with the error a load failed with")
+
+    # threading.Event set to cancel the current load
+    _cancel_event = Any()
+
+    _thread = Any()
+
+    def _cache_default(self):
+        return ParsedDeviceCache.shared()
+
+    def _dispatch_default(self):
+        return lambda callback, *args: callback(*args)
+
+    def load(self, svg_file):
+        """
+        Starts loading the device of svg_file in a worker thread, cancelling the load running if any.
+        """
+        self.cancel()
+
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
+
+        self._thread = threading.Thread(target=self._load, args=(svg_file, cancel_event),
+                                        name=f"device_loader_{Path(svg_file).name}", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """
+        Cancels the load running, if any. Its worker thread stops at the end of the stage it is running.
+        """
+        if self._cancel_event is not None and not self._cancel_event.is_set():
+            self._cancel_event.set()
+            logger.info("Device loading cancelled")
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits for the worker thread of the last load to finish. Returns False if it is still running after timeout
+        seconds.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+
+        return True
+
+    ################################# Protected methods ######################################
+
+    def _load(self, svg_file, cancel_event: threading.Event):
+        name = Path(svg_file).name
+
+        try:
+            self._notify(cancel_event, self.on_progress, 0.0, f"Parsing {name}")
+            svg_model = SvgUtil(cache=self.cache)
+            svg_model.get_device_paths(svg_file, find_connections=False)
+
+            self._notify(cancel_event, self.on_progress, 0.3, f"Creating electrodes of {name}")
+            electrodes_model = Electrodes()
+            electrodes_model.svg_model = svg_model
+
+            self._notify(cancel_event, self.on_electrodes_loaded, electrodes_model)
+
+            self._notify(cancel_event, self.on_progress, 0.5, f"Finding electrode connections of {name}")
+            svg_model.find_connections()
+
+            self._notify(cancel_event, self.on_connections_loaded, electrodes_model)
+            self._notify(cancel_event, self.on_progress, 1.0, f"Loaded {name}")
+
+            logger.info(f"Loaded device {svg_file}")
+
+        except DeviceLoadCancelled:
+            logger.debug(f"Stopped loading device {svg_file}: cancelled")
+
+        except Exception as e:
+            logger.error(f"Failed loading device {svg_file}: {e}", exc_info=True)
+            self._notify(cancel_event, self.on_failed, e, raise_cancelled=False)
+
+    def _notify(self, cancel_event: threading.Event, callback, *args, raise_cancelled=True):
+        if cancel_event.is_set():
+            if raise_cancelled:
+                raise DeviceLoadCancelled()
+            return
+
+        if callback is not None:
+            self.dispatch(self._call_unless_cancelled, cancel_event, callback, *args)
+
+    @staticmethod
+    def _call_unless_cancelled(cancel_event: threading.Event, callback, *args):
+        # cancelled while the callback was being dispatched
+        if not cancel_event.is_set():
+            callback(*args)
@@ -1,5 +1,4 @@
 from traits.api import HasTraits, Instance, Dict, List, Str
-import json
 from microdrop_utils._logger import get_logger
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
 from device_viewer.models.electrodes import Electrodes
@@ -51,4 +50,4 @@ class ElectrodeInteractionControllerService(HasTraits):
 
         # publish event to all interested. Mainly to backend actors who need to know user has requested the electrode
         # to be actuated / unactuated.
-        publish_message(topic=ELECTRODES_STATE_CHANGE, message=json.dumps(updated_channels_states_map))
\ No newline at end of file
+        publish_message(topic=ELECTRODES_STATE_CHANGE, message=self.electrodes_model.channels_states_bitset)
\ No newline at end of file
@@ -1,13 +1,13 @@
 # system imports.
-import json
 import os
 import dramatiq
 
 # Enthought library imports.
 from pyface.tasks.action.api import SMenu, SMenuBar, TaskToggleGroup, TaskAction
 from pyface.tasks.api import Task, TaskLayout, Tabbed
-from pyface.api import FileDialog, OK
-from traits.api import Instance, Str, provides
+from pyface.action.api import StatusBarManager
+from pyface.api import FileDialog, OK, GUI
+from traits.api import Instance, Str, Bool, provides
 
 from microdrop_utils.i_dramatiq_controller_base import IDramatiqControllerBase
 # Local imports.
@@ -16,12 +16,13 @@ from .views.device_view_pane import DeviceViewerPane
 from device_viewer.views.electrode_view.electrode_layer import ElectrodeLayer
 from .consts import ELECTRODES_STATE_CHANGE
 from .services.electrode_interaction_service import ElectrodeInteractionControllerService
+from .services.device_loading_service import DeviceLoadingService
 from .consts import PKG
 
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
 from microdrop_utils._logger import get_logger
 from microdrop_utils.dramatiq_controller_base import generate_class_method_dramatiq_listener_actor, \
-    basic_listener_actor_routine
+    basic_listener_actor_routine, get_handler_dispatch_table
 
 logger = get_logger(__name__)
 DEFAULT_SVG_FILE = f"{os.path.dirname(__file__)}{os.sep}2x3device.svg"
@@ -60,6 +61,9 @@ class DeviceViewerTask(Task):
             listener_name=listener_name,
             class_method=self.listener_actor_routine)
 
+        # find the topic handlers once, rather than on every message
+        get_handler_dispatch_table(self)
+
     #### 'Task' interface #####################################################
 
     id = f"{PKG}.task"
@@ -69,6 +73,9 @@ class DeviceViewerTask(Task):
 
         SMenu(
             TaskAction(id="open_svg_file", name='&Open SVG File', method='open_file_dialog', accelerator='Ctrl+O'),
+            TaskAction(id="normalize_svg_file", name='&Normalize SVG File', method='normalize_svg_file'),
+            TaskAction(id="cancel_device_loading", name='&Cancel Device Loading', method='cancel_device_loading',
+                       enabled_name='device_loading'),
             id="File", name="&File"
         ),
 
@@ -92,16 +99,23 @@ class DeviceViewerTask(Task):
 
     def activated(self):
         """Called when the task is activated."""
-        logger.debug(f"Device Viewer Task activated. Setting default view with {DEFAULT_SVG_FILE}...")
-        _electrodes = Electrodes()
-        _electrodes.set_electrodes_from_svg_file(DEFAULT_SVG_FILE)
+        logger.debug(f"Device Viewer Task activated. Loading default view with {DEFAULT_SVG_FILE}...")
+        self.load_device(DEFAULT_SVG_FILE)
 
-        self.electrodes_model = _electrodes
+    def prepare_destroy(self):
+        """Called when the task is about to be removed from its window."""
+        self.device_loading_service.cancel()
 
     #### 'DeviceViewerTask' interface ##########################################
 
     electrodes_model = Instance(Electrodes)
 
+    #: Service loading devices in a worker thread, handing them over to the GUI thread stage by stage
+    device_loading_service = Instance(DeviceLoadingService)
+
+    #: Whether a device is being loaded
+    device_loading = Bool(False)
+
     ###########################################################################
     # Protected interface.
     ###########################################################################
@@ -114,13 +128,26 @@ class DeviceViewerTask(Task):
             )
 
         )
+
+    def _status_bar_default(self):
+        return StatusBarManager()
+
+    def _device_loading_service_default(self):
+        return DeviceLoadingService(
+            dispatch=GUI.invoke_later,
+            on_progress=self._on_device_load_progress,
+            on_electrodes_loaded=self._on_device_electrodes_loaded,
+            on_connections_loaded=self._on_device_connections_loaded,
+            on_failed=self._on_device_load_failed,
+        )
     # --------------- Trait change handlers ----------------------------------------------
 
     def _electrodes_model_changed(self, new_model):
         """Handle when the electrodes model changes."""
 
-        # Trigger an update to redraw and re-initialize the svg widget once a new svg file is selected.
-        self.window.central_pane.set_view_from_model(new_model)
+        # Trigger an update to redraw and re-initialize the svg widget once a new svg file is selected. The labels
+        # and connections are streamed in after the electrodes.
+        self.window.central_pane.set_view_from_model(new_model, progressive=True)
         logger.debug(f"New Electrode Layer added --> {new_model.svg_model.filename}")
 
         # Initialize the electrode mouse interaction service with the new model and layer
@@ -133,7 +160,7 @@ class DeviceViewerTask(Task):
         self.window.central_pane.scene.interaction_service = self.interaction_service
 
         logger.debug(f"Setting up handlers for new layer for new electrodes model {new_model}")
-        publish_message(topic=ELECTRODES_STATE_CHANGE, message=json.dumps(self.electrodes_model.channels_states_map))
+        publish_message(topic=ELECTRODES_STATE_CHANGE, message=self.electrodes_model.channels_states_bitset)
 
     ###########################################################################
     # Menu actions.
@@ -146,20 +173,65 @@ class DeviceViewerTask(Task):
             svg_file = dialog.path
             logger.info(f"Selected SVG file: {svg_file}")
 
-            new_model = Electrodes()
-            new_model.set_electrodes_from_svg_file(svg_file)
-            logger.debug(f"Created electrodes from SVG file: {new_model.svg_model.filename}")
+            self.load_device(svg_file)
+
+    def cancel_device_loading(self):
+        """Cancel the device being loaded, keeping the device shown."""
+        self.device_loading_service.cancel()
+        self.device_loading = False
+        self._show_status("Device loading cancelled")
+
+    def normalize_svg_file(self):
+        """Write the current SVG file back with its electrode fills set to black, if any fill differs."""
+        if self.electrodes_model is None:
+            return
 
-            self.electrodes_model = new_model
-            logger.info(f"Electrodes model set to {new_model}")
+        svg_model = self.electrodes_model.svg_model
+        try:
+            if svg_model.normalize_file():
+                logger.info(f"Normalized SVG file: {svg_model.filename}")
+            else:
+                logger.info(f"SVG file already normalized: {svg_model.filename}")
+
+        except OSError as e:
+            logger.error(f"Could not normalize SVG file {svg_model.filename}: {e}")
+
+    ####### handlers for device loading service stages, called on the GUI thread ##########
+    def _on_device_load_progress(self, fraction, message):
+        self._show_status(f"{message} ({fraction:.0%})")
+
+    def _on_device_electrodes_loaded(self, new_model):
+        self.electrodes_model = new_model
+        logger.info(f"Electrodes model set to {new_model}")
+
+    def _on_device_connections_loaded(self, model):
+        self.window.central_pane.add_connections_from_model(model)
+        self.device_loading = False
+
+    def _on_device_load_failed(self, error):
+        self.device_loading = False
+        self._show_status(f"Could not load device: {error}")
+
+    def _show_status(self, message):
+        self.status_bar.messages = [message]
 
     ####### handlers for dramatiq listener topics ##########
     def _on_setup_success_triggered(self, message):
-        publish_message(topic=ELECTRODES_STATE_CHANGE, message=json.dumps(self.electrodes_model.channels_states_map))
+        # no device loaded yet
+        if self.electrodes_model is None:
+            return
+
+        publish_message(topic=ELECTRODES_STATE_CHANGE, message=self.electrodes_model.channels_states_bitset)
 
     ##########################################################
     # Public interface.
     ##########################################################
+    def load_device(self, svg_file):
+        """Load the device of svg_file in the background, replacing the device shown once its electrodes are parsed.
+        A device still loading is cancelled."""
+        self.device_loading = True
+        self.device_loading_service.load(svg_file)
+
     def show_help(self):
         """Show the help dialog."""
         logger.info("Showing help dialog.")
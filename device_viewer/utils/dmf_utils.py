@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
+import os
 import re
+import string
 import numpy as np
 import xml.etree.ElementTree as ET
 
 from pathlib import Path
 from typing import Union, TypedDict
+import shapely
 from shapely.geometry import Polygon
-from nptyping import NDArray, Float, Shape
+from nptyping import NDArray, Float, Int, Shape
+
+from microdrop_utils._logger import get_logger
+from .parsed_device_cache import ParsedDeviceCache
+
+logger = get_logger(__name__)
 
 
 class ElectrodeDict(TypedDict):
@@ -21,10 +29,19 @@ class SvgUtil:
                                r"(?P<y_command>[V])\s+(?P<vy>{0})\s*|"
                                r"(?P<command>[Z])"
                                .format(float_pattern))
+    # numbers taken by each path command, the separator ending each path parsed together taking none
+    path_command_arity = {"M": 2, "L": 2, "H": 1, "V": 1, "Z": 0,
+                          "m": 2, "l": 2, "h": 1, "v": 1, "z": 0,
+                          ";": 0}
+    path_separator = ";"
+    # the commands and the commas separating coordinates, as spaces around the numbers
+    path_number_separators = str.maketrans({character: " " for character in "".join(path_command_arity) + ","})
     style_pattern = re.compile(r"fill:#[0-9a-fA-F]{6}")
 
-    def __init__(self, filename: Union[str, Path] = None):
+    def __init__(self, filename: Union[str, Path] = None, cache: ParsedDeviceCache = None):
         self._filename = filename
+        self.cache = cache
+        self._cache_key = None
         self.max_x = None
         self.max_y = None
         self.min_x = None
@@ -50,7 +67,29 @@ class SvgUtil:
         self._filename = filename
         self.get_device_paths(self._filename)
 
-    def get_device_paths(self, filename, modify=True):
+    def get_device_paths(self, filename, modify=False, find_connections=True):
+        """
+        Parses the device file. The file is only read: fills are normalized in memory
+
+        :param filename: The device file
+        :param modify: If True, the file is normalized on disk first, see normalize_file
+        :param find_connections: If False, the neighbours and connections of the electrodes are left for
+            find_connections to find, unless they were loaded from the cache along with the electrodes
+        """
+        self._filename = filename
+
+        if modify:
+            self.normalize_file(filename)
+
+        cache_key = self.cache.key(filename) if self.cache is not None else None
+        self._cache_key = None
+        if cache_key is not None:
+            cached_arrays = self.cache.load(cache_key)
+            if cached_arrays is not None:
+                self.from_cache_arrays(cached_arrays)
+                logger.debug(f"Loaded parsed device {filename} from cache")
+                return
+
         tree = ET.parse(filename)
         root = tree.getroot()
 
@@ -64,12 +103,120 @@ class SvgUtil:
                 pass
                 # self.connections = self.svg_to_points(child)
 
+        # stored in the cache once the connections are found
+        self._cache_key = cache_key
+
+        if find_connections:
+            self.find_connections()
+
+    def find_connections(self) -> None:
+        """
+        Finds the neighbours and connections of the electrodes, if not found yet, then caches the parsed device
+        """
         if len(self.connections) == 0 and len(self.electrodes) > 0:
             self.neighbours = self.find_neighbours_all()
             self.neighbours_to_points()
 
-        if modify:
-            tree.write(filename)
+        if self._cache_key is not None:
+            self.cache.store(self._cache_key, self.to_cache_arrays())
+            self._cache_key = None
+
+    def normalize_file(self, filename: Union[str, Path] = None) -> bool:
+        """
+        Sets the fill of the device electrodes to black in the file itself
+
+        The file is only written if a fill changed, by replacing it with the normalized file written next to it.
+
+        :param filename: The device file, the file of this device if None
+        :return: True if the file was written
+        """
+        filename = filename or self._filename
+        tree = ET.parse(filename)
+
+        changed = False
+        for child in tree.getroot():
+            if "Device" in child.attrib.values():
+                changed = self.set_fill_black(child) or changed
+
+        if not changed:
+            logger.debug(f"Device file {filename} already normalized")
+            return False
+
+        normalized_filename = f"{filename}.normalized"
+        try:
+            tree.write(normalized_filename)
+            os.replace(normalized_filename, filename)
+        except OSError:
+            if os.path.exists(normalized_filename):
+                os.remove(normalized_filename)
+            raise
+
+        logger.info(f"Normalized device file {filename}")
+        return True
+
+    def to_cache_arrays(self) -> dict[str, np.ndarray]:
+        """
+        The parsed device as flat arrays, for the parsed device cache
+
+        The electrode and roi paths are concatenated, along with the offsets of each path, the neighbours are stored
+        as compressed sparse rows of electrode indices, and the connections as electrode index pairs with their
+        coordinates.
+        """
+        electrode_ids = list(self.electrodes)
+        electrode_indices = {electrode_id: i for i, electrode_id in enumerate(electrode_ids)}
+        electrode_paths = [electrode['path'] for electrode in self.electrodes.values()]
+        roi_paths = [path.reshape(-1, 2) for path in self.roi]
+
+        neighbours = [[electrode_indices[n] for n in self.neighbours.get(k, [])] for k in electrode_ids]
+        connections = self.connections if isinstance(self.connections, dict) else {}
+
+        return {
+            'electrode_ids': np.array(electrode_ids, dtype=str),
+            'channels': np.array([-1 if electrode['channel'] is None else electrode['channel']
+                                  for electrode in self.electrodes.values()], dtype=int),
+            'points': np.concatenate(electrode_paths) if electrode_paths else np.empty((0, 2)),
+            'offsets': np.cumsum([0] + [len(path) for path in electrode_paths]),
+            'roi_points': np.concatenate(roi_paths) if roi_paths else np.empty((0, 2)),
+            'roi_offsets': np.cumsum([0] + [len(path) for path in roi_paths]),
+            'bounds': np.array([np.nan if bound is None else bound
+                                for bound in (self.max_x, self.max_y, self.min_x, self.min_y)], dtype=float),
+            'neighbours_indptr': np.cumsum([0] + [len(n) for n in neighbours]),
+            'neighbours_indices': np.array([j for n in neighbours for j in n], dtype=int),
+            'connection_pairs': np.array([[electrode_indices[k], electrode_indices[n]] for k, n in connections],
+                                         dtype=int).reshape(-1, 2),
+            'connection_points': np.array([np.stack(points) for points in connections.values()],
+                                          dtype=float).reshape(-1, 2, 2),
+        }
+
+    def from_cache_arrays(self, arrays: dict[str, np.ndarray]) -> None:
+        """
+        Sets the parsed device from the arrays of to_cache_arrays
+        """
+        electrode_ids = arrays['electrode_ids'].tolist()
+        points, offsets = arrays['points'], arrays['offsets'].tolist()
+        roi_points, roi_offsets = arrays['roi_points'], arrays['roi_offsets'].tolist()
+
+        self.electrodes = {electrode_id: {'channel': None if channel < 0 else channel, 'path': points[start:end]}
+                           for electrode_id, channel, start, end in zip(electrode_ids, arrays['channels'].tolist(),
+                                                                        offsets[:-1], offsets[1:])}
+        self.roi = [roi_points[start:end].reshape((-1, 1, 2)) for start, end in zip(roi_offsets[:-1],
+                                                                                     roi_offsets[1:])]
+
+        self.max_x, self.max_y, self.min_x, self.min_y = [None if np.isnan(bound) else bound
+                                                          for bound in arrays['bounds']]
+
+        indptr = arrays['neighbours_indptr'].tolist()
+        neighbour_ids = [electrode_ids[j] for j in arrays['neighbours_indices'].tolist()]
+        self.neighbours = {electrode_id: neighbour_ids[start:end]
+                           for electrode_id, start, end in zip(electrode_ids, indptr[:-1], indptr[1:]) if end > start}
+
+        if len(electrode_ids) > 0:
+            connection_points = arrays['connection_points']
+            self.connections = {(electrode_ids[i], electrode_ids[j]): (first, second)
+                                for (i, j), first, second in zip(arrays['connection_pairs'].tolist(),
+                                                                 connection_points[:, 0], connection_points[:, 1])}
+        else:
+            self.connections = []
 
     def get_electrode_center(self, electrode: str) -> NDArray[Shape['*, 1, 1'], Float]:
         """
@@ -96,26 +243,38 @@ class SvgUtil:
     def find_neighbours_all(self, threshold: [float, None] = None) -> dict[str, list[str]]:
         """
         Find the neighbours of all paths
+
+        Without a threshold, the electrodes are neighbours if their polygons, dilated by the average distance between
+        the closest electrodes, overlap by at least that distance. The polygons are indexed in an STRtree, so that
+        each electrode is only measured against the electrodes near it, and each pair only once.
         """
         # if threshold is None then try to calculate it by finding the closest two electrodes centers
         if threshold is None:
-            # Dilate the polygons
-            polygons = self.get_electrode_polygons()
-            distances = sorted([v1.buffer(-0.1).distance(v2.buffer(-0.1)) for k1, v1 in polygons.items()
-                                for k2, v2 in polygons.items() if k1 != k2])
-            average_distance = np.mean(distances[:len(self.electrodes)])
+            electrode_ids = list(self.electrodes)
+            polygons = np.array(list(self.get_electrode_polygons().values()), dtype=object)
+
+            average_distance = self._average_closest_distance(shapely.buffer(polygons, -0.1))
 
             # Dilate the polygons by the average distance
-            polygons = {k: v.buffer(average_distance) for k, v in polygons.items()}
+            polygons = shapely.buffer(polygons, average_distance)
 
-            # Find the intersecting polygons
-            neighbours = {}
-            for k1, v1 in polygons.items():
-                for k2, v2 in polygons.items():
-                    if k1 != k2:
-                        intersection = v1.intersection(v2)
-                        if intersection.area >= average_distance:
-                            neighbours.setdefault(k1, []).append(k2)
+            # Find the intersecting polygons. Polygons not intersecting have no overlap, which is only enough for
+            # electrodes to be neighbours if the average distance is not positive.
+            if average_distance > 0:
+                first, second = self._unique_pairs(shapely.STRtree(polygons).query(polygons, predicate="intersects"))
+            else:
+                first, second = np.triu_indices(len(polygons), k=1)
+
+            overlaps = shapely.area(shapely.intersection(polygons[first], polygons[second]))
+            neighbouring = overlaps >= average_distance
+
+            neighbour_indices = [[] for _ in electrode_ids]
+            for i, j in zip(first[neighbouring], second[neighbouring]):
+                neighbour_indices[i].append(j)
+                neighbour_indices[j].append(i)
+
+            neighbours = {electrode_ids[i]: [electrode_ids[j] for j in sorted(indices)]
+                          for i, indices in enumerate(neighbour_indices) if indices}
         else:
             neighbours = {}
             for k, v in self.electrodes.items():
@@ -124,30 +283,76 @@ class SvgUtil:
                 neighbours[k].remove(k)
         return neighbours
 
+    @staticmethod
+    def _unique_pairs(pairs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Keep each pair of distinct indices of an STRtree query result once, as (first, second) with first < second
+        """
+        first, second = pairs
+        unique = first < second
+        return first[unique], second[unique]
+
+    def _average_closest_distance(self, polygons: np.ndarray) -> float:
+        """
+        Average of the len(electrodes) smallest distances between the polygons, counting each pair both ways.
+
+        Only pairs within a search distance of each other are measured. It starts at a fraction of the median
+        electrode size and doubles until enough pairs are found well within it, so that no closer pair can be left out.
+        """
+        count = len(self.electrodes)
+        if len(polygons) < 2:
+            return np.mean([])
+
+        tree = shapely.STRtree(polygons)
+        bounds = shapely.bounds(polygons)
+        search_distance = max(np.median(bounds[:, 2:] - bounds[:, :2]) * 0.1, 1e-6)
+
+        while True:
+            first, second = self._unique_pairs(tree.query(polygons, predicate="dwithin", distance=search_distance))
+            distances = shapely.distance(polygons[first], polygons[second])
+
+            # each pair counts both ways
+            if 2 * np.count_nonzero(distances < search_distance * 0.5) >= count or \
+                    2 * len(first) == len(polygons) * (len(polygons) - 1):
+                break
+
+            search_distance *= 2
+
+        return np.mean(np.sort(np.repeat(distances, 2))[:count])
+
     def neighbours_to_points(self):
-        # Dictionary to store electrode connections
-        self.connections = {}
+        # Dictionary to store electrode connections, only set once complete as it may be read from another thread
+        connections = {}
 
         for k, v in self.neighbours.items():
             for n in v:
-                if (n, k) not in self.connections and (k, n) not in self.connections:
+                if (n, k) not in connections and (k, n) not in connections:
                     coord_k = self.get_electrode_center(k)
                     coord_n = self.get_electrode_center(n)
 
                     # Store electrode pair (sorted for uniqueness) and their coordinates
-                    self.connections[(k, n)] = (coord_k, coord_n)
+                    connections[(k, n)] = (coord_k, coord_n)
+
+        self.connections = connections
 
     @staticmethod
-    def set_fill_black(obj: ET.Element) -> None:
+    def set_fill_black(obj: ET.Element) -> bool:
         """
         Sets the fill of the svg paths to black in place
         :param obj: The svg element
+        :return: True if a fill changed
         """
+        changed = False
         for element in obj:
             try:
-                element.attrib['style'] = re.sub(SvgUtil.style_pattern, r"fill:#000000", element.attrib['style'])
+                style = re.sub(SvgUtil.style_pattern, r"fill:#000000", element.attrib['style'])
             except KeyError:
-                pass
+                continue
+
+            changed = changed or style != element.attrib['style']
+            element.attrib['style'] = style
+
+        return changed
 
     def svg_to_points(self, obj) -> list[NDArray[Shape['*, 1, 1'], Float]]:
         """
@@ -163,37 +368,179 @@ class SvgUtil:
 
         return paths
 
+    @classmethod
+    def parse_paths(cls, path_data: list[str]) -> tuple[NDArray[Shape['*, 2'], Float], NDArray[Shape['*'], Int]]:
+        """
+        Parses the d attributes of paths all at once, into one flat array of their points
+
+        The move, line, horizontal and vertical line commands are supported, absolute or relative. As in SVG, a
+        command followed by several sets of coordinates is repeated for each, the coordinate pairs after a move being
+        lines, and a close path moves back to the start of its subpath. The points of the paths with absolute commands
+        only are worked out with array operations, those of the other paths command by command.
+
+        :param path_data: The d attributes of the paths
+        :return: The (n, 2) array of the points of all the paths, and the offsets of the points of each path in it,
+            path i being points[offsets[i]:offsets[i + 1]]
+        :raises ValueError: If a path has another command, or not as many numbers as its commands take
+        """
+        text = cls.path_separator.join(path_data) + cls.path_separator
+
+        # one byte per command, and all the numbers in one array
+        arity = np.full(256, -1, dtype=np.intp)
+        for command, count in cls.path_command_arity.items():
+            arity[ord(command)] = count
+
+        characters = np.frombuffer(text.encode(), dtype=np.uint8)
+
+        # letters other than the commands, and the exponents of numbers
+        is_other_letter = np.zeros(256, dtype=bool)
+        is_other_letter[np.frombuffer(string.ascii_letters.encode(), dtype=np.uint8)] = True
+        is_other_letter[arity >= 0] = False
+        is_other_letter[[ord("e"), ord("E")]] = False
+        other_letters = np.unique(characters[is_other_letter[characters]])
+        if len(other_letters):
+            supported_commands = "".join(cls.path_command_arity).replace(cls.path_separator, "")
+            raise ValueError(f"Unsupported path commands {', '.join(other_letters.tobytes().decode())}. Only the "
+                             f"{supported_commands} commands are supported")
+
+        is_command_character = arity[characters] >= 0
+        commands = characters[is_command_character]
+
+        try:
+            numbers = np.array(text.translate(cls.path_number_separators).split(), dtype=float)
+        except ValueError as e:
+            raise ValueError(f"Malformed path data: {e}") from None
+
+        # the command each number follows, from where the numbers start
+        is_separator = np.zeros(256, dtype=bool)
+        is_separator[np.frombuffer(b" \t\n\r\f\v,", dtype=np.uint8)] = True
+        is_separator[arity >= 0] = True
+        separators = is_separator[characters]
+        number_starts = np.flatnonzero(~separators & np.concatenate([[True], separators[:-1]]))
+        number_commands = np.cumsum(is_command_character)[number_starts] - 1
+
+        if len(number_starts) != len(numbers) or (number_commands < 0).any():
+            raise ValueError(f"Malformed path data: {len(numbers)} numbers, not all following a command")
+
+        # commands are repeated for every set of numbers they take after them
+        numbers_per_command = np.bincount(number_commands, minlength=len(commands))
+        command_arity = arity[commands]
+        repeats = np.maximum(numbers_per_command // np.maximum(command_arity, 1), 1)
+
+        malformed = np.flatnonzero(numbers_per_command != repeats * command_arity)
+        if len(malformed):
+            command = chr(commands[malformed[0]])
+            raise ValueError(f"Malformed path data: {numbers_per_command[malformed[0]]} numbers after command "
+                             f"{command}, which takes {command_arity[malformed[0]]} at a time")
+
+        if (repeats > 1).any():
+            first_repeats = np.cumsum(repeats) - repeats
+            commands = np.repeat(commands, repeats)
+
+            # the implicit commands after a move are lines
+            implicit_commands = np.arange(256, dtype=np.uint8)
+            implicit_commands[[ord("M"), ord("m")]] = [ord("L"), ord("l")]
+            is_implicit = np.ones(len(commands), dtype=bool)
+            is_implicit[first_repeats] = False
+            commands[is_implicit] = implicit_commands[commands[is_implicit]]
+
+            command_arity = arity[commands]
+
+        def is_command(letters):
+            return np.isin(commands, np.frombuffer(letters.encode("ascii"), dtype=np.uint8))
+
+        path_ends = commands == ord(cls.path_separator)
+        command_paths = np.cumsum(path_ends) - path_ends
+
+        # the x coordinate is carried over by vertical lines, the y coordinate by horizontal lines
+        first_number = np.cumsum(command_arity) - command_arity
+        coordinates = np.full((len(commands), 2), np.nan)
+        is_move = is_command("MLml")
+        coordinates[is_move] = numbers[first_number[is_move, np.newaxis] + [0, 1]]
+        is_horizontal = is_command("Hh")
+        coordinates[is_horizontal, 0] = numbers[first_number[is_horizontal]]
+        is_vertical = is_command("Vv")
+        coordinates[is_vertical, 1] = numbers[first_number[is_vertical]]
+
+        is_point = is_move | is_horizontal | is_vertical
+        has_relative = np.isin(command_paths, command_paths[is_command("mlhv")])
+
+        # absolute commands: carried over coordinates are the last ones given. A close path gives the start of its
+        # subpath, and paths start from the origin, given by the end of the previous path, or the last one for the
+        # first path.
+        coordinates[path_ends] = 0
+        is_close = is_command("Zz") & ~has_relative
+        is_start = is_command("M") | path_ends
+        last_start = np.maximum.accumulate(np.where(is_start, np.arange(len(commands)), -1))
+        coordinates[is_close] = coordinates[last_start[is_close]]
+
+        absolute = is_point & ~has_relative
+        for axis in range(2):
+            given = (is_point | is_close | path_ends) & ~np.isnan(coordinates[:, axis])
+            last_given = np.maximum.accumulate(np.where(given, np.arange(len(commands)), -1))
+            coordinates[absolute, axis] = coordinates[last_given[absolute], axis]
+
+        # relative commands: each point is relative to the current point
+        relative = np.flatnonzero(has_relative)
+        if len(relative):
+            coordinates[relative] = cls._resolve_relative_paths(commands[relative].tobytes().decode("ascii"),
+                                                                coordinates[relative].tolist())
+
+        points_per_path = np.bincount(command_paths[is_point], minlength=len(path_data))
+        offsets = np.concatenate([[0], np.cumsum(points_per_path)])
+
+        return coordinates[is_point], offsets
+
+    @classmethod
+    def _resolve_relative_paths(cls, commands: str, coordinates: list) -> list:
+        """
+        Works out the coordinates of the points of paths with relative commands, command by command
+        """
+        x = y = start_x = start_y = 0.0
+
+        for i, command in enumerate(commands):
+            given_x, given_y = coordinates[i]
+
+            if command == cls.path_separator:
+                x = y = start_x = start_y = 0.0
+                continue
+
+            if command in "Zz":
+                x, y = start_x, start_y
+                continue
+
+            if command in "MLHmlh":
+                x = x + given_x if command.islower() else given_x
+
+            if command in "MLVmlv":
+                y = y + given_y if command.islower() else given_y
+
+            if command in "Mm":
+                start_x, start_y = x, y
+
+            coordinates[i] = [x, y]
+
+        return coordinates
+
     def svg_to_paths(self, obj) -> list[NDArray[Shape['*, 1, 1'], Float]]:
         """
         Converts the svg file to paths
         """
 
-        paths = []
-        for path in obj:
-            path = path.attrib["d"]
-            moves = []
-            for match in self.path_commands.findall(path):
-                if ("M" in match) or ("L" in match):
-                    moves.append((float(match[1]), float(match[2])))
-                elif "H" in match:
-                    moves.append((float(match[4]), moves[-1][1]))
-                elif "V" in match:
-                    moves.append((moves[-1][0], (float(match[6]))))
-                elif "Z" in match:
-                    pass
-
-            paths.append(np.array(moves).reshape((-1, 1, 2)))
-
-        self.max_x = max([p[..., 0].max() for p in paths])
-        self.max_y = max([p[..., 1].max() for p in paths])
-        self.min_x = min([p[..., 0].min() for p in paths])
-        self.min_y = min([p[..., 1].min() for p in paths])
+        points, offsets = self.parse_paths([path.attrib["d"] for path in obj])
+
+        paths = [points[start:end].reshape((-1, 1, 2)) for start, end in zip(offsets[:-1], offsets[1:])]
+
+        self.max_x, self.max_y = points.max(axis=0)
+        self.min_x, self.min_y = points.min(axis=0)
 
         return paths
 
     def svg_to_electrodes(self, obj: ET.Element) -> dict[str, ElectrodeDict]:
         """
         Converts the svg file to paths
+
+        The paths of the electrodes are views on one array of all their points.
         """
 
         electrodes: dict[str, ElectrodeDict] = {}
@@ -206,29 +553,19 @@ class SvgUtil:
         except KeyError:
             transform = np.array([0, 0])
 
-        for element in list(obj):
-            path = element.attrib["d"]
-            moves = []
-            for match in self.path_commands.findall(path):
-                if ("M" in match) or ("L" in match):
-                    moves.append((float(match[1]), float(match[2])))
-                elif "H" in match:
-                    moves.append((float(match[4]), moves[-1][1]))
-                elif "V" in match:
-                    moves.append((moves[-1][0], (float(match[6]))))
-                elif "Z" in match:
-                    pass
+        elements = list(obj)
+        points, offsets = self.parse_paths([element.attrib["d"] for element in elements])
+        points = points + transform
 
+        for element, start, end in zip(elements, offsets[:-1], offsets[1:]):
             try:
-                electrodes[element.attrib['id']] = {'channel': int(element.attrib['data-channels']),
-                                                    'path': (np.array(moves) + transform).reshape((-1, 2))}
+                channel = int(element.attrib['data-channels'])
             except KeyError:
-                electrodes[element.attrib['id']] = {'channel': None,
-                                                    'path': (np.array(moves) + transform).reshape((-1, 2))}
+                channel = None
+
+            electrodes[element.attrib['id']] = {'channel': channel, 'path': points[start:end]}
 
-        self.max_x = max([e['path'][..., 0].max() for e in electrodes.values()])
-        self.max_y = max([e['path'][..., 1].max() for e in electrodes.values()])
-        self.min_x = min([e['path'][..., 0].min() for e in electrodes.values()])
-        self.min_y = min([e['path'][..., 1].min() for e in electrodes.values()])
+        self.max_x, self.max_y = points.max(axis=0)
+        self.min_x, self.min_y = points.min(axis=0)
 
         return electrodes
@@ -0,0 +1,175 @@
+"""
+On disk cache of parsed device files.
+
+Opening a device parses its SVG file, and finds the neighbours and connections of its electrodes, which takes a while
+for large devices. The cache keeps the result as an uncompressed npz file of flat arrays, keyed by the hash of the
+device file contents, so that opening the same device again only loads arrays. Any change to the file gives it a new
+key, so that entries never go stale: they are evicted, least recently used first, once the cache grows past its
+maximum size.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+from traits.api import HasTraits, Str, Int
+
+from microdrop_utils._logger import get_logger
+
+logger = get_logger(__name__)
+
+# bumped whenever the parsing or the cached arrays change, for older entries to be missed
+CACHE_FORMAT_VERSION = 2
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+class ParsedDeviceCache(HasTraits):
+    """
+    Stores and loads the arrays of parsed device files, keyed by file contents.
+
+    Example:
+        >>> cache = ParsedDeviceCache(cache_dir=tempfile.mkdtemp())
+        >>> cache.store("key", {"points": np.zeros((4, 2))})
+        >>> cache.load("key")["points"].shape
+        (4, 2)
+        >>> cache.load("missing_key") is None
+        True
+    """
+
+    cache_dir = Str(str(Path.home() / ".microdrop_next_gen" / "device_cache"),
+                    desc="The directory the cache entries are stored in")
+
+    max_size_bytes = Int(256 * 1024 * 1024, desc="Size the entries are evicted down to, least recently used first")
+
+    hit_count = Int(desc="Number of entries loaded")
+
+    miss_count = Int(desc="Number of entries not found")
+
+    @classmethod
+    def shared(cls) -> "ParsedDeviceCache":
+        """
+        Returns the cache shared by the whole process.
+        """
+        global _shared_cache
+
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = cls()
+
+            return _shared_cache
+
+    @staticmethod
+    def key(filename) -> str:
+        """
+        Returns the cache key of a device file: the hash of its contents.
+        """
+        with open(filename, "rb") as f:
+            file_hash = hashlib.sha256(f.read())
+
+        return f"v{CACHE_FORMAT_VERSION}_{file_hash.hexdigest()}"
+
+    def load(self, key: str):
+        """
+        Returns the arrays stored under key, or None if there are none or they cannot be read.
+        """
+        entry = self._entry_path(key)
+
+        try:
+            with np.load(entry, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+
+        except FileNotFoundError:
+            self.miss_count += 1
+            return None
+
+        except Exception as e:
+            logger.warning(f"Discarding unreadable device cache entry {entry}: {e}")
+            self._remove(entry)
+            self.miss_count += 1
+            return None
+
+        # most recently used. The entry may have just been evicted by another process, its arrays are loaded anyway
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        self.hit_count += 1
+
+        return arrays
+
+    def store(self, key: str, arrays: dict):
+        """
+        Stores arrays under key, then evicts the least recently used entries past max_size_bytes.
+
+        Failing to write the cache is logged, not raised: the device is then parsed again on its next load.
+        """
+        temporary_file = None
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # written whole before being moved in place, for a partly written entry never to be loaded
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+                temporary_file = f.name
+                np.savez(f, **arrays)
+
+            os.replace(temporary_file, self._entry_path(key))
+            temporary_file = None
+
+        except OSError as e:
+            logger.warning(f"Could not write device cache entry {key} to {self.cache_dir}: {e}")
+            return
+
+        finally:
+            # failed writes leave no temporary file behind
+            if temporary_file is not None:
+                self._remove(temporary_file)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is no bigger than max_size_bytes.
+        """
+        entries = []
+        for entry in Path(self.cache_dir).glob("*.npz"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+
+            self._remove(entry)
+            total_size -= size
+            logger.debug(f"Evicted device cache entry {entry.name}")
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        for entry in Path(self.cache_dir).glob("*.npz"):
+            self._remove(entry)
+
+    ################################# Protected methods ######################################
+
+    def _entry_path(self, key: str) -> Path:
+        return Path(self.cache_dir) / f"{key}.npz"
+
+    @staticmethod
+    def _remove(entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
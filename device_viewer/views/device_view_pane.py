@@ -1,5 +1,10 @@
+# system imports
+from functools import partial
+from itertools import islice
+
 # enthought imports
-from traits.api import Instance
+from traits.api import Instance, Int
+from pyface.api import GUI
 from pyface.tasks.api import TaskPane
 from pyface.qt.QtGui import QGraphicsScene
 from pyface.qt.QtOpenGLWidgets import QOpenGLWidget
@@ -26,6 +31,9 @@ class DeviceViewerPane(TaskPane):
     view = Instance(AutoFitGraphicsView)
     current_electrode_layer = Instance(ElectrodeLayer, allow_none=True)
 
+    #: Number of labels or connection lines added to the scene per event loop iteration when streamed in
+    stream_batch_size = Int(200)
+
     # --------- Device View trait initializers -------------
     def _scene_default(self):
         return ElectrodeScene()
@@ -52,9 +60,52 @@ class DeviceViewerPane(TaskPane):
         self.control = self.view
         self.control.setParent(parent)
 
-    def set_view_from_model(self, new_model):
+    def set_view_from_model(self, new_model, progressive=False):
+        """
+        Replaces the electrode layer with the layer of new_model.
+
+        If progressive, only the electrode polygons are added at once. The electrode labels, and the connections
+        found so far, are then streamed in, see add_connections_from_model.
+        """
         self.remove_current_layer()
-        self.current_electrode_layer = ElectrodeLayer(new_model)
+        self.current_electrode_layer = ElectrodeLayer(new_model, details=not progressive)
         self.current_electrode_layer.add_all_items_to_scene(self.scene)
         self.scene.setSceneRect(self.scene.itemsBoundingRect())
-        self.view.fitInView(self.scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
\ No newline at end of file
+        self.view.fitInView(self.scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
+        if progressive:
+            layer = self.current_electrode_layer
+            self._stream_into_layer(layer, [electrode_view.add_label for electrode_view in
+                                            layer.electrode_views.values()])
+            self.add_connections_from_model(new_model)
+
+    def add_connections_from_model(self, model):
+        """
+        Streams in the connection lines of the connections of model not drawn yet, if model is the current one.
+        """
+        layer = self.current_electrode_layer
+        if layer is None or layer.svg is not model.svg_model or not isinstance(model.svg_model.connections, dict):
+            return
+
+        self._stream_into_layer(layer, [partial(self.scene.addItem, connection_item) for connection_item in
+                                        layer.create_connection_items()])
+
+    def _stream_into_layer(self, layer, steps):
+        """
+        Runs the steps adding items to the layer stream_batch_size at a time, one batch per event loop iteration, so
+        that the view stays responsive. The steps left are dropped once the layer is replaced.
+        """
+        steps = iter(steps)
+
+        def run_batch():
+            if layer is not self.current_electrode_layer:
+                return
+
+            batch = list(islice(steps, self.stream_batch_size))
+            for step in batch:
+                step()
+
+            if batch:
+                GUI.invoke_later(run_batch)
+
+        GUI.invoke_later(run_batch)
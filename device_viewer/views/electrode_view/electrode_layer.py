@@ -15,28 +15,46 @@ class ElectrodeLayer():
     - The view is responsible for updating the properties of all the electrode views contained in bulk.
     """
 
-    def __init__(self, electrodes):
+    def __init__(self, electrodes, details: bool = True):
+        """
+        :param electrodes: The electrodes model
+        :param details: If False, the electrode labels and the connections are left out, for the add_label method
+            of the electrode views and create_connection_items to add them later, e.g. while the connections of a
+            large device are still being found.
+        """
         # Create the connection and electrode items
+        self.connections = {}
         self.connection_items = []
         self.electrode_views = {}
 
-        svg = electrodes.svg_model
+        self.svg = electrodes.svg_model
 
         # # Scale to approx 360p resolution for display
-        modifier = max(640 / (svg.max_x - svg.min_x), 360 / (svg.max_y - svg.min_y))
+        self.modifier = max(640 / (self.svg.max_x - self.svg.min_x), 360 / (self.svg.max_y - self.svg.min_y))
 
         # Create the electrode views for each electrode from the electrodes model and add them to the group
         for electrode_id, electrode in electrodes.electrodes.items():
             self.electrode_views[electrode_id] = ElectrodeView(electrode_id, electrodes[electrode_id],
-                                                               modifier * electrode.path)
+                                                               self.modifier * electrode.path, label=details)
+
+        if details:
+            self.create_connection_items()
+
+    def create_connection_items(self) -> list:
+        """
+        Creates the connection items of the connections of the svg model not created yet.
 
-        # Create the connections between the electrodes
-        self.connections = {
+        :return: The connection items created
+        """
+        modifier = self.modifier
+        new_connections = {
             key: ((coord1[0] * modifier, coord1[1] * modifier), (coord2[0] * modifier, coord2[1] * modifier))
-            for key, (coord1, coord2) in svg.connections.items()
+            for key, (coord1, coord2) in self.svg.connections.items() if key not in self.connections
         }
+        self.connections.update(new_connections)
 
-        for key, (src, dst) in self.connections.items():
+        new_connection_items = []
+        for key, (src, dst) in new_connections.items():
 
             # Set up the color
             color = QColor(default_colors['connection'])
@@ -46,7 +64,11 @@ class ElectrodeLayer():
             connection_item = generate_connection_line(key, src, dst, color=color)
 
             # Store the generated connection item
-            self.connection_items.append(connection_item)
+            new_connection_items.append(connection_item)
+
+        self.connection_items.extend(new_connection_items)
+
+        return new_connection_items
 
     ################# add electrodes/connections from scene ############################################
     def add_electrodes_to_scene(self, parent_scene: 'QGraphicsScene'):
@@ -70,7 +92,9 @@ class ElectrodeLayer():
         Method to draw the connections between the electrodes in the layer
         """
         for el in self.connection_items:
-            parent_scene.removeItem(el)
+            # connection lines still being streamed in are not in the scene yet
+            if el.scene() is not None:
+                parent_scene.removeItem(el)
 
     ######################## catch all methods to add / remove all elements from scene ###################
     def add_all_items_to_scene(self, parent_scene: 'QGraphicsScene'):
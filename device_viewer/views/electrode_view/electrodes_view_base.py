@@ -45,9 +45,11 @@ class ElectrodeView(QGraphicsPathItem):
     the callbacks for the clicking has to be implemented by a controller for the view.
 
     - The view requires an electrode model to be passed to it.
+
+    - The text label can be left out at first, for add_label to add it later, e.g. to show large devices sooner.
     """
 
-    def __init__(self, id_: Str, electrode: Instance(Electrode), path_data: Array, parent=None):
+    def __init__(self, id_: Str, electrode: Instance(Electrode), path_data: Array, parent=None, label: bool = True):
         super().__init__(parent)
 
         self.state_map = {k: v for k, v in default_colors.items()}
@@ -82,13 +84,11 @@ class ElectrodeView(QGraphicsPathItem):
         self.setBrush(self.brush)
 
         # Text item
-        self.text_path = QGraphicsTextItem(parent=self)
-        self.text_color = QColor(Qt.white)
-        self.text_color.setAlphaF(self.alphas['text'])
-        self.text_path.setDefaultTextColor(self.text_color)
+        self.text_path = None
         self.path_extremes = [np.min(path_data[:, 0]), np.max(path_data[:, 0]),
                               np.min(path_data[:, 1]), np.max(path_data[:, 1])]
-        self._fit_text_in_path(str(self.electrode.channel), self.path_extremes)
+        if label:
+            self.add_label()
 
         # Make the electrode selectable and focusable
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
@@ -136,6 +136,19 @@ class ElectrodeView(QGraphicsPathItem):
     ##################################################################################
     # Public electrode view update methods
     ##################################################################################
+    def add_label(self):
+        """
+        Method to add the channel text label in the center of the electrode, if not added yet
+        """
+        if self.text_path is not None:
+            return
+
+        self.text_path = QGraphicsTextItem(parent=self)
+        self.text_color = QColor(Qt.white)
+        self.text_color.setAlphaF(self.alphas['text'])
+        self.text_path.setDefaultTextColor(self.text_color)
+        self._fit_text_in_path(str(self.electrode.channel), self.path_extremes)
+
     def update_color(self, state):
         """
         Method to update the color of the electrode based on the state
@@ -1,3 +1,5 @@
+from microdrop_utils.dramatiq_priority_lanes import CRITICAL, TELEMETRY
+
 # This module's package.
 PKG = '.'.join(__name__.split('.')[:-1])
 PKG_name = PKG.title().replace("_", " ")
@@ -5,6 +7,13 @@ PKG_name = PKG.title().replace("_", " ")
 # dropbot DB3-120 hardware id
 DROPBOT_DB3_120_HWID = 'VID:PID=16C0:0483'
 
+# Device monitoring: on Linux, the hardware ids are checked when a serial device matching the pattern appears in /dev.
+# Elsewhere, they are checked by polling the serial ports.
+DROPBOT_DEVICE_DIR = '/dev'
+DROPBOT_DEVICE_PATTERN = r'^tty(ACM|USB)\d+$'
+DEVICE_MONITORING_POLL_INTERVAL_S = 2
+DEVICE_MONITORING_JOB = f"{PKG}.device_monitoring"
+
 # Chip may have been inserted before connecting, so `chip-inserted`
 # event may have been missed.
 # Explicitly check if chip is inserted by reading **active low**
@@ -18,6 +27,12 @@ ACTOR_TOPIC_DICT = {
         "dropbot/signals/disconnected"
     ]}
 
+# Concurrency of the actor declared by this plugin: it owns the dropbot serial proxy, so its messages are handled one at
+# a time, in order, on its own queue
+ACTOR_CONCURRENCY_DICT = {
+    "dropbot_controller_listener": {"queue": "dropbot_hardware", "worker_threads": 1}
+}
+
 # Topics published by this plugin
 NO_DROPBOT_AVAILABLE = 'dropbot/signals/warnings/no_dropbot_available'
 NO_POWER = 'dropbot/signals/warnings/no_power'
@@ -40,4 +55,20 @@ RUN_ALL_TESTS = "dropbot/requests/run_all_tests"
 TEST_VOLTAGE = "dropbot/requests/test_voltage"
 TEST_ON_BOARD_FEEDBACK_CALIBRATION = "dropbot/requests/test_on_board_feedback_calibration"
 TEST_SHORTS = "dropbot/requests/test_shorts"
-TEST_CHANNELS = "dropbot/requests/test_channels"
\ No newline at end of file
+TEST_CHANNELS = "dropbot/requests/test_channels"
+
+# Safety topics: they travel on the critical priority lane, and are always delivered one by one
+CRITICAL_TOPICS = [HALTED, SHORTS_DETECTED, HALT, NO_POWER, NO_DROPBOT_AVAILABLE]
+
+# Priority lanes of the topics of this plugin. Other topics travel on the default control lane.
+TOPIC_PRIORITY_LANES_DICT = {
+    CRITICAL: CRITICAL_TOPICS,
+    TELEMETRY: [CAPACITANCE_UPDATED, SELF_TESTS_PROGRESS],
+}
+
+# Requests looking for a dropbot to connect to. They are only run while no dropbot is connected.
+CONNECTIVITY_CHANGING_REQUESTS = [START_DEVICE_MONITORING, RETRY_CONNECTION]
+
+# Routed topics for the handler methods of the dropbot controller services, named after the last topic segment
+REQUEST_TOPIC_PREFIX = "dropbot/requests/"
+SIGNAL_TOPIC_PREFIX = "dropbot/signals/"
\ No newline at end of file
@@ -1,23 +1,23 @@
-import json
-
 from dropbot import EVENT_CHANNELS_UPDATED, EVENT_SHORTS_DETECTED, EVENT_ENABLE
-from traits.api import Instance
+from traits.api import Instance, Dict, Str, Int, Any
 import dramatiq
 
 # unit handling
 from pint import UnitRegistry
 
-from microdrop_utils.dramatiq_controller_base import generate_class_method_dramatiq_listener_actor, invoke_class_method
+from microdrop_utils.dramatiq_controller_base import generate_class_method_dramatiq_listener_actor
 
 ureg = UnitRegistry()
 
-from .consts import (CHIP_INSERTED, CHIP_NOT_INSERTED, CAPACITANCE_UPDATED, HALTED, HALT, START_DEVICE_MONITORING,
-                     RETRY_CONNECTION, OUTPUT_ENABLE_PIN, SHORTS_DETECTED, PKG)
+from .consts import (CHIP_INSERTED, CHIP_NOT_INSERTED, CAPACITANCE_UPDATED, HALTED, HALT, OUTPUT_ENABLE_PIN,
+                     SHORTS_DETECTED, PKG)
+from .request_routes import RequestRoute, build_request_routes
 
 from .interfaces.i_dropbot_controller_base import IDropbotControllerBase
 
-from traits.api import HasTraits, provides, Bool
-from microdrop_utils.dramatiq_dropbot_serial_proxy import DramatiqDropbotSerialProxy, CONNECTED, DISCONNECTED
+from traits.api import HasTraits, provides, Bool, observe
+from microdrop_utils.dramatiq_dropbot_serial_proxy import DramatiqDropbotSerialProxy
+from microdrop_utils.hardware_command_executor import HardwareCommandExecutor
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
 
 from microdrop_utils._logger import get_logger
@@ -34,6 +34,11 @@ class DropbotControllerBase(HasTraits):
     proxy = Instance(DramatiqDropbotSerialProxy)
     dropbot_connection_active = Bool(False)
 
+    command_executor = Instance(HardwareCommandExecutor, desc="The executor owning the proxy: every call to the proxy "
+                                                              "is submitted to it, and run on its thread")
+
+    applied_channels_mask = Any(desc="Channel states last written to the proxy, None when unknown")
+
     ##########################################################
     # 'IDramatiqControllerBase' interface.
     ##########################################################
@@ -42,6 +47,12 @@ class DropbotControllerBase(HasTraits):
 
     listener_name = f"{PKG}_listener"
 
+    # routing table of the handlers offered by the mixin services this controller is assembled from
+    request_routes = Dict(Str, Instance(RequestRoute), desc="Full topics mapped to their route. Routes expose their "
+                                                            "invocation counts and durations")
+
+    unrouted_topic_counts = Dict(Str, Int, desc="Topics received with no route mapped to the number of messages")
+
     def listener_actor_routine(self, message, topic):
         """
         A Dramatiq actor that listens to messages.
@@ -54,60 +65,41 @@ class DropbotControllerBase(HasTraits):
 
         logger.info(f"DROPBOT BACKEND LISTENER: Received message: '{message}' from topic: '{topic}'")
 
-        # find the topics hierarchy: first element is the head topic. Last element is the specific topic
-        topics_tree = topic.split("/")
-        head_topic = topics_tree[0]
-        primary_sub_topic = topics_tree[1]
-        specific_sub_topic = topics_tree[-1]
-
-        # set requested method to None for now
-        requested_method = None
-
-        # Determine the requested method to call based on the topic, if it is a dropbot request or signal topic
-        # for external dropbot signals connected/disconnected, we handle them everytime. For requests,
-        # we need to check if we have a dropbot available or not. Unless it is a request to start looking for a
-        # device or disconnect the device.
-
-        # 1. Check if it is a dropbot related topic
-        if head_topic == 'dropbot':
-
-            # 2. Handle the connected / disconnected signals
-            if topic in [CONNECTED, DISCONNECTED]:
-                requested_method = f"on_{specific_sub_topic}_signal"
-
-            # 3. Handle specific dropbot requests that would change dropbot connectivity
-            ## 3.1. Request to activate dropbot connection
-            elif topic in [START_DEVICE_MONITORING, RETRY_CONNECTION]:
-                if self.dropbot_connection_active:
-                    logger.warning(
-                        "Redundant request to start device monitoring denied: Dropbot is already connected."
-                        "Publishing message to UI about dropbot chip insertion status.")
-                    if not self.proxy.digital_read(OUTPUT_ENABLE_PIN):
-                        publish_message(topic=CHIP_INSERTED, message='Chip inserted')
-                    else:
-                        publish_message(topic=CHIP_NOT_INSERTED, message='Chip not inserted')
-
-                else:
-                    requested_method = f"on_{specific_sub_topic}_request"
-                    logger.info(f"Executing {specific_sub_topic} method as Dropbot is currently disconnected.")
-
-            # 4. Handle all other requests
-            elif primary_sub_topic == 'requests':
-                if self.dropbot_connection_active:
-                    requested_method = f"on_{specific_sub_topic}_request"
-                else:
-                    logger.warning(f"Request for {specific_sub_topic} denied: Dropbot is disconnected.")
+        route = self.request_routes.get(topic)
+
+        if route is None:
+            self.unrouted_topic_counts[topic] = self.unrouted_topic_counts.get(topic, 0) + 1
+            return
+
+        # Requests to look for a dropbot are only run while disconnected. Other requests need a dropbot connected,
+        # while the connected / disconnected signals are handled every time.
+        if route.changes_connectivity and self.dropbot_connection_active:
+            logger.warning(
+                "Redundant request to start device monitoring denied: Dropbot is already connected."
+                "Publishing message to UI about dropbot chip insertion status.")
+            if not self.command_executor.call("read_output_enable_pin",
+                                              lambda proxy: proxy.digital_read(OUTPUT_ENABLE_PIN)):
+                publish_message(topic=CHIP_INSERTED, message='Chip inserted')
+            else:
+                publish_message(topic=CHIP_NOT_INSERTED, message='Chip not inserted')
+
+        elif route.requires_connection and not self.dropbot_connection_active:
+            logger.warning(f"Request for {topic} denied: Dropbot is disconnected.")
 
         else:
-            logger.info(f"Ignored request from topic '{topic}': Not a Dropbot-related request.")
+            if route.changes_connectivity:
+                logger.info(f"Executing {topic} method as Dropbot is currently disconnected.")
 
-        if requested_method:
-            err_msg = invoke_class_method(self, requested_method, message)
+            route.invoke(message)
 
-            if err_msg:
-                logger.error(
-                    f" {self.listener_name}; Received message: {message} from topic: {topic} Failed to execute due to "
-                    f"error: {err_msg}")
+    def get_route_stats(self) -> dict:
+        """
+        Returns the invocation count, total and mean duration in seconds of every route, keyed by topic.
+        """
+        return {topic: {"count": route.invocation_count,
+                        "total_duration": route.total_duration,
+                        "mean_duration": route.mean_duration}
+                for topic, route in self.request_routes.items()}
 
     def traits_init(self):
         """
@@ -122,11 +114,23 @@ class DropbotControllerBase(HasTraits):
 
         """
 
+        self.command_executor = HardwareCommandExecutor(name="dropbot_command_executor", proxy=self.proxy)
+        self.command_executor.start()
+
+        # built once, from the handlers of every mixin service the controller class was assembled from
+        self.request_routes = build_request_routes(self)
+        logger.debug(f"Dropbot controller routes: {list(self.request_routes)}")
+
         logger.info("Starting DropbotController listener")
         self.dramatiq_listener_actor = generate_class_method_dramatiq_listener_actor(
             listener_name=self.listener_name,
             class_method=self.listener_actor_routine)
 
+    @observe("proxy")
+    def _hand_proxy_to_command_executor(self, event):
+        if self.command_executor is not None:
+            self.command_executor.proxy = event.new
+
     ######################################################################
     # Proxy signal handlers
     #######################################################################
@@ -135,7 +139,7 @@ class DropbotControllerBase(HasTraits):
 
     def _on_dropbot_proxy_connected(self):
         # do initial check on if chip inserted or not
-        if self.proxy.digital_read(OUTPUT_ENABLE_PIN):
+        if self.command_executor.call("read_output_enable_pin", lambda proxy: proxy.digital_read(OUTPUT_ENABLE_PIN)):
             logger.info("Publishing Chip Not Inserted")
             publish_message(topic=CHIP_NOT_INSERTED, message='Chip not inserted')
         else:
@@ -149,22 +153,26 @@ class DropbotControllerBase(HasTraits):
         self.proxy.signals.signal('capacitance-updated').connect(self._capacitance_updated_wrapper)
         self.proxy.signals.signal('shorts-detected').connect(self._shorts_detected_wrapper)
 
+        self.command_executor.call("setup_initial_state", self._setup_initial_proxy_state)
+
+    def _setup_initial_proxy_state(self, proxy):
         # Initial Proxy State Update
-        self.proxy.update_state(capacitance_update_interval_ms=250,
-                                event_mask=EVENT_CHANNELS_UPDATED |
-                                           EVENT_SHORTS_DETECTED |
-                                           EVENT_ENABLE)
+        proxy.update_state(capacitance_update_interval_ms=250,
+                           event_mask=EVENT_CHANNELS_UPDATED |
+                                      EVENT_SHORTS_DETECTED |
+                                      EVENT_ENABLE)
         # If the feedback capacitor is < 300nF, disable the chip load
         # saturation check to prevent false positive triggers.
-        if self.proxy.config.C16 < 0.3e-6:
-            self.proxy.update_state(chip_load_range_margin=-1)
+        if proxy.config.C16 < 0.3e-6:
+            proxy.update_state(chip_load_range_margin=-1)
 
-        self.proxy.update_state(hv_output_selected=True,
-                                hv_output_enabled=True,
-                                voltage=75,
-                                )
+        proxy.update_state(hv_output_selected=True,
+                           hv_output_enabled=True,
+                           voltage=75,
+                           )
 
-        self.proxy.turn_off_all_channels()
+        proxy.turn_off_all_channels()
+        self.applied_channels_mask = None
 
     @staticmethod
     def _capacitance_updated_wrapper(signal: dict[str, str]):
@@ -173,13 +181,13 @@ class DropbotControllerBase(HasTraits):
         voltage = float(signal.get('V_a', 0.0)) * ureg.volt
         voltage_formatted = f"{voltage:.3g~P}"
         publish_message(topic=CAPACITANCE_UPDATED,
-                        message=json.dumps({'capacitance': capacitance_formatted, 'voltage': voltage_formatted}))
+                        message={'capacitance': capacitance_formatted, 'voltage': voltage_formatted})
 
     @staticmethod
     def _shorts_detected_wrapper(signal: dict[str, str]):
         shorts_list = signal.get('values')
         shorts_dict = {'Shorts_detected': shorts_list}
-        publish_message(topic=SHORTS_DETECTED, message=json.dumps(shorts_dict))
+        publish_message(topic=SHORTS_DETECTED, message=shorts_dict)
 
     @staticmethod
     def _halted_event_wrapper(signal):
@@ -1,5 +1,6 @@
-from traits.api import Instance, Bool
+from traits.api import Instance, Bool, Any
 from microdrop_utils.dramatiq_dropbot_serial_proxy import DramatiqDropbotSerialProxy
+from microdrop_utils.hardware_command_executor import HardwareCommandExecutor
 from microdrop_utils.i_dramatiq_controller_base import IDramatiqControllerBase
 
 
@@ -10,6 +11,11 @@ class IDropbotControllerBase(IDramatiqControllerBase):
     """
 
     proxy = Instance(DramatiqDropbotSerialProxy, desc="The DramatiqDropbotSerialProxy object")
+    command_executor = Instance(HardwareCommandExecutor,
+                                desc="The executor owning the proxy. Calls to the proxy are submitted to it as "
+                                     "commands, so that they are all run on its thread, one at a time")
+    applied_channels_mask = Any(desc="Boolean mask of the channel states last written to the proxy, None when "
+                                     "unknown, e.g. after the channels were turned off by a halt")
     dropbot_connection_active = Bool(
         desc="Specifies if the controller is actively listening to commands or not. So if the dropbot "
              "connection is not there, no commands will be processed except searching for a dropbot "
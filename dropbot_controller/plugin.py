@@ -6,13 +6,13 @@ from traits.api import List
 # local package imports
 from .dropbot_controller_base import DropbotControllerBase
 from .interfaces.i_dropbot_control_mixin_service import IDropbotControlMixinService
-from .consts import ACTOR_TOPIC_DICT, PKG, PKG_name
+from .consts import ACTOR_TOPIC_DICT, ACTOR_CONCURRENCY_DICT, TOPIC_PRIORITY_LANES_DICT, CRITICAL_TOPICS, PKG, PKG_name
 from .services.dropbot_monitor_mixin_service import DropbotMonitorMixinService
 from .services.dropbot_states_setting_mixin_service import DropbotStatesSettingMixinService
 from .services.dropbot_self_tests_mixin_service import DropbotSelfTestsMixinService
 
 # microdrop imports
-from message_router.consts import ACTOR_TOPIC_ROUTES
+from message_router.consts import ACTOR_TOPIC_ROUTES, ACTOR_CONCURRENCY, TOPIC_PRIORITY_LANES, NEVER_CONFLATE_TOPICS
 from microdrop_utils._logger import get_logger
 # Initialize logger
 logger = get_logger(__name__)
@@ -28,6 +28,13 @@ class DropbotControllerPlugin(Plugin):
     # This plugin contributes some actors that can be called using certain routing keys.
     actor_topic_routing = List([ACTOR_TOPIC_DICT], contributes_to=ACTOR_TOPIC_ROUTES)
 
+    # This plugin's actor drives the hardware: it gets a dedicated queue with a single worker thread.
+    actor_concurrency = List([ACTOR_CONCURRENCY_DICT], contributes_to=ACTOR_CONCURRENCY)
+
+    # Safety topics of this plugin are urgent, and never conflated. Telemetry travels on its own lane.
+    topic_priority_lanes = List([TOPIC_PRIORITY_LANES_DICT], contributes_to=TOPIC_PRIORITY_LANES)
+    never_conflate_topics = List([CRITICAL_TOPICS], contributes_to=NEVER_CONFLATE_TOPICS)
+
     def _service_offers_default(self):
         """Return the service offers."""
         return [
@@ -62,3 +69,7 @@ class DropbotControllerPlugin(Plugin):
         logger.debug(f"The following dropbot services are going to be initialized: {services} ")
 
         self.dropbot_controller = type('DropbotController', tuple(services), {})()
+
+    def stop(self):
+        """ Stop running commands on the dropbot on plugin stop """
+        self.dropbot_controller.command_executor.stop()
@@ -0,0 +1,86 @@
+import time
+
+from traits.api import HasTraits, Str, Bool, Callable, Int, Float, Property
+
+from microdrop_utils._logger import get_logger
+from microdrop_utils.dramatiq_controller_base import find_handler_methods
+
+from .consts import CONNECTIVITY_CHANGING_REQUESTS, REQUEST_TOPIC_PREFIX, SIGNAL_TOPIC_PREFIX
+
+logger = get_logger(__name__)
+
+
+class RequestRoute(HasTraits):
+    """
+    A route from a topic to a dropbot controller handler, with the connection state it needs to be run in, and its
+    invocation stats.
+
+    Example:
+        >>> route = RequestRoute(topic="dropbot/requests/set_voltage", handler=print, requires_connection=True)
+        >>> route.invoke("75")
+        75
+        >>> route.invocation_count
+        1
+    """
+
+    topic = Str(desc="The full topic routed")
+
+    handler = Callable(desc="The bound handler method called with the message")
+
+    requires_connection = Bool(False, desc="True if the route is only run while a dropbot is connected")
+
+    changes_connectivity = Bool(False, desc="True if the route looks for a dropbot to connect to, in which case it "
+                                            "is only run while no dropbot is connected")
+
+    invocation_count = Int(desc="Number of times the handler was called")
+
+    total_duration = Float(desc="Total time spent in the handler, in seconds")
+
+    mean_duration = Property(Float, observe="invocation_count, total_duration",
+                             desc="Mean time spent in the handler, in seconds")
+
+    def _get_mean_duration(self):
+        if not self.invocation_count:
+            return 0.0
+
+        return self.total_duration / self.invocation_count
+
+    def invoke(self, message):
+        """
+        Calls the handler with the message, logging any error it raises.
+        """
+        start = time.perf_counter()
+        try:
+            self.handler(message)
+
+        except Exception as e:
+            logger.error(f"Received message: {message} from topic: {self.topic} Failed to execute due to error: {e}",
+                         exc_info=True)
+
+        finally:
+            self.invocation_count += 1
+            self.total_duration += time.perf_counter() - start
+
+
+def build_request_routes(controller) -> dict:
+    """
+    Builds the routing table of a dropbot controller assembled from its mixin services, keyed by full topic.
+
+    Every on_<topic>_request method handles "dropbot/requests/<topic>", and needs an active connection unless it is
+    one of the connectivity changing requests. Every on_<topic>_signal method handles "dropbot/signals/<topic>" in any
+    connection state.
+    """
+    routes = {}
+
+    for name, handler in find_handler_methods(controller, "on_{topic}_request").items():
+        topic = REQUEST_TOPIC_PREFIX + name
+        changes_connectivity = topic in CONNECTIVITY_CHANGING_REQUESTS
+
+        routes[topic] = RequestRoute(topic=topic, handler=handler, requires_connection=not changes_connectivity,
+                                     changes_connectivity=changes_connectivity)
+
+    for name, handler in find_handler_methods(controller, "on_{topic}_signal").items():
+        topic = SIGNAL_TOPIC_PREFIX + name
+        routes[topic] = RequestRoute(topic=topic, handler=handler)
+
+    return routes
@@ -1,21 +1,20 @@
 import functools
-import json
 
 import dropbot
 from dropbot import EVENT_CHANNELS_UPDATED, EVENT_SHORTS_DETECTED, EVENT_ENABLE
-from traits.api import provides, HasTraits, Bool, Instance
-from apscheduler.events import EVENT_JOB_EXECUTED
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-
+from traits.api import provides, HasTraits, Bool, Any, List, Str
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
 from microdrop_utils._logger import get_logger
 from microdrop_utils.dramatiq_dropbot_serial_proxy import DramatiqDropbotSerialProxy, connection_flags
 from microdrop_utils.hardware_device_monitoring_helpers import check_devices_available
+from microdrop_utils.hardware_command_executor import HALT_PRIORITY
+from microdrop_utils.hotplug_watcher import DeviceHotplugWatcher
+from microdrop_utils.periodic_job_service import PeriodicJobService
 from ..interfaces.i_dropbot_control_mixin_service import IDropbotControlMixinService
 
 from ..consts import NO_DROPBOT_AVAILABLE, SHORTS_DETECTED, NO_POWER, DROPBOT_DB3_120_HWID, RETRY_CONNECTION, \
-    OUTPUT_ENABLE_PIN, CHIP_NOT_INSERTED, CHIP_INSERTED, DROPBOT_SETUP_SUCCESS
+    OUTPUT_ENABLE_PIN, CHIP_NOT_INSERTED, CHIP_INSERTED, DROPBOT_SETUP_SUCCESS, DROPBOT_DEVICE_DIR, \
+    DROPBOT_DEVICE_PATTERN, DEVICE_MONITORING_POLL_INTERVAL_S, DEVICE_MONITORING_JOB
 
 logger = get_logger(__name__)
 
@@ -29,47 +28,70 @@ class DropbotMonitorMixinService(HasTraits):
     id = "dropbot_monitor_mixin_service"
     name = 'Dropbot Monitor Mixin'
     realtime_mode = Bool(True)
-    monitor_scheduler = Instance(BackgroundScheduler,
-                                 desc="An AP scheduler job to periodically look for dropbot connected ports."
-                                 )
+    device_monitor = Any(desc="The DeviceHotplugWatcher checking for a dropbot when a serial device is plugged in, or "
+                              "where it is not supported, a PeriodicJob of the shared PeriodicJobService to "
+                              "periodically look for dropbot connected ports. Both are paused while a dropbot is "
+                              "connected.")
+    hwids_to_check = List(Str, desc="The hardware ids of the dropbots looked for")
 
     ######################################## Methods to Expose #############################################
     def on_start_device_monitoring_request(self, hwids_to_check):
         """
         Method to start looking for dropbots connected using their hwids.
         If dropbot already connected, publishes dropbot connected signal.
+
+        Requested again, monitoring resumes with the hwids given, rather than another monitor being started.
         """
         if not hwids_to_check:
             hwids_to_check = [DROPBOT_DB3_120_HWID]
 
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(
+        self.hwids_to_check = hwids_to_check
+
+        if isinstance(self.device_monitor, DeviceHotplugWatcher) and self.device_monitor.running:
+            self.device_monitor.resume()
+            return
+
+        if DeviceHotplugWatcher.is_supported():
+            watcher = DeviceHotplugWatcher(device_dir=DROPBOT_DEVICE_DIR, device_pattern=DROPBOT_DEVICE_PATTERN,
+                                           on_device_added=self._on_serial_device_added)
+
+            # set before starting, as the devices already plugged in are checked right away on the watcher thread
+            self.device_monitor = watcher
+            try:
+                watcher.start()
+
+            except OSError as e:
+                self.device_monitor = None
+                logger.warning(f"Cannot watch for devices plugged in, polling for a DropBot instead: {e}")
+
+            else:
+                logger.info("DropBot hotplug monitor created and started")
+                return
+
+        # replaces the job of any previous request
+        self.device_monitor = PeriodicJobService.shared().add_or_replace_job(
+            DEVICE_MONITORING_JOB,
             func=functools.partial(check_devices_available, hwids_to_check),
-            trigger=IntervalTrigger(seconds=2),
+            interval_s=DEVICE_MONITORING_POLL_INTERVAL_S,
+            on_result=self._on_dropbot_port_found,
         )
-        scheduler.add_listener(self._on_dropbot_port_found, EVENT_JOB_EXECUTED)
-        self.monitor_scheduler = scheduler
 
         logger.info("DropBot monitor created and started")
 
-        self.monitor_scheduler.start()
-
     def on_detect_shorts_request(self, message):
         if self.proxy is not None:
-            shorts_list = self.proxy.detect_shorts()
+            shorts_list = self.command_executor.call("detect_shorts", self._detect_shorts_proxy)
             shorts_dict = {'Shorts_detected': shorts_list}
             logger.info(f"Detected shorts: {shorts_dict}")
-            publish_message(topic=SHORTS_DETECTED, message=json.dumps(shorts_dict))
+            publish_message(topic=SHORTS_DETECTED, message=shorts_dict)
 
     def on_retry_connection_request(self, message):
         logger.info("Attempting to retry connecting with a dropbot")
-        self.monitor_scheduler.resume()
+        self.device_monitor.resume()
 
     def on_halt_request(self, message):
-        self.proxy.turn_off_all_channels()
-        self.proxy.update_state(hv_output_selected=False,
-                                hv_output_enabled=False,
-                                voltage=0)
+        # run before any other queued command, which are dropped as they would undo the halt
+        self.command_executor.call("halt", self._halt_proxy, priority=HALT_PRIORITY, preempt=True)
         logger.error("Halted DropBot: Disconnect everything and reconnect")
 
     ############################################################
@@ -84,22 +106,55 @@ class DropbotMonitorMixinService(HasTraits):
 
             if self.proxy is not None:
                 if self.proxy.monitor is not None:
-                    self.proxy.terminate()
+                    # commands still queued are dropped, there is no dropbot to run them on anymore
+                    self.command_executor.call("terminate", self._terminate_proxy, priority=HALT_PRIORITY,
+                                               preempt=True)
                     logger.info("Proxy terminated")
                     self.proxy.monitor = None
-                    self.monitor_scheduler.resume()
+                    self.device_monitor.resume()
                     logger.info("Sending Signal to Resumed DropBot monitor")
                     self.on_retry_connection_request(message="")
 
     ################################# Protected methods ######################################
-    def _on_dropbot_port_found(self, event):
+    def _halt_proxy(self, proxy):
+        proxy.turn_off_all_channels()
+        proxy.update_state(hv_output_selected=False,
+                           hv_output_enabled=False,
+                           voltage=0)
+        self.applied_channels_mask = None
+
+    def _terminate_proxy(self, proxy):
+        proxy.terminate()
+        self.applied_channels_mask = None
+
+    def _detect_shorts_proxy(self, proxy):
+        try:
+            return proxy.detect_shorts()
+        finally:
+            # detecting shorts drives the channels, leaving their states unknown
+            self.applied_channels_mask = None
+
+    def _on_serial_device_added(self, device_path):
+        """
+        Method checking for a dropbot when a serial device has been plugged in, or on a rescan.
         """
-        Method defining what to do when dropbot has been found on a port.
+        port_name = check_devices_available(self.hwids_to_check)
+
+        if not self.device_monitor.paused:
+            self._on_dropbot_port_found(port_name)
+
+    def _on_dropbot_port_found(self, port_name):
         """
+        Method defining what to do when dropbot has been found on a port. Called with the port name checked for by
+        the device monitor, None if no dropbot was found.
+        """
+        if port_name is None:
+            return
+
         logger.debug("DropBot port found")
-        self.monitor_scheduler.pause()
+        self.device_monitor.pause()
         logger.debug("Paused DropBot monitor")
-        self.port_name = str(event.retval)
+        self.port_name = str(port_name)
         logger.info('Attempting to connect to DropBot on port: %s', self.port_name)
         self._connect_to_dropbot(port_name=self.port_name)
 
@@ -1,8 +1,8 @@
-import json
+import functools
+import threading
 from pathlib import Path
 from functools import wraps
 import datetime as dt
-from tqdm import tqdm
 
 from dropbot.hardware_test import (ALL_TESTS, system_info, test_system_metrics,
                                    test_i2c, test_voltage, test_shorts,
@@ -14,6 +14,7 @@ from traits.api import provides, HasTraits
 
 from microdrop_utils._logger import get_logger
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
+from microdrop_utils.hardware_command_executor import BACKGROUND_PRIORITY
 from ..consts import SELF_TESTS_PROGRESS
 
 logger = get_logger(__name__)
@@ -35,55 +36,32 @@ def get_timestamped_results_path(test_name: str, path: [str, Path]):
     return path.joinpath(f'{test_name}_results-{timestamp}')
 
 
-def self_test(proxy, tests=None):
+def run_test(proxy, test_name: str, test_number: int, results: dict):
     """
-    .. versionadded:: 1.28
-
-    Perform quality control tests.
+    Runs one quality control test, publishing its progress, and adds its results to results.
 
     Parameters
     ----------
     proxy : dropbot.SerialProxy
         DropBot control board reference.
-    tests : list, optional
-        List of names of test functions to run.
-
-        By default, run all tests.
-
-    Returns
-    -------
-    dict
-        Results from all tests.
+    test_name : str
+        Name of the test function to run, one of dropbot.hardware_test.ALL_TESTS.
+    test_number : int
+        Index of the test among the tests run.
+    results : dict
+        Results of the tests run, keyed by test name.
     """
-    total_time = 0
-
-    if tests is None:
-        tests = ALL_TESTS
-    results = {}
-
-    publish_message(topic=SELF_TESTS_PROGRESS, message=json.dumps({"active_state": True}))
-
-    for i, test_name_i in enumerate(pbar := tqdm(tests)):
-        # description of test that will be processed
-        publish_message(topic=SELF_TESTS_PROGRESS, message=json.dumps({"current_message": test_name_i}))
-        pbar.set_description(test_name_i)
-
-        # do the job
-        test_func_i = eval(test_name_i)
-        results[test_name_i] = test_func_i(proxy)
+    # description of test that will be processed
+    publish_message(topic=SELF_TESTS_PROGRESS, message={"current_message": test_name})
 
-        # job done
-        publish_message(topic=SELF_TESTS_PROGRESS, message=json.dumps({"done_test_number": i}))
+    # do the job
+    test_func = eval(test_name)
+    results[test_name] = test_func(proxy)
 
-        duration_i = results[test_name_i]['duration']
-        logger.info('%s: %.1f s', test_name_i, duration_i)
-        total_time += duration_i
+    # job done
+    publish_message(topic=SELF_TESTS_PROGRESS, message={"done_test_number": test_number})
 
-    publish_message(topic=SELF_TESTS_PROGRESS, message=json.dumps({"active_state": False}))
-
-    logger.info('**Total time: %.1f s**', total_time)
-
-    return results
+    logger.info('%s: %.1f s', test_name, results[test_name]['duration'])
 
 
 @provides(IDropbotControlMixinService)
@@ -111,24 +89,68 @@ class DropbotSelfTestsMixinService(HasTraits):
             # set the report file name in the needed dir based on tests run
             report_path = f"{get_timestamped_results_path(test_name, report_generation_directory)}.html"
 
-            # the tests arg should be None for self test if all tests need to be run
             if test_name == "run_all_tests":
-                tests = None
+                tests = ALL_TESTS
             else:
                 tests = [test_name]
 
             logger.info(f"Running test {test_name}")
-            result = self_test(self.proxy, tests=tests)
-
-            logger.info(f"Report generating in the file {report_path}")
-            generate_report(result, report_path, force=True)
-            publish_message(topic=SELF_TESTS_PROGRESS, message=json.dumps({"report_path": report_path}))
+            self._submit_tests(tests, report_path)
 
             # do whatever else is defined in func
             func(self, report_generation_directory)
 
         return _execute_test
 
+    def _submit_tests(self, tests: list, report_path: str):
+        """
+        Queues each test as its own background command, without waiting for them, and generates the report once the
+        last one is done.
+
+        Tests can take minutes, so the listener thread is never blocked on them, and a halt request cancels the tests
+        not run yet: it only waits for the test running, which cannot be interrupted.
+        """
+        results = {}
+
+        publish_message(topic=SELF_TESTS_PROGRESS, message={"active_state": True})
+
+        commands = [self.command_executor.submit(f"self_test_{test_name}",
+                                                 functools.partial(self._run_test, test_name=test_name,
+                                                                   test_number=i, results=results),
+                                                 priority=BACKGROUND_PRIORITY)
+                    for i, test_name in enumerate(tests)]
+
+        commands[-1].add_done_callback(lambda command: self._on_tests_done(tests, results, report_path))
+
+    def _run_test(self, proxy, **kwargs):
+        try:
+            run_test(proxy, **kwargs)
+        finally:
+            # the tests drive the channels, leaving their states unknown
+            self.applied_channels_mask = None
+
+    @staticmethod
+    def _on_tests_done(tests: list, results: dict, report_path: str):
+        publish_message(topic=SELF_TESTS_PROGRESS, message={"active_state": False})
+
+        if len(results) < len(tests):
+            logger.warning(f"Self tests {[test for test in tests if test not in results]} were cancelled or failed")
+
+        if not results:
+            return
+
+        logger.info(f"Total time: {sum(result['duration'] for result in results.values()):.1f} s")
+
+        # off the executor thread, for the report not to hold up the commands queued after the tests
+        threading.Thread(target=DropbotSelfTestsMixinService._generate_report, args=(results, report_path),
+                         name="self_test_report", daemon=True).start()
+
+    @staticmethod
+    def _generate_report(results: dict, report_path: str):
+        logger.info(f"Report generating in the file {report_path}")
+        generate_report(results, report_path, force=True)
+        publish_message(topic=SELF_TESTS_PROGRESS, message={"report_path": report_path})
+
     ######################################## Methods to Expose #############################################
 
     @_execute_test_based_on_name
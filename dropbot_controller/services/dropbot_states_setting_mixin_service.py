@@ -23,12 +23,16 @@ class DropbotStatesSettingMixinService(HasTraits):
         Method to start looking for dropbots connected using their hwids.
         """
 
-        self.proxy.voltage = float(message)
+        voltage = float(message)
+        self.command_executor.submit("set_voltage", lambda proxy: setattr(proxy, "voltage", voltage),
+                                     register="voltage")
 
     def on_set_frequency_request(self, message):
         """
         Method to start looking for dropbots connected using their hwids.
         """
 
-        self.proxy.frequency = float(message)
+        frequency = float(message)
+        self.command_executor.submit("set_frequency", lambda proxy: setattr(proxy, "frequency", frequency),
+                                     register="frequency")
 
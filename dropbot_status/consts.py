@@ -7,6 +7,8 @@ current_folder_path = os.path.dirname(os.path.abspath(__file__))
 DROPBOT_IMAGE = os.path.join(current_folder_path, "images", "dropbot.png")
 DROPBOT_CHIP_INSERTED_IMAGE = os.path.join(current_folder_path, "images", 'dropbot-chip-inserted.png')
 
-# Topics actor declared by plugin subscribes to
+# Topics actor declared by plugin subscribes to. Capacitance readings are conflated: a busy status widget only gets
+# the latest one.
 ACTOR_TOPIC_DICT = {
-    f"{PKG}_listener": ["dropbot/signals/#"]}
\ No newline at end of file
+    f"{PKG}_listener": ["dropbot/signals/#",
+                        {"topic": "dropbot/signals/capacitance_updated", "conflate": True}]}
\ No newline at end of file
@@ -1,13 +1,12 @@
 from traits.api import HasTraits, provides, Str
 import dramatiq
-import json
 from traits.api import Instance
 
 from dropbot_controller.consts import START_DEVICE_MONITORING
 from microdrop_utils._logger import get_logger
 from microdrop_utils.dramatiq_controller_base import generate_class_method_dramatiq_listener_actor
 from microdrop_utils.base_dropbot_qwidget import BaseDramatiqControllableDropBotQWidget
-from microdrop_utils.dramatiq_controller_base import invoke_class_method
+from microdrop_utils.dramatiq_controller_base import get_handler_dispatch_table
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
 
 logger = get_logger(__name__)
@@ -36,7 +35,7 @@ class DramatiqDropbotStatusController(HasTraits):
 
     def listener_actor_routine(self, message, topic):
         logger.debug(f"UI_LISTENER: Received message: {message} from topic: {topic}. Triggering UI Signal")
-        self.view.controller_signal.emit(json.dumps({'message': message, 'topic': topic}))
+        self.view.controller_signal.emit({'message': message, 'topic': topic})
 
     def traits_init(self):
         """
@@ -56,19 +55,20 @@ class DramatiqDropbotStatusController(HasTraits):
             listener_name=self.listener_name,
             class_method=self.listener_actor_routine)
 
+        # find the view's topic handlers once, rather than on every signal
+        if self.view is not None:
+            get_handler_dispatch_table(self.view)
+
     def controller_signal_handler(self, signal):
         """
         Handle GUI action required for signal triggered by dropbot status listener.
         """
-        signal = json.loads(signal)
         topic = signal.get("topic", "")
         message = signal.get("message", "")
-        head_topic = topic.split('/')[-1]
-        sub_topic = topic.split('/')[-2]
-        method = f"_on_{head_topic}_triggered"
 
-        err_msg = invoke_class_method(self.view, method, message)
-        if err_msg:
+        if not get_handler_dispatch_table(self.view).dispatch(topic, message):
+            head_topic = topic.split('/')[-1]
+            sub_topic = topic.split('/')[-2]
 
             # special topic warnings. Catch them all and print out to screen. Generic method for all warnings in case no
             # specific implementations for them defined.
@@ -77,11 +77,8 @@ class DramatiqDropbotStatusController(HasTraits):
 
                 title = head_topic.replace('_', ' ').title()
 
-                self.view._on_show_warning_triggered(json.dumps(
+                self.view._on_show_warning_triggered(
 
                     {'title': title,
                      'message': message}
-                ))
-
-            else:
-                logger.debug(f"Method for {head_topic}, {method} not executed: Error: {err_msg}")
\ No newline at end of file
+                )
@@ -1,5 +1,4 @@
 # sys imports
-import json
 import os
 
 # pyside imports
@@ -11,6 +10,7 @@ from PySide6.QtGui import QPixmap
 from microdrop_utils._logger import get_logger
 from microdrop_utils.base_dropbot_qwidget import BaseDramatiqControllableDropBotQWidget
 from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
+from microdrop_utils.dramatiq_message_codec import decode_payload
 
 logger = get_logger(__name__)
 from dropbot_controller.consts import DETECT_SHORTS, RETRY_CONNECTION
@@ -139,7 +139,7 @@ class DropBotStatusWidget(BaseDramatiqControllableDropBotQWidget):
 
     ######## shorts found method ###########
     def _on_shorts_detected_triggered(self, shorts_dict):
-        shorts = json.loads(shorts_dict).get('Shorts_detected', [])
+        shorts = decode_payload(shorts_dict).get('Shorts_detected', [])
 
         self.shorts_popup = QMessageBox()
         self.shorts_popup.setFixedSize(300, 200)
@@ -160,8 +160,9 @@ class DropBotStatusWidget(BaseDramatiqControllableDropBotQWidget):
 
     ################# Capcitance Voltage readings ##################
     def _on_capacitance_updated_triggered(self, body):
-        capacitance = json.loads(body).get('capacitance', '0 pF')
-        voltage = json.loads(body).get('voltage', '0 V')
+        body = decode_payload(body)
+        capacitance = body.get('capacitance', '0 pF')
+        voltage = body.get('voltage', '0 V')
         self.status_label.update_capacitance_reading(capacitance)
         self.status_label.update_voltage_reading(voltage)
 
@@ -180,7 +181,7 @@ class DropBotStatusWidget(BaseDramatiqControllableDropBotQWidget):
 
     ########## Warning methods ################
     def _on_show_warning_triggered(self, body):
-        body = json.loads(body)
+        body = decode_payload(body)
 
         title = body.get('title', ''),
         message = body.get('message', '')
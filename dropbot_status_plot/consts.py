@@ -8,9 +8,9 @@ current_folder_path = os.path.dirname(os.path.abspath(__file__))
 VOLTAGE_LISTENER = f"{PKG}_voltage_listener"
 CAPACITANCE_LISTENER = f"{PKG}_capacitance_listener"
 
-# Topics actor declared by plugin subscribes to
+# Topics actor declared by plugin subscribes to. Readings are conflated: a busy plot only gets the latest one.
 ACTOR_TOPIC_DICT = {
-    VOLTAGE_LISTENER: ["dropbot/signals/capacitance_updated"],
-    CAPACITANCE_LISTENER: ["dropbot/signals/capacitance_updated"],
+    VOLTAGE_LISTENER: [{"topic": "dropbot/signals/capacitance_updated", "conflate": True}],
+    CAPACITANCE_LISTENER: [{"topic": "dropbot/signals/capacitance_updated", "conflate": True}],
 
 }
\ No newline at end of file
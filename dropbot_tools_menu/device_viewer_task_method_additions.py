@@ -1,7 +1,7 @@
-import json
 import threading
 
 from microdrop_utils import open_html_in_browser
+from microdrop_utils.dramatiq_message_codec import decode_payload
 
 
 def _on_self_tests_progress_triggered(self, current_message):
@@ -9,7 +9,7 @@ def _on_self_tests_progress_triggered(self, current_message):
     Method adds on to the device viewer task to listen to the self tests topic and react accordingly
     """
 
-    message = json.loads(current_message)
+    message = decode_payload(current_message)
     active_state = message.get('active_state')
     current_message = message.get('current_message')
     done_test_number = message.get('done_test_number')
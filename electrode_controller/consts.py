@@ -3,4 +3,7 @@ PKG = '.'.join(__name__.split('.')[:-1])
 PKG_name = PKG.title().replace("_", " ")
 
 # Plugin offers services that are executed on publishing to this topic
-ELECTRODES_STATE_CHANGE = 'dropbot/requests/electrodes_state_change'
\ No newline at end of file
+ELECTRODES_STATE_CHANGE = 'dropbot/requests/electrodes_state_change'
+# Electrode state changes of sequenced protocol steps: every state is applied, in order, never coalesced with the
+# other requests
+SEQUENCED_ELECTRODES_STATE_CHANGE = 'dropbot/requests/sequenced_electrodes_state_change'
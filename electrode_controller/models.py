@@ -1,40 +1,60 @@
-from traits.api import HasTraits, Array, List, Dict, Bool, Int, Str, Property, TraitError, cached_property
+from traits.api import HasTraits, Array, List, Dict, Bool, Int, Str, Union, Property, TraitError, cached_property, \
+    Any
 import json
 import numpy as np
 
+from microdrop_utils.channels_states_bitset import is_channels_bitset, unpack_channels_states
+
+CHANNELS_STATES_MESSAGE_ERROR = ("JSON Message input should be a dictionary with string representation of integer "
+                                 "(numeric string) keys and Boolean values.")
+
 
 class ElectrodeStateChangeRequestMessageModel(HasTraits):
     """
     Model for the JSON string sent to the electrode state change topic to request the electrode state change service.
 
     It should be a JSON message where the keys are the string representations of integers. and the states are
-    boolean values.
+    boolean values. The already decoded dict, with integer keys, sent by typed payload publishers is accepted too.
 
     The input message will be stored in pythonized dict form. The channels will be converted to ints from string.
+
+    A packed bitset payload, see microdrop_utils.channels_states_bitset, is accepted too. It is decoded straight into
+    the boolean mask instead.
     """
     _json_message = Dict(Int, Bool, desc="Dict mapping integer channel ids to boolean states of each. The states "
                                          "should specify its current actuation state.")
 
+    _bitset_mask = Any(desc="Boolean mask of the channel states decoded from a bitset payload, None for JSON messages")
+
     # We should get integer keys and Boolean values in the JSON message.
-    json_message = Property(Str, observe="_json_message")
+    json_message = Property(Union(Str, Dict), observe="_json_message, _bitset_mask")
 
     # optional in case the boolean mask is needed.
     num_available_channels = Int(desc="Number of available channels at maximum on the dropbot.")
 
-    channels_states_boolean_mask = Property(Array, observe="_json_message", desc="boolean mask representing which channels on/off.")
+    channels_states_boolean_mask = Property(Array, observe="_json_message, _bitset_mask", desc="boolean mask representing which channels on/off.")
 
     #------Property methods----------
     @cached_property
     def _get_json_message(self):
+        if self._bitset_mask is not None:
+            return {channel: bool(state) for channel, state in enumerate(self._bitset_mask)}
+
         return self._json_message
 
-    def _set_json_message(self, json_data: Str):
-        json_data_items = json.loads(json_data).items()
-        if all(k.isdigit() and isinstance(v, bool) for k, v in json_data_items):
+    def _set_json_message(self, json_data):
+        if is_channels_bitset(json_data):
+            self._bitset_mask = unpack_channels_states(json_data)
+            return
+
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+
+        json_data_items = json_data.items()
+        if all((isinstance(k, int) or k.isdigit()) and isinstance(v, bool) for k, v in json_data_items):
             self._json_message = {int(key): value for key, value in json_data_items}
         else:
-            raise TraitError("JSON Message input should be a dictionary with string representation of "
-                                         "integer (numeric string) keys and Boolean values.")
+            raise TraitError(CHANNELS_STATES_MESSAGE_ERROR)
 
     @cached_property
     def _get_channels_states_boolean_mask(self) -> Array:
@@ -51,6 +71,16 @@ class ElectrodeStateChangeRequestMessageModel(HasTraits):
         Returns:
             np.ndarray: A Boolean array of size `max_size` with specified `indices` set to True.
         """
+        if self._bitset_mask is not None:
+            # already decoded into a mask
+            if len(self._bitset_mask) == self.num_available_channels:
+                return self._bitset_mask
+
+            mask = np.zeros(self.num_available_channels, dtype=bool)
+            mask[np.flatnonzero(self._bitset_mask)] = True
+
+            return mask
+
         # Initialize an array of False values
         mask = np.zeros(self.num_available_channels, dtype=bool)
 
@@ -60,4 +90,78 @@ class ElectrodeStateChangeRequestMessageModel(HasTraits):
         # Set specified indices to True
         mask[channels_on_now] = True
 
-        return mask
\ No newline at end of file
+        return mask
+
+
+def decode_channels_states(message, num_available_channels: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    Fast path of ElectrodeStateChangeRequestMessageModel: validates a message in any of its formats and converts it
+    into the boolean channels mask, without building a model.
+
+    Every message the model rejects is rejected: channel keys have to be ints or numeric strings, and states booleans.
+    Negative channels are rejected too. The channels and states are set in the mask as whole arrays, and the mask can
+    be preallocated.
+
+    Parameters:
+    message: A JSON string, a dict of channels to boolean states, or a bitset payload.
+    num_available_channels (int): The size of the mask.
+    out (np.ndarray): Optional boolean array of num_available_channels to decode the mask into.
+
+    Returns:
+        np.ndarray: The boolean mask, out if given.
+
+    Raises:
+        ValueError: If the message is not valid, or has channels on beyond the available ones.
+
+    Example:
+        >>> decode_channels_states('{"0": true, "1": false, "9": true}', 10).nonzero()[0].tolist()
+        [0, 9]
+    """
+    if out is None:
+        out = np.zeros(num_available_channels, dtype=bool)
+    else:
+        out[:] = False
+
+    if is_channels_bitset(message):
+        channels_on = np.flatnonzero(unpack_channels_states(message))
+
+    else:
+        if isinstance(message, str):
+            message = json.loads(message)
+
+        if not isinstance(message, dict):
+            raise ValueError(CHANNELS_STATES_MESSAGE_ERROR)
+
+        # int() alone would take keys like " 1" or "+1", which the model rejects
+        if not _are_channel_keys(message.keys()):
+            raise ValueError(CHANNELS_STATES_MESSAGE_ERROR)
+
+        try:
+            channels = np.fromiter(message.keys(), dtype=np.int64, count=len(message))
+        except (TypeError, ValueError):
+            raise ValueError(CHANNELS_STATES_MESSAGE_ERROR) from None
+
+        # any state that is not a boolean makes the array of another dtype
+        states = np.array(list(message.values()))
+
+        if (channels < 0).any() or (len(states) and states.dtype != bool):
+            raise ValueError(CHANNELS_STATES_MESSAGE_ERROR)
+
+        channels_on = channels[states] if len(states) else channels
+
+    if len(channels_on) and channels_on.max() >= num_available_channels:
+        raise ValueError(f"Channels {channels_on[channels_on >= num_available_channels].tolist()} turned on beyond the "
+                         f"{num_available_channels} available channels")
+
+    out[channels_on] = True
+
+    return out
+
+
+def _are_channel_keys(keys) -> bool:
+    # the keys the model accepts: ints, or strings of digits only
+    try:
+        return all(map(str.isdigit, keys))
+    except TypeError:
+        # not only strings, e.g. the int keys of typed payloads
+        return all(isinstance(key, int) or (isinstance(key, str) and key.isdigit()) for key in keys)
@@ -1,5 +1,6 @@
 # library imports
-from traits.api import provides, HasTraits
+import numpy as np
+from traits.api import provides, HasTraits, Int, Any
 
 # interface imports from microdrop plugins
 from dropbot_controller.interfaces.i_dropbot_control_mixin_service import IDropbotControlMixinService
@@ -10,7 +11,18 @@ from microdrop_utils._logger import get_logger
 logger = get_logger(__name__)
 
 # local imports
-from ..models import ElectrodeStateChangeRequestMessageModel
+from ..models import decode_channels_states
+
+
+def channels_states_payload_size(num_channels: int) -> int:
+    """
+    Number of bytes of the channel states written to the proxy on a full write, one bit per channel.
+
+    Example:
+        >>> channels_states_payload_size(120)
+        15
+    """
+    return (num_channels + 7) // 8
 
 
 @provides(IDropbotControlMixinService)
@@ -19,22 +31,88 @@ class ElectrodeStateChangeMixinService(HasTraits):
     A mixin Class that adds methods to change the electrode state in a dropbot.
 
     We assume that the base dropbot_controller plugin has been loaded with all of its services.
-    So we should have access to the dropbot proxy object here, per the IDropbotControllerBase.
+    So we should have access to the command executor owning the dropbot proxy here, per the IDropbotControllerBase.
+
+    Only changes are written: the requested states are compared to the applied_channels_mask of the controller, and
+    the write is skipped when no channel changed.
+
+    Requests queued while the dropbot is busy are coalesced for manual control: only the newest pending state is
+    applied. Sequenced protocol steps opt out by requesting the sequenced electrodes state change instead, whose
+    every state is applied in order.
     """
 
     id = "electrode_state_change_mixin_service"
     name = 'Electrode state change Mixin'
 
+    skipped_actuation_count = Int(desc="Number of electrode state change requests not written as no channel changed")
+
+    serial_bytes_saved = Int(desc="Number of channel states bytes not written to the proxy thanks to skipped writes")
+
+    merged_request_count = Int(desc="Number of electrode state change requests coalesced into a newer pending one")
+
+    applied_request_count = Int(desc="Number of electrode state change requests applied to the dropbot")
+
+    # the mask applied before the current one, reused to decode the next request into
+    _spare_channels_mask = Any()
+
     ######################################## Methods to Expose #############################################
     def on_electrodes_state_change_request(self, message):
         """
         Method following the simple example in examples/tests/test_dropbot_methods to actuate electrodes on dropbot
         given the states and channels pairs in the JSON message as per ElectrodeStateChangeRequestMessageModel.
+        The message is decoded with its fast path, decode_channels_states.
         """
-        channel_states_map_model = ElectrodeStateChangeRequestMessageModel(json_message=message,
-                                                                           num_available_channels=self.proxy.number_of_channels)
+        # writes of the channel states still queued are merged: only the latest states are actuated
+        command = self.command_executor.submit("set_state_of_channels",
+                                               lambda proxy: self._actuate_electrodes(proxy, message),
+                                               register="state_of_channels")
+
+        if command.merged_count:
+            self.merged_request_count += 1
+
+    def on_sequenced_electrodes_state_change_request(self, message):
+        """
+        Method to actuate electrodes like on_electrodes_state_change_request, for the steps of a sequence: every
+        requested state is applied, in the order requested.
+        """
+        self.command_executor.submit("set_state_of_channels",
+                                     lambda proxy: self._actuate_electrodes(proxy, message),
+                                     register="state_of_channels", merge=False)
+
+    ################################# Protected methods ######################################
+    def _actuate_electrodes(self, proxy, message):
+        self.applied_request_count += 1
+
+        applied_mask = self.applied_channels_mask
+
+        # the channel count is only asked to the proxy while no states were written yet
+        num_channels = len(applied_mask) if applied_mask is not None else proxy.number_of_channels
+
+        # decoded into the spare mask, as the applied mask is still needed to compare against
+        spare_mask = self._spare_channels_mask
+        if spare_mask is not None and len(spare_mask) != num_channels:
+            spare_mask = None
+
+        mask = decode_channels_states(message, num_channels, out=spare_mask)
+        self._spare_channels_mask = mask
+
+        payload_size = channels_states_payload_size(num_channels)
+
+        changed_count = np.count_nonzero(mask ^ applied_mask) if applied_mask is not None else num_channels
+
+        if changed_count == 0:
+            self.skipped_actuation_count += 1
+            self.serial_bytes_saved += payload_size
+            logger.debug("No channel state changed, actuation skipped")
+            return
+
+        # do actuation, with the narrowest update the proxy offers
+        if not mask.any():
+            proxy.turn_off_all_channels()
+        else:
+            proxy.state_of_channels = mask
 
-        # do actuation
-        self.proxy.state_of_channels = channel_states_map_model.channels_states_boolean_mask
+        self._spare_channels_mask = applied_mask
+        self.applied_channels_mask = mask
 
-        logger.info(f"{self.proxy.state_of_channels.sum()} number of channels actuated now")
+        logger.info(f"{changed_count} channels changed, {np.count_nonzero(mask)} number of channels actuated now")
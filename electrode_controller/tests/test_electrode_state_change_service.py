@@ -0,0 +1,185 @@
+import threading
+
+import numpy as np
+import pytest
+from traits.api import Any, Instance
+
+from microdrop_utils.hardware_command_executor import HardwareCommandExecutor
+from ..services.electrode_state_change_service import ElectrodeStateChangeMixinService
+
+
+class FakeProxy:
+    """Records the channel states writes."""
+
+    number_of_channels = 16
+
+    def __init__(self):
+        self.writes = []
+
+    @property
+    def state_of_channels(self):
+        raise AssertionError("Channel states should not be read back")
+
+    @state_of_channels.setter
+    def state_of_channels(self, mask):
+        self.writes.append(("state_of_channels", mask.copy()))
+
+    def turn_off_all_channels(self):
+        self.writes.append(("turn_off_all_channels", None))
+
+    def detect_shorts(self):
+        # drives every channel in turn, leaving them off
+        self.writes.append(("detect_shorts", None))
+        return []
+
+
+class FakeController(ElectrodeStateChangeMixinService):
+    """The electrode service along with the dropbot controller traits it relies on."""
+
+    command_executor = Instance(HardwareCommandExecutor)
+    applied_channels_mask = Any()
+
+
+@pytest.fixture
+def controller():
+    executor = HardwareCommandExecutor(proxy=FakeProxy())
+    executor.start()
+
+    yield FakeController(command_executor=executor)
+
+    executor.stop(timeout=1)
+
+
+def actuate(controller, message):
+    controller.on_electrodes_state_change_request(message)
+    # an empty command, run once the actuation is done
+    controller.command_executor.call("sync", lambda proxy: None)
+
+
+def test_unchanged_states_not_written(controller):
+    actuate(controller, '{"1": true, "2": false}')
+    actuate(controller, '{"1": true, "2": false, "3": false}')
+
+    writes = controller.command_executor.proxy.writes
+    assert len(writes) == 1
+    assert np.flatnonzero(writes[0][1]).tolist() == [1]
+
+    assert controller.skipped_actuation_count == 1
+    assert controller.serial_bytes_saved == 2
+
+
+def test_changed_states_written(controller):
+    actuate(controller, '{"1": true}')
+    actuate(controller, '{"1": true, "5": true}')
+
+    writes = controller.command_executor.proxy.writes
+    assert [name for name, _ in writes] == ["state_of_channels", "state_of_channels"]
+    assert np.flatnonzero(writes[-1][1]).tolist() == [1, 5]
+    assert controller.skipped_actuation_count == 0
+
+
+def test_all_channels_off_turned_off_at_once(controller):
+    actuate(controller, '{"1": true}')
+    actuate(controller, '{"1": false}')
+
+    writes = controller.command_executor.proxy.writes
+    assert [name for name, _ in writes] == ["state_of_channels", "turn_off_all_channels"]
+    # turning off all channels is still a write
+    assert controller.serial_bytes_saved == 0
+
+
+def test_unknown_applied_states_written(controller):
+    actuate(controller, '{"1": true}')
+
+    # e.g. after a halt turned off the channels
+    controller.applied_channels_mask = None
+    actuate(controller, '{"1": true}')
+
+    assert len(controller.command_executor.proxy.writes) == 2
+
+
+def block_executor(controller):
+    """Keeps the executor busy until the returned event is set, so that requests stay queued."""
+    running = threading.Event()
+    release = threading.Event()
+
+    def block(proxy):
+        running.set()
+        release.wait(1)
+
+    controller.command_executor.submit("block", block)
+    running.wait(1)
+
+    return release
+
+
+def test_queued_requests_coalesced(controller):
+    release = block_executor(controller)
+
+    for channel in range(5):
+        controller.on_electrodes_state_change_request(f'{{"{channel}": true}}')
+
+    release.set()
+    controller.command_executor.call("sync", lambda proxy: None)
+
+    # only the newest state is applied
+    writes = controller.command_executor.proxy.writes
+    assert len(writes) == 1
+    assert np.flatnonzero(writes[0][1]).tolist() == [4]
+
+    assert controller.merged_request_count == 4
+    assert controller.applied_request_count == 1
+
+
+def test_sequenced_requests_all_applied_in_order(controller):
+    release = block_executor(controller)
+
+    controller.on_electrodes_state_change_request('{"0": true}')
+    for channel in range(1, 4):
+        controller.on_sequenced_electrodes_state_change_request(f'{{"{channel}": true}}')
+    # not merged into the request queued before the sequenced ones
+    controller.on_electrodes_state_change_request('{"4": true}')
+
+    release.set()
+    controller.command_executor.call("sync", lambda proxy: None)
+
+    writes = controller.command_executor.proxy.writes
+    assert [np.flatnonzero(mask).tolist() for _, mask in writes] == [[0], [1], [2], [3], [4]]
+
+    assert controller.merged_request_count == 0
+    assert controller.applied_request_count == 5
+
+
+@pytest.fixture
+def monitoring_controller(monkeypatch):
+    """
+    The electrode service along with the dropbot monitor service, which needs the dropbot package.
+    """
+    pytest.importorskip("dropbot.proxy")
+    from dropbot_controller.services import dropbot_monitor_mixin_service
+
+    monkeypatch.setattr(dropbot_monitor_mixin_service, "publish_message", lambda **kwargs: None)
+
+    class MonitoringController(dropbot_monitor_mixin_service.DropbotMonitorMixinService, FakeController):
+        proxy = Any()
+
+    executor = HardwareCommandExecutor(proxy=FakeProxy())
+    executor.start()
+
+    yield MonitoringController(command_executor=executor, proxy=executor.proxy)
+
+    executor.stop(timeout=1)
+
+
+def test_states_written_again_after_shorts_detection(monitoring_controller):
+    actuate(monitoring_controller, '{"1": true}')
+    monitoring_controller.on_detect_shorts_request("")
+
+    # the shorts detection changed the channels behind the service's back
+    assert monitoring_controller.applied_channels_mask is None
+
+    actuate(monitoring_controller, '{"1": true}')
+
+    writes = monitoring_controller.command_executor.proxy.writes
+    assert [name for name, _ in writes] == ["state_of_channels", "detect_shorts", "state_of_channels"]
+    assert np.flatnonzero(writes[-1][1]).tolist() == [1]
@@ -1,3 +1,4 @@
+import json
 import re
 
 import numpy as np
@@ -16,6 +17,14 @@ def test_message_model_success():
     assert model.json_message == parsed_data
 
 
+def test_message_model_success_typed_payload():
+    """Test that MessageModel accepts an already decoded dict with int keys and bool values."""
+    parsed_data = {1: True, 2: False, 3: True}
+
+    model = ElectrodeStateChangeRequestMessageModel(json_message=parsed_data)
+    assert model.json_message == parsed_data
+
+
 def test_message_model_failure_non_boolean_value():
     """Test that MessageModel raises TraitError for JSON with non-boolean values."""
     json_data = '{"1": true, "2": "false"}'  # Value "false" is a string, not a boolean
@@ -54,3 +63,69 @@ def test_get_boolean_channels_states_mask_zero_on():
         model.channels_states_boolean_mask ==
         np.array([False, False, False, False, False, False, False, False, False, False])
     )
+
+
+def test_message_model_bitset_payload():
+    """Test that MessageModel decodes a bitset payload, raw or base64 encoded, into the boolean mask."""
+    from microdrop_utils.channels_states_bitset import pack_channels_states
+
+    states = {0: True, 1: False, 9: True}
+
+    for as_base64 in (False, True):
+        model = ElectrodeStateChangeRequestMessageModel(json_message=pack_channels_states(states, as_base64=as_base64),
+                                                        num_available_channels=12)
+        assert model.channels_states_boolean_mask.nonzero()[0].tolist() == [0, 9]
+        assert len(model.channels_states_boolean_mask) == 12
+        assert model.json_message == {channel: channel in (0, 9) for channel in range(10)}
+
+
+def test_message_model_bitset_matches_json():
+    """Test that the bitset and JSON formats of the same states give the same mask."""
+    from microdrop_utils.channels_states_bitset import pack_channels_states
+
+    states = {channel: channel % 3 == 0 for channel in range(120)}
+
+    bitset_model = ElectrodeStateChangeRequestMessageModel(json_message=pack_channels_states(states),
+                                                           num_available_channels=120)
+    json_model = ElectrodeStateChangeRequestMessageModel(json_message=json.dumps(states), num_available_channels=120)
+
+    assert np.array_equal(bitset_model.channels_states_boolean_mask, json_model.channels_states_boolean_mask)
+
+
+def test_decode_channels_states_matches_model():
+    """Test that the fast path decodes every message format into the same mask as the model."""
+    from microdrop_utils.channels_states_bitset import pack_channels_states
+    from ..models import decode_channels_states
+
+    states = {channel: channel % 3 == 0 for channel in range(120)}
+    out = np.ones(128, dtype=bool)
+
+    for message in (json.dumps(states), states, pack_channels_states(states)):
+        model = ElectrodeStateChangeRequestMessageModel(json_message=message, num_available_channels=128)
+
+        mask = decode_channels_states(message, 128, out=out)
+        assert mask is out
+        assert np.array_equal(mask, model.channels_states_boolean_mask)
+
+
+@pytest.mark.parametrize("message", ['{"1": true, "2": "false"}', '{"a": true}', '{"-1": true}', '{"1": 1}', '[1, 2]',
+                                     '{" 1": true}', '{"+1": true}', '{"1_0": true}', '{"": true}', {1.0: True}])
+def test_decode_channels_states_invalid_message(message):
+    """Test that the fast path rejects the messages the model rejects."""
+    from ..models import decode_channels_states
+
+    with pytest.raises(ValueError):
+        decode_channels_states(message, 10)
+
+    with pytest.raises(Exception):
+        ElectrodeStateChangeRequestMessageModel(json_message=message, num_available_channels=10)
+
+
+def test_decode_channels_states_beyond_available_channels():
+    """Test that the fast path rejects channels turned on beyond the available ones, but not ones turned off."""
+    from ..models import decode_channels_states
+
+    assert not decode_channels_states('{"12": false}', 10).any()
+
+    with pytest.raises(ValueError, match=re.escape("[12]")):
+        decode_channels_states('{"1": true, "12": true}', 10)
@@ -0,0 +1,86 @@
+"""
+Benchmark for parsing the channel states of electrode state change requests.
+
+Compares the parse throughput, from payload to the boolean channels mask, and the payload size of the JSON formats
+(JSON string, and the decoded dict typed payload publishers send) against the packed bitset format, raw and base64
+encoded, for a full 120 channel dropbot. Each format is parsed by the traits model, then by the decode_channels_states
+fast path into a preallocated mask.
+
+No redis server is needed:
+
+    python -m examples.benchmarks.channels_states_parse_benchmark
+"""
+import json
+import time
+
+import numpy as np
+
+from electrode_controller.models import ElectrodeStateChangeRequestMessageModel, decode_channels_states
+from microdrop_utils.channels_states_bitset import pack_channels_states
+
+ROUNDS = 5000
+
+NUM_CHANNELS = 120
+
+CHANNELS_STATES = {channel: channel % 3 == 0 for channel in range(NUM_CHANNELS)}
+
+PAYLOADS = {
+    "json string": json.dumps(CHANNELS_STATES),
+    "json dict": CHANNELS_STATES,
+    "bitset": pack_channels_states(CHANNELS_STATES, as_base64=False),
+    "bitset b64": pack_channels_states(CHANNELS_STATES, as_base64=True),
+}
+
+
+def parses_per_second(payload) -> float:
+    """Parse the payload down to the boolean channels mask with the traits model, ROUNDS times."""
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        ElectrodeStateChangeRequestMessageModel(json_message=payload,
+                                                num_available_channels=NUM_CHANNELS).channels_states_boolean_mask
+
+    return ROUNDS / (time.perf_counter() - start)
+
+
+def fast_path_parses_per_second(payload) -> float:
+    """Parse the payload down to a preallocated boolean channels mask with the fast path, ROUNDS times."""
+    out = np.zeros(NUM_CHANNELS, dtype=bool)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        decode_channels_states(payload, NUM_CHANNELS, out=out)
+
+    return ROUNDS / (time.perf_counter() - start)
+
+
+def payload_size(payload) -> int:
+    if isinstance(payload, str):
+        return len(payload)
+
+    if "bitset" in payload:
+        return len(payload["bitset"])
+
+    return len(json.dumps(payload))
+
+
+def run_benchmark():
+    baseline = None
+
+    print(f"{'format':>12} | {'model (parses/s)':>16} | {'speedup':>8} | {'fast path (parses/s)':>20} | "
+          f"{'speedup':>8} | {'payload (bytes)':>15}")
+    for name, payload in PAYLOADS.items():
+        rate = parses_per_second(payload)
+        fast_rate = fast_path_parses_per_second(payload)
+        baseline = baseline or rate
+
+        print(f"{name:>12} | {rate:>16.0f} | {rate / baseline:>7.1f}x | {fast_rate:>20.0f} | "
+              f"{fast_rate / baseline:>7.1f}x | {payload_size(payload):>15}")
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+    run_benchmark()
@@ -0,0 +1,75 @@
+"""
+Benchmark for opening a device with the parsed device cache.
+
+Times opening device files of 100 to 10,000 square electrodes: parsing them, finding the neighbours and connections of
+their electrodes and storing the result in the cache the first time, then loading them from the cache.
+
+No device file is needed, the devices are written to a temporary directory, along with the cache:
+
+    python -m examples.benchmarks.device_cache_benchmark
+"""
+import tempfile
+import time
+from pathlib import Path
+from xml.etree import ElementTree as ET
+
+import numpy as np
+
+from device_viewer.utils.dmf_utils import SvgUtil
+from device_viewer.utils.parsed_device_cache import ParsedDeviceCache
+
+ELECTRODE_COUNTS = [100, 1000, 10000]
+
+ROUNDS = 5
+
+ELECTRODE_SIZE = 2.0
+ELECTRODE_GAP = 0.2
+
+
+def write_grid_device(filename: Path, electrode_count: int):
+    """A device file of square electrodes laid out on a square grid."""
+    root = ET.Element("svg")
+    layer = ET.SubElement(root, "g", {"id": "layer1", "label": "Device"})
+    columns = int(np.ceil(np.sqrt(electrode_count)))
+
+    for i in range(electrode_count):
+        x, y = np.array([i % columns, i // columns]) * (ELECTRODE_SIZE + ELECTRODE_GAP)
+        ET.SubElement(layer, "path", {"id": f"electrode{i:05d}", "data-channels": str(i), "style": "fill:#ff0000",
+                                      "d": f"M {x:.3f},{y:.3f} H {x + ELECTRODE_SIZE:.3f} "
+                                           f"V {y + ELECTRODE_SIZE:.3f} H {x:.3f} Z"})
+
+    ET.ElementTree(root).write(filename)
+
+
+def run_benchmark():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ParsedDeviceCache(cache_dir=str(Path(tmpdir) / "cache"))
+
+        print(f"{'electrodes':>10} | {'parsed (ms)':>11} | {'cached (ms)':>11} | {'speedup':>8} | "
+              f"{'entry (kB)':>10}")
+        for electrode_count in ELECTRODE_COUNTS:
+            filename = Path(tmpdir) / f"device_{electrode_count}.svg"
+            write_grid_device(filename, electrode_count)
+
+            start = time.perf_counter()
+            SvgUtil(filename, cache=cache)
+            parsed_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                SvgUtil(filename, cache=cache)
+            cached_time = (time.perf_counter() - start) / ROUNDS
+
+            entry_size = (Path(cache.cache_dir) / f"{cache.key(filename)}.npz").stat().st_size
+
+            print(f"{electrode_count:>10} | {parsed_time * 1000:>11.1f} | {cached_time * 1000:>11.1f} | "
+                  f"{parsed_time / cached_time:>7.0f}x | {entry_size / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+    run_benchmark()
@@ -0,0 +1,96 @@
+"""
+Latency benchmark for direct routing.
+
+Measures the time from publishing an electrodes state change request, as the device viewer does on an electrode
+click, to the dropbot controller's on_electrodes_state_change_request handler being called. This is done once routing
+through the message_router_actor and once with direct routing enabled in the publishing process.
+
+Needs a redis server, which is started if one is not running already:
+
+    python -m examples.benchmarks.direct_routing_latency_benchmark
+"""
+import json
+import statistics
+import threading
+import time
+
+from dropbot_controller.consts import ACTOR_TOPIC_DICT
+from electrode_controller.consts import ELECTRODES_STATE_CHANGE
+from microdrop_utils.dramatiq_controller_base import generate_class_method_dramatiq_listener_actor
+from microdrop_utils.dramatiq_pub_sub_helpers import (MessageRouterActor, publish_message, enable_direct_routing,
+                                                      disable_direct_routing)
+
+N_CLICKS = 200
+N_CHANNELS = 120
+
+
+class ElectrodesStateChangeRequestTimer:
+    """Stands in for the dropbot controller, recording when each electrodes state change request arrives."""
+
+    def __init__(self):
+        self.request_received = threading.Event()
+        self.received_at = None
+
+    def listener_actor_routine(self, message, topic):
+        if topic == ELECTRODES_STATE_CHANGE:
+            self.on_electrodes_state_change_request(message)
+
+    def on_electrodes_state_change_request(self, message):
+        self.received_at = time.perf_counter()
+        self.request_received.set()
+
+
+def click_latencies_ms(timer: ElectrodesStateChangeRequestTimer) -> list:
+    latencies = []
+    for i in range(N_CLICKS):
+        channels_states_map = {channel: channel == i % N_CHANNELS for channel in range(N_CHANNELS)}
+
+        timer.request_received.clear()
+        clicked_at = time.perf_counter()
+        publish_message(topic=ELECTRODES_STATE_CHANGE, message=json.dumps(channels_states_map))
+
+        if not timer.request_received.wait(timeout=5):
+            raise TimeoutError("electrodes state change request was never handled")
+
+        latencies.append((timer.received_at - clicked_at) * 1000)
+
+    return latencies
+
+
+def report(mode: str, latencies: list):
+    latencies = sorted(latencies)
+    print(f"{mode:>15} | {statistics.mean(latencies):>9.2f} | {statistics.median(latencies):>9.2f} | "
+          f"{latencies[int(0.95 * len(latencies)) - 1]:>9.2f}")
+
+
+def run_benchmark():
+    timer = ElectrodesStateChangeRequestTimer()
+    [listener_name] = ACTOR_TOPIC_DICT.keys()
+    generate_class_method_dramatiq_listener_actor(listener_name=listener_name,
+                                                  class_method=timer.listener_actor_routine)
+
+    router = MessageRouterActor()
+    router.message_router_data.add_subscriber_to_topic("dropbot/requests/#", listener_name)
+
+    print(f"{'mode':>15} | {'mean (ms)':>9} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+
+    report("router actor", click_latencies_ms(timer))
+
+    enable_direct_routing(router)
+    try:
+        report("direct routing", click_latencies_ms(timer))
+    finally:
+        disable_direct_routing()
+
+    router.message_router_data.remove_subscriber_from_topic("dropbot/requests/#", listener_name)
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+    from microdrop_utils.broker_server_helpers import redis_server_context, dramatiq_workers_context
+
+    with redis_server_context(), dramatiq_workers_context(worker_timeout=10):
+        run_benchmark()
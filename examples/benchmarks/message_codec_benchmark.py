@@ -0,0 +1,66 @@
+"""
+Benchmark for the dramatiq message codecs.
+
+Compares encode + decode time and encoded size of the legacy JSON-inside-JSON messages (payload json.dumps'd by the
+publisher, then the dramatiq message JSON encoded) against typed payloads in msgpack encoded messages, for the two
+hottest message shapes: an electrodes actuation request and a capacitance telemetry reading.
+
+No redis server is needed:
+
+    python -m examples.benchmarks.message_codec_benchmark
+"""
+import json
+import time
+
+import dramatiq
+
+from microdrop_utils.dramatiq_message_codec import MsgpackEncoder, decode_payload
+from microdrop_utils.dramatiq_pub_sub_helpers import build_message
+
+ROUNDS = 20000
+
+MESSAGE_SHAPES = {
+    # a full device worth of channel states, as published by the electrode interaction service
+    "actuation": ("dropbot/requests/electrodes_state_change", {channel: channel % 3 == 0 for channel in range(120)}),
+    # a reading, as published by the dropbot controller
+    "telemetry": ("dropbot/signals/capacitance_updated", {"capacitance": "1.234 pF", "voltage": "75.0 V"}),
+}
+
+
+def round_trips_per_second(encoder: dramatiq.Encoder, message: dramatiq.Message) -> float:
+    """Encode the message, then decode it down to its typed payload, ROUNDS times."""
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        decoded = dramatiq.Message(**encoder.decode(encoder.encode(message.asdict())))
+        decode_payload(decoded.args[0])
+
+    return ROUNDS / (time.perf_counter() - start)
+
+
+def run_benchmark():
+    json_encoder = dramatiq.JSONEncoder()
+    msgpack_encoder = MsgpackEncoder()
+
+    print(f"{'shape':>10} | {'json (msg/s)':>13} | {'msgpack (msg/s)':>15} | {'speedup':>8} | "
+          f"{'json (bytes)':>12} | {'msgpack (bytes)':>15}")
+    for shape, (topic, payload) in MESSAGE_SHAPES.items():
+        legacy_message = build_message(json.dumps(payload), topic)
+        typed_message = build_message(payload, topic)
+
+        before = round_trips_per_second(json_encoder, legacy_message)
+        after = round_trips_per_second(msgpack_encoder, typed_message)
+
+        legacy_size = len(json_encoder.encode(legacy_message.asdict()))
+        typed_size = len(msgpack_encoder.encode(typed_message.asdict()))
+
+        print(f"{shape:>10} | {before:>13.0f} | {after:>15.0f} | {after / before:>7.1f}x | "
+              f"{legacy_size:>12} | {typed_size:>15}")
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+    run_benchmark()
@@ -0,0 +1,91 @@
+"""
+Benchmark for MessageRouterData.get_subscribers_for_topic.
+
+Compares messages/sec of the previous routine (HGETALL of the router hash and a new MQTTMatcher built per stored
+pattern on every message) against the long-lived subscription trie, for 10, 100 and 1000 stored topic filters.
+
+Needs a redis server, which is started if one is not running already:
+
+    python -m examples.benchmarks.message_router_matching_benchmark
+"""
+import time
+
+from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterData
+
+BENCHMARK_STORAGE_KEY_NAME = "microdrop:benchmark_message_router_data"
+FILTER_COUNTS = (10, 100, 1000)
+MESSAGES_PER_RUN = 2000
+
+PUBLISHED_TOPICS = [
+    "dropbot/signals/capacitance_updated",
+    "dropbot/requests/electrodes_state_change",
+    "dropbot/signals/halted",
+]
+
+
+def legacy_get_subscribers_for_topic(router_data: MessageRouterData, topic: str) -> list:
+    """The subscriber lookup as it was before the subscription trie was kept in memory."""
+    bytes_to_str = lambda x: x.decode() if isinstance(x, bytes) else x
+
+    subscribers = set()
+    for key, value in router_data.topic_subscriber_map.items():
+        if MessageRouterData._topic_matches_pattern(bytes_to_str(key), topic):
+            for actor in value:
+                subscribers.add(tuple(actor))
+
+    return list(subscribers)
+
+
+def populate_filters(router_data: MessageRouterData, n_filters: int):
+    """Store n_filters topic filters, mixing exact topics with single and multi level wildcards."""
+    router_data.subscription_store.clear()
+
+    # the filters the app actually uses
+    router_data.add_subscriber_to_topic("dropbot/signals/#", "dropbot_status_listener")
+    router_data.add_subscriber_to_topic("dropbot/signals/capacitance_updated", "dropbot_status_plot_voltage_listener")
+    router_data.add_subscriber_to_topic("dropbot/requests/#", "dropbot_controller_listener")
+
+    for i in range(n_filters - 3):
+        filter_kind = i % 3
+        if filter_kind == 0:
+            topic_filter = f"plugin_{i}/signals/value_{i}"
+        elif filter_kind == 1:
+            topic_filter = f"plugin_{i}/+/value_{i}"
+        else:
+            topic_filter = f"plugin_{i}/requests/#"
+
+        router_data.add_subscriber_to_topic(topic_filter, f"plugin_{i}_listener")
+
+
+def messages_per_second(get_subscribers, router_data: MessageRouterData) -> float:
+    start = time.perf_counter()
+    for i in range(MESSAGES_PER_RUN):
+        get_subscribers(router_data, PUBLISHED_TOPICS[i % len(PUBLISHED_TOPICS)])
+
+    return MESSAGES_PER_RUN / (time.perf_counter() - start)
+
+
+def run_benchmark():
+    router_data = MessageRouterData(storage_key_name=BENCHMARK_STORAGE_KEY_NAME)
+
+    print(f"{'filters':>8} | {'before (msg/s)':>15} | {'after (msg/s)':>15} | {'speedup':>8}")
+    for n_filters in FILTER_COUNTS:
+        populate_filters(router_data, n_filters)
+
+        before = messages_per_second(legacy_get_subscribers_for_topic, router_data)
+        after = messages_per_second(MessageRouterData.get_subscribers_for_topic, router_data)
+
+        print(f"{n_filters:>8} | {before:>15.0f} | {after:>15.0f} | {after / before:>7.1f}x")
+
+    router_data.subscription_store.clear()
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+    from microdrop_utils.broker_server_helpers import redis_server_context
+
+    with redis_server_context():
+        run_benchmark()
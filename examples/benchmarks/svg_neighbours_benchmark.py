@@ -0,0 +1,83 @@
+"""
+Benchmark for finding the neighbours of every electrode of a device.
+
+Times SvgUtil.find_neighbours_all, which only measures the electrodes close to each other found through a spatial
+index, on grids of square electrodes from 100 to 10,000 electrodes. On the smaller grids, it is compared against
+measuring every ordered pair of electrodes, as was done before, which scales quadratically.
+
+No device file is needed:
+
+    python -m examples.benchmarks.svg_neighbours_benchmark
+"""
+import time
+
+import numpy as np
+
+from device_viewer.utils.dmf_utils import SvgUtil
+
+ELECTRODE_COUNTS = [100, 400, 1000, 10000]
+
+# the pairwise search takes minutes past a few hundred electrodes
+MAX_PAIRWISE_ELECTRODE_COUNT = 400
+
+ELECTRODE_SIZE = 2.0
+ELECTRODE_GAP = 0.2
+
+
+def make_grid_device(electrode_count: int) -> SvgUtil:
+    """A device of square electrodes laid out on a square grid."""
+    svg = SvgUtil()
+    columns = int(np.ceil(np.sqrt(electrode_count)))
+    square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]]) * ELECTRODE_SIZE
+
+    for i in range(electrode_count):
+        offset = np.array([i % columns, i // columns]) * (ELECTRODE_SIZE + ELECTRODE_GAP)
+        svg.electrodes[f"electrode{i:05d}"] = {"channel": i, "path": square + offset}
+
+    return svg
+
+
+def find_neighbours_all_pairwise(svg: SvgUtil) -> dict:
+    polygons = svg.get_electrode_polygons()
+    distances = sorted([v1.buffer(-0.1).distance(v2.buffer(-0.1)) for k1, v1 in polygons.items()
+                        for k2, v2 in polygons.items() if k1 != k2])
+    average_distance = np.mean(distances[:len(svg.electrodes)])
+
+    polygons = {k: v.buffer(average_distance) for k, v in polygons.items()}
+
+    neighbours = {}
+    for k1, v1 in polygons.items():
+        for k2, v2 in polygons.items():
+            if k1 != k2 and v1.intersection(v2).area >= average_distance:
+                neighbours.setdefault(k1, []).append(k2)
+
+    return neighbours
+
+
+def run_benchmark():
+    print(f"{'electrodes':>10} | {'indexed (s)':>11} | {'pairwise (s)':>12} | {'speedup':>8} | {'same result':>11}")
+    for electrode_count in ELECTRODE_COUNTS:
+        svg = make_grid_device(electrode_count)
+
+        start = time.perf_counter()
+        neighbours = svg.find_neighbours_all()
+        indexed_time = time.perf_counter() - start
+
+        if electrode_count <= MAX_PAIRWISE_ELECTRODE_COUNT:
+            start = time.perf_counter()
+            same_result = find_neighbours_all_pairwise(svg) == neighbours
+            pairwise_time = time.perf_counter() - start
+
+            print(f"{electrode_count:>10} | {indexed_time:>11.3f} | {pairwise_time:>12.3f} | "
+                  f"{pairwise_time / indexed_time:>7.0f}x | {str(same_result):>11}")
+        else:
+            print(f"{electrode_count:>10} | {indexed_time:>11.3f} | {'-':>12} | {'-':>8} | {'-':>11}")
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+    run_benchmark()
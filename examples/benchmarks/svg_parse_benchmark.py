@@ -0,0 +1,99 @@
+"""
+Benchmark for parsing the electrode paths of a device file.
+
+Times SvgUtil.svg_to_electrodes, which parses the d attributes of all the electrodes in a single pass into one array
+of points, against parsing each electrode path command by command, as was done before, on layers of 100 to 10,000
+electrodes. Layers of absolute commands are compared, along with layers of relative commands, which are parsed
+command by command either way.
+
+No device file is needed:
+
+    python -m examples.benchmarks.svg_parse_benchmark
+"""
+import time
+from xml.etree import ElementTree as ET
+
+import numpy as np
+
+from device_viewer.utils.dmf_utils import SvgUtil
+
+ELECTRODE_COUNTS = [100, 1000, 10000]
+
+ROUNDS = 5
+
+ELECTRODE_SIZE = 2.0
+ELECTRODE_GAP = 0.2
+
+
+def make_electrode_layer(electrode_count: int, relative: bool = False) -> ET.Element:
+    """A layer of square electrodes laid out on a square grid."""
+    layer = ET.Element("g")
+    columns = int(np.ceil(np.sqrt(electrode_count)))
+
+    for i in range(electrode_count):
+        x, y = np.array([i % columns, i // columns]) * (ELECTRODE_SIZE + ELECTRODE_GAP)
+        if relative:
+            d = f"m {x:.3f},{y:.3f} h {ELECTRODE_SIZE} v {ELECTRODE_SIZE} h {-ELECTRODE_SIZE} z"
+        else:
+            d = (f"M {x:.3f},{y:.3f} L {x + ELECTRODE_SIZE:.3f},{y:.3f} V {y + ELECTRODE_SIZE:.3f} "
+                 f"H {x:.3f} Z")
+
+        ET.SubElement(layer, "path", {"id": f"electrode{i:05d}", "data-channels": str(i), "d": d})
+
+    return layer
+
+
+def svg_to_electrodes_per_command(obj: ET.Element) -> dict:
+    electrodes = {}
+    for element in list(obj):
+        moves = []
+        for match in SvgUtil.path_commands.findall(element.attrib["d"]):
+            if ("M" in match) or ("L" in match):
+                moves.append((float(match[1]), float(match[2])))
+            elif "H" in match:
+                moves.append((float(match[4]), moves[-1][1]))
+            elif "V" in match:
+                moves.append((moves[-1][0], (float(match[6]))))
+
+        electrodes[element.attrib['id']] = {'channel': int(element.attrib['data-channels']),
+                                            'path': np.array(moves).reshape((-1, 2))}
+
+    return electrodes
+
+
+def electrodes_per_second(parse, layer: ET.Element) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        parse(layer)
+
+    return ROUNDS * len(layer) / (time.perf_counter() - start)
+
+
+def run_benchmark():
+    svg = SvgUtil()
+
+    print(f"{'electrodes':>10} | {'single pass (/s)':>16} | {'per command (/s)':>16} | {'speedup':>8} | "
+          f"{'same result':>11} | {'relative (/s)':>13}")
+    for electrode_count in ELECTRODE_COUNTS:
+        layer = make_electrode_layer(electrode_count)
+
+        rate = electrodes_per_second(svg.svg_to_electrodes, layer)
+        per_command_rate = electrodes_per_second(svg_to_electrodes_per_command, layer)
+
+        electrodes = svg.svg_to_electrodes(layer)
+        same_result = all(np.array_equal(electrodes[k]["path"], v["path"])
+                          for k, v in svg_to_electrodes_per_command(layer).items())
+
+        relative_rate = electrodes_per_second(svg.svg_to_electrodes, make_electrode_layer(electrode_count, True))
+
+        print(f"{electrode_count:>10} | {rate:>16.0f} | {per_command_rate:>16.0f} | "
+              f"{rate / per_command_rate:>7.1f}x | {str(same_result):>11} | {relative_rate:>13.0f}")
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+    run_benchmark()
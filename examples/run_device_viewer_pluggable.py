@@ -1,15 +1,27 @@
 import os
 import sys
+from contextlib import nullcontext
 
 from envisage.api import CorePlugin
 from envisage.ui.tasks.api import TasksPlugin
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from microdrop_utils.broker_server_helpers import dramatiq_workers_context, redis_server_context
+from microdrop_utils.in_process_broker import set_dramatiq_broker, IN_PROCESS
 
 
 def main(args):
-    """Run the application."""
+    """
+    Run the application.
+
+    With --in-process, messages are passed between the plugins in this process by reference, and no redis server is
+    started.
+    """
+    in_process = "--in-process" in args
+
+    # the broker has to be set before the plugins declare their actors
+    if in_process:
+        set_dramatiq_broker(IN_PROCESS)
 
     from device_viewer.application import DeviceViewerApplication
     from device_viewer.plugin import DeviceViewerPlugin
@@ -36,7 +48,7 @@ def main(args):
 
     app = DeviceViewerApplication(plugins=plugins)
 
-    with redis_server_context(), dramatiq_workers_context():
+    with nullcontext() if in_process else redis_server_context(), dramatiq_workers_context():
         app.run()
 
 
@@ -2,6 +2,8 @@ import os
 from dramatiq import Worker
 from contextlib import contextmanager
 
+from microdrop_utils.dramatiq_priority_lanes import remove_worker_middleware
+
 import dropbot as db
 import time
 
@@ -14,6 +16,8 @@ def worker(*args, **kwargs):
         yield worker
     finally:
         worker.stop()
+        # so the stopped worker does not consume queues declared by later tests
+        remove_worker_middleware(worker)
 
 @contextmanager
 def proxy_context(*args, **kwargs):
@@ -0,0 +1,88 @@
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from device_viewer.services.device_loading_service import DeviceLoadingService
+from device_viewer.utils.parsed_device_cache import ParsedDeviceCache
+from .common import TEST_PATH
+
+
+@pytest.fixture
+def svg_file(tmp_path):
+    shutil.copy(Path(TEST_PATH) / "device_svg_files" / "2x3device.svg", tmp_path)
+    return tmp_path / "2x3device.svg"
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = DeviceLoadingService(cache=ParsedDeviceCache(cache_dir=str(tmp_path / "cache")))
+    yield service
+
+    service.cancel()
+    service.wait(5)
+
+
+def record_stages(service):
+    """Records the stages of the loads of the service, with what each stage was called with."""
+    stages = []
+    service.on_progress = lambda fraction, message: stages.append(("progress", fraction))
+    service.on_electrodes_loaded = lambda model: stages.append(("electrodes", model))
+    service.on_connections_loaded = lambda model: stages.append(("connections", model))
+    service.on_failed = lambda error: stages.append(("failed", error))
+
+    return stages
+
+
+def test_device_loaded_in_stages(service, svg_file):
+    stages = record_stages(service)
+    loading_threads = []
+    service.dispatch = lambda callback, *args: (loading_threads.append(threading.current_thread()), callback(*args))
+
+    service.load(svg_file)
+    assert service.wait(5)
+
+    assert [name for name, _ in stages if name != "progress"] == ["electrodes", "connections"]
+    assert [fraction for name, fraction in stages if name == "progress"][-1] == 1.0
+    assert threading.main_thread() not in loading_threads
+
+    model = dict(stages)["connections"]
+    assert len(model) == 92
+    assert len(model.svg_model.connections) > 0
+
+
+def test_cancelled_load_stops_calling_back(service, svg_file):
+    stages = record_stages(service)
+    service.on_electrodes_loaded = lambda model: (stages.append(("electrodes", model)), service.cancel())
+
+    service.load(svg_file)
+    assert service.wait(5)
+
+    assert [name for name, _ in stages if name != "progress"] == ["electrodes"]
+
+
+def test_callbacks_dispatched_before_cancel_dropped(service, svg_file):
+    stages = record_stages(service)
+    dispatched = []
+    service.dispatch = lambda callback, *args: dispatched.append((callback, args))
+
+    service.load(svg_file)
+    assert service.wait(5)
+    service.cancel()
+
+    # e.g. the GUI thread running the callbacks queued by the worker thread
+    for callback, args in dispatched:
+        callback(*args)
+
+    assert stages == []
+
+
+def test_failed_load_reported(service, tmp_path):
+    stages = record_stages(service)
+
+    service.load(tmp_path / "missing.svg")
+    assert service.wait(5)
+
+    assert [name for name, _ in stages if name != "progress"] == ["failed"]
+    assert isinstance(dict(stages)["failed"], FileNotFoundError)
@@ -56,3 +56,196 @@ def test_svg_to_electrodes(svg_electrode_layer, SvgUtil):
     svg = SvgUtil()
     assert len(svg.svg_to_electrodes(svg_electrode_layer)) == 92
 
+
+
+def find_neighbours_all_pairwise(svg):
+    """The neighbours found by measuring every ordered pair of electrodes, as done before the spatial index."""
+    import numpy as np
+
+    polygons = svg.get_electrode_polygons()
+    distances = sorted([v1.buffer(-0.1).distance(v2.buffer(-0.1)) for k1, v1 in polygons.items()
+                        for k2, v2 in polygons.items() if k1 != k2])
+    average_distance = np.mean(distances[:len(svg.electrodes)])
+
+    polygons = {k: v.buffer(average_distance) for k, v in polygons.items()}
+
+    neighbours = {}
+    for k1, v1 in polygons.items():
+        for k2, v2 in polygons.items():
+            if k1 != k2 and v1.intersection(v2).area >= average_distance:
+                neighbours.setdefault(k1, []).append(k2)
+
+    return neighbours
+
+
+@pytest.mark.parametrize("svg_file", ["2x3device.svg", "device_drc.svg"])
+def test_find_neighbours_all_matches_pairwise(svg_file, SvgUtil, tmp_path):
+    from .common import TEST_PATH
+    shutil.copy(Path(TEST_PATH) / "device_svg_files" / svg_file, tmp_path)
+
+    svg = SvgUtil(tmp_path / svg_file)
+
+    assert svg.neighbours == find_neighbours_all_pairwise(svg)
+
+
+def parse_path_per_command(path):
+    """The points of an absolute path, parsed command by command, as done before the single pass parser."""
+    import numpy as np
+    from device_viewer.utils.dmf_utils import SvgUtil
+
+    moves = []
+    for match in SvgUtil.path_commands.findall(path):
+        if ("M" in match) or ("L" in match):
+            moves.append((float(match[1]), float(match[2])))
+        elif "H" in match:
+            moves.append((float(match[4]), moves[-1][1]))
+        elif "V" in match:
+            moves.append((moves[-1][0], (float(match[6]))))
+
+    return np.array(moves)
+
+
+def test_svg_to_electrodes_matches_per_command(svg_electrode_layer, SvgUtil):
+    import numpy as np
+
+    electrodes = SvgUtil().svg_to_electrodes(svg_electrode_layer)
+
+    for element in svg_electrode_layer:
+        expected = parse_path_per_command(element.attrib["d"])
+        assert np.array_equal(electrodes[element.attrib["id"]]["path"], expected)
+
+
+def test_parse_paths_relative_commands(SvgUtil):
+    import numpy as np
+
+    points, offsets = SvgUtil.parse_paths(["M 0,0 H 10 V 5 Z H 3",
+                                           "m 1,1 l 2,0 v 3 h -1 z m 1,1 h 2",
+                                           "M 0,0 H 10 V 5 Z H 3 l 1,1"])
+
+    assert offsets.tolist() == [0, 4, 10, 15]
+    # closing a path moves back to its start, the next commands carry on from it
+    assert np.array_equal(points[:4], [[0, 0], [10, 0], [10, 5], [3, 0]])
+    assert np.array_equal(points[4:10], [[1, 1], [3, 1], [3, 4], [2, 4], [2, 2], [4, 2]])
+    # the same whether the path has relative commands or not
+    assert np.array_equal(points[10:], [[0, 0], [10, 0], [10, 5], [3, 0], [4, 1]])
+
+
+def test_parse_paths_implicit_repeated_commands(SvgUtil):
+    import numpy as np
+
+    # coordinate pairs after a move are lines, extra numbers after a line repeat it, as saved by SVG editors
+    points, offsets = SvgUtil.parse_paths(["m 0,0 10,0 0,10 z",
+                                           "M 0,0 10,0 10,10 Z",
+                                           "M 0,0 L 1,1 2,2 H 5 6 v 3 4 z"])
+
+    assert offsets.tolist() == [0, 3, 6, 13]
+    assert np.array_equal(points[:3], [[0, 0], [10, 0], [10, 10]])
+    assert np.array_equal(points[3:6], [[0, 0], [10, 0], [10, 10]])
+    assert np.array_equal(points[6:], [[0, 0], [1, 1], [2, 2], [5, 2], [6, 2], [6, 5], [6, 9]])
+
+
+@pytest.mark.parametrize("path, message", [("M 0,0 C 1,1 2,2 3,3", "Unsupported path commands C"),
+                                           ("M 0,0 10", "3 numbers after command M"),
+                                           ("M 0,0 Z 1", "1 numbers after command Z")])
+def test_parse_paths_invalid_path(SvgUtil, path, message):
+    with pytest.raises(ValueError, match=message):
+        SvgUtil.parse_paths([path])
+
+
+def parsed_device(svg):
+    """Everything parsed from a device file, as bytes to be compared exactly."""
+    return ({k: (v['channel'], v['path'].tobytes(), v['path'].shape) for k, v in svg.electrodes.items()},
+            [(path.tobytes(), path.shape) for path in svg.roi],
+            (svg.max_x, svg.max_y, svg.min_x, svg.min_y),
+            svg.neighbours,
+            {k: (a.tobytes(), b.tobytes()) for k, (a, b) in svg.connections.items()})
+
+
+@pytest.mark.parametrize("svg_file", ["2x3device.svg", "device_drc.svg"])
+def test_cached_device_matches_parsed(svg_file, SvgUtil, tmp_path):
+    from .common import TEST_PATH
+    from device_viewer.utils.parsed_device_cache import ParsedDeviceCache
+
+    shutil.copy(Path(TEST_PATH) / "device_svg_files" / svg_file, tmp_path)
+    cache = ParsedDeviceCache(cache_dir=str(tmp_path / "cache"))
+
+    parsed = SvgUtil(tmp_path / svg_file, cache=cache)
+    cached = SvgUtil(tmp_path / svg_file, cache=cache)
+
+    assert (cache.miss_count, cache.hit_count) == (1, 1)
+    assert parsed_device(cached) == parsed_device(parsed)
+
+
+def test_device_cache_evicts_least_recently_used(tmp_path):
+    import numpy as np
+    from device_viewer.utils.parsed_device_cache import ParsedDeviceCache
+
+    cache = ParsedDeviceCache(cache_dir=str(tmp_path))
+    for key in ["first", "second", "third"]:
+        cache.store(key, {"points": np.zeros((1000, 2))})
+        os.utime(tmp_path / f"{key}.npz", (0, len(os.listdir(tmp_path))))
+
+    # used last, so kept over the second entry
+    cache.load("first")
+    cache.max_size_bytes = 2 * os.path.getsize(tmp_path / "first.npz")
+    cache.evict()
+
+    assert sorted(os.listdir(tmp_path)) == ["first.npz", "third.npz"]
+
+
+def test_device_cache_failed_write_leaves_no_file(tmp_path, monkeypatch):
+    import numpy as np
+    from device_viewer.utils.parsed_device_cache import ParsedDeviceCache
+
+    def savez(file, **arrays):
+        file.write(b"partly written")
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(np, "savez", savez)
+
+    cache = ParsedDeviceCache(cache_dir=str(tmp_path))
+    cache.store("key", {"points": np.zeros((4, 2))})
+
+    assert os.listdir(tmp_path) == []
+    assert cache.load("key") is None
+
+
+def test_device_cache_entry_evicted_while_loaded(tmp_path, monkeypatch):
+    import numpy as np
+    from device_viewer.utils.parsed_device_cache import ParsedDeviceCache
+
+    cache = ParsedDeviceCache(cache_dir=str(tmp_path))
+    cache.store("key", {"points": np.zeros((4, 2))})
+
+    # removed by another process right after its arrays were read
+    def utime(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", utime)
+
+    assert cache.load("key")["points"].shape == (4, 2)
+    assert cache.hit_count == 1
+
+
+def test_loading_does_not_write_file(clean_svg, SvgUtil):
+    # a fill left to normalize
+    clean_svg.write_text(clean_svg.read_text().replace("fill:#000000", "fill:#ff0000", 1))
+    contents = clean_svg.read_bytes()
+    os.chmod(clean_svg, 0o444)
+
+    svg = SvgUtil(clean_svg)
+
+    assert len(svg.electrodes) == 92
+    assert clean_svg.read_bytes() == contents
+
+
+def test_normalize_file_only_writes_changed_fills(clean_svg, SvgUtil):
+    clean_svg.write_text(clean_svg.read_text().replace("fill:#000000", "fill:#ff0000", 1))
+    svg = SvgUtil(clean_svg)
+
+    assert svg.normalize_file()
+    assert "fill:#ff0000" not in clean_svg.read_text()
+
+    normalized_mtime = os.stat(clean_svg).st_mtime_ns
+    assert not svg.normalize_file()
+    assert os.stat(clean_svg).st_mtime_ns == normalized_mtime
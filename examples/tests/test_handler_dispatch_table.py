@@ -0,0 +1,37 @@
+import gc
+import weakref
+
+from traits.api import HasTraits, Str
+
+from microdrop_utils.dramatiq_controller_base import get_handler_dispatch_table
+
+
+class Controller(HasTraits):
+    name = Str("controller")
+
+    def _on_halt_triggered(self, message):
+        self.name = message
+
+
+def test_dispatch_table_built_once_per_pattern():
+    controller = Controller()
+
+    table = get_handler_dispatch_table(controller)
+
+    assert get_handler_dispatch_table(controller) is table
+    assert get_handler_dispatch_table(controller, "on_{topic}_request") is not table
+    assert table.dispatch("dropbot/requests/halt", "halted")
+    assert controller.name == "halted"
+    # the tables are not added as a trait of the controller
+    assert "_handler_dispatch_tables" not in controller.trait_names()
+
+
+def test_dispatch_table_collected_with_its_object():
+    controller = Controller()
+    get_handler_dispatch_table(controller).dispatch("dropbot/requests/halt", "halted")
+    controller_ref = weakref.ref(controller)
+
+    del controller
+    gc.collect()
+
+    assert controller_ref() is None
@@ -0,0 +1,164 @@
+import queue
+import threading
+
+import pytest
+
+from microdrop_utils.hardware_command_executor import HardwareCommandExecutor, HardwareCommandCancelled, \
+    HALT_PRIORITY, BACKGROUND_PRIORITY
+
+
+class FakeProxy:
+    """
+    Records the calls made to it along with the thread they were made from.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def record(self, name):
+        self.calls.append((name, threading.current_thread().name))
+        return name
+
+
+@pytest.fixture
+def executor():
+    executor = HardwareCommandExecutor(name="test_executor", proxy=FakeProxy(), max_queue_size=4, submit_timeout=0.1)
+    executor.start()
+
+    yield executor
+
+    executor.stop(timeout=1)
+
+
+@pytest.fixture
+def blocked_executor(executor):
+    """
+    Executor busy running a command until the event yielded along with it is set, so submitted commands stay queued.
+    """
+    running = threading.Event()
+    release = threading.Event()
+
+    def block(proxy):
+        running.set()
+        release.wait(1)
+
+    executor.submit("block", block)
+    running.wait(1)
+
+    yield executor, release
+
+    release.set()
+
+
+def test_commands_run_on_executor_thread(executor):
+    assert executor.call("read", lambda proxy: proxy.record("read")) == "read"
+    assert executor.proxy.calls == [("read", "test_executor")]
+
+
+def test_halt_preempts_queued_commands(blocked_executor):
+    executor, release = blocked_executor
+
+    self_test = executor.submit("self_test", lambda proxy: proxy.record("self_test"), priority=BACKGROUND_PRIORITY)
+    voltage = executor.submit("set_voltage", lambda proxy: proxy.record("set_voltage"))
+    halt = executor.submit("halt", lambda proxy: proxy.record("halt"), priority=HALT_PRIORITY, preempt=True)
+
+    release.set()
+    assert halt.wait(1) == "halt"
+
+    # the queued commands are dropped rather than run after the halt
+    for command in (self_test, voltage):
+        with pytest.raises(HardwareCommandCancelled):
+            command.wait(1)
+
+    assert [name for name, _ in executor.proxy.calls] == ["halt"]
+    assert executor.cancelled_command_count == 2
+
+
+def test_writes_to_the_same_register_merged(blocked_executor):
+    executor, release = blocked_executor
+
+    writes = [executor.submit("set_state_of_channels", lambda proxy, i=i: proxy.record(f"state_{i}"),
+                              register="state_of_channels") for i in range(5)]
+    voltage = executor.submit("set_voltage", lambda proxy: proxy.record("set_voltage"), register="voltage")
+
+    # every write returns the write still queued
+    assert all(write is writes[0] for write in writes)
+
+    release.set()
+    voltage.wait(1)
+
+    # the merged write keeps its place in the queue, with the last value
+    assert [name for name, _ in executor.proxy.calls] == ["state_4", "set_voltage"]
+    assert executor.merged_command_count == 4
+
+
+def test_command_latencies_reported(blocked_executor):
+    executor, release = blocked_executor
+
+    command = executor.submit("read", lambda proxy: proxy.record("read"))
+    release.set()
+    command.wait(1)
+
+    assert command.queue_wait > 0
+    assert command.execution_duration > 0
+
+    stats = executor.get_latency_stats()
+    assert stats["read"]["count"] == 1
+    assert stats["read"]["max_queue_wait"] == pytest.approx(command.queue_wait)
+    assert stats["block"]["mean_execution_duration"] > 0
+
+
+def test_full_queue_rejects_commands_but_halt(blocked_executor):
+    executor, release = blocked_executor
+
+    for i in range(executor.max_queue_size):
+        executor.submit(f"read_{i}", lambda proxy: None)
+
+    with pytest.raises(queue.Full):
+        executor.submit("read", lambda proxy: None)
+
+    halt = executor.submit("halt", lambda proxy: proxy.record("halt"), priority=HALT_PRIORITY, preempt=True)
+    release.set()
+
+    assert halt.wait(1) == "halt"
+
+
+def test_done_callbacks_called_once_run_or_cancelled(blocked_executor):
+    executor, release = blocked_executor
+    done = []
+
+    read = executor.submit("read", lambda proxy: proxy.record("read"))
+    read.add_done_callback(lambda command: done.append((command.name, command.result, command.cancelled)))
+    self_test = executor.submit("self_test", lambda proxy: None, priority=BACKGROUND_PRIORITY)
+    self_test.add_done_callback(lambda command: done.append((command.name, command.result, command.cancelled)))
+
+    # cancelled by a command preempting background ones, then run
+    executor.submit("set_voltage", lambda proxy: None, preempt=True)
+    assert done == [("self_test", None, True)]
+
+    release.set()
+    read.wait(1)
+    assert done[1:] == [("read", "read", False)]
+
+    # called right away once done
+    read.add_done_callback(lambda command: done.append("late"))
+    assert done[-1] == "late"
+
+
+def test_halt_waits_for_running_command_only(blocked_executor):
+    executor, release = blocked_executor
+
+    # a long operation split in several background commands, the first of which is running
+    tests = [executor.submit(f"self_test_{i}", lambda proxy, i=i: proxy.record(f"self_test_{i}"),
+                             priority=BACKGROUND_PRIORITY) for i in range(3)]
+    halt = executor.submit("halt", lambda proxy: proxy.record("halt"), priority=HALT_PRIORITY, preempt=True)
+
+    # the running command cannot be interrupted
+    assert not halt.done.wait(0.05)
+
+    release.set()
+    assert halt.wait(1) == "halt"
+
+    # but the halt runs right after it, and the rest of the operation is dropped
+    assert [name for name, _ in executor.proxy.calls] == ["halt"]
+    assert all(test.cancelled for test in tests)
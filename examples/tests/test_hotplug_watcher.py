@@ -0,0 +1,68 @@
+import queue
+import time
+
+import pytest
+
+from microdrop_utils.hotplug_watcher import DeviceHotplugWatcher
+
+pytestmark = pytest.mark.skipif(not DeviceHotplugWatcher.is_supported(), reason="inotify is not available")
+
+
+@pytest.fixture
+def device_dir(tmp_path):
+    """A fake device directory, standing for /dev."""
+    return tmp_path
+
+
+@pytest.fixture
+def watcher(device_dir):
+    devices_added = queue.Queue()
+
+    watcher = DeviceHotplugWatcher(device_dir=str(device_dir), settle_delay=0, on_device_added=devices_added.put)
+    watcher.start()
+
+    yield watcher, devices_added
+
+    watcher.stop(timeout=1)
+
+
+def test_rescan_on_start(watcher):
+    _, devices_added = watcher
+
+    assert devices_added.get(timeout=1) is None
+
+
+def test_matching_device_added(watcher, device_dir):
+    _, devices_added = watcher
+    devices_added.get(timeout=1)
+
+    (device_dir / "ttyS0").touch()
+    (device_dir / "null2").touch()
+    (device_dir / "ttyACM0").touch()
+
+    # only the device matching the pattern is reported
+    assert devices_added.get(timeout=1) == str(device_dir / "ttyACM0")
+    assert devices_added.empty()
+
+
+def test_devices_ignored_while_paused(watcher, device_dir):
+    hotplug_watcher, devices_added = watcher
+    devices_added.get(timeout=1)
+
+    hotplug_watcher.pause()
+    (device_dir / "ttyACM0").touch()
+    # for the watcher thread to get the event while paused
+    time.sleep(0.2)
+
+    # resuming rescans the devices there
+    hotplug_watcher.resume()
+    assert devices_added.get(timeout=1) is None
+
+    (device_dir / "ttyUSB1").touch()
+    assert devices_added.get(timeout=1) == str(device_dir / "ttyUSB1")
+    assert devices_added.empty()
+
+
+def test_missing_device_dir_raises(tmp_path):
+    with pytest.raises(OSError):
+        DeviceHotplugWatcher(device_dir=str(tmp_path / "missing")).start()
@@ -0,0 +1,221 @@
+import dramatiq
+import pytest
+
+from .common import worker
+from microdrop_utils.in_process_broker import set_dramatiq_broker, IN_PROCESS
+
+
+@pytest.fixture
+def in_process_broker():
+    """
+    Fixture setting an in-process broker for the test, no redis server needed. Actors are declared on the broker set
+    when they are created, so they have to be created within the test.
+    """
+    previous_broker = dramatiq.get_broker()
+    broker = set_dramatiq_broker(IN_PROCESS)
+
+    yield broker
+
+    broker.flush_all()
+    dramatiq.set_broker(previous_broker)
+
+
+def test_message_routed_by_reference(in_process_broker):
+    from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterActor, publish_message
+
+    router_actor = MessageRouterActor()
+    received = []
+
+    @dramatiq.actor
+    def put_in_process(message, topic):
+        received.append(message)
+
+    router_actor.message_router_data.add_subscriber_to_topic(topic="in_process/#",
+                                                              subscribing_actor_name="put_in_process")
+
+    # a typed payload no message codec could encode
+    payload = {"electrodes": {1, 2, 3}}
+
+    try:
+        publish_message(payload, "in_process/electrodes")
+
+        with worker(in_process_broker, worker_timeout=100) as current_worker:
+            in_process_broker.join("default")
+            current_worker.join()
+    finally:
+        router_actor.message_router_data.remove_subscriber_from_topic(topic="in_process/#",
+                                                                       subscribing_actor_name="put_in_process")
+
+    # the subscriber gets the very object that was published
+    assert len(received) == 1
+    assert received[0] is payload
+
+
+def test_conflated_message_passed_by_reference(in_process_broker):
+    from microdrop_utils.dramatiq_controller_base import DramatiqControllerBase
+    from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterActor
+
+    router_actor = MessageRouterActor()
+    received = []
+
+    # conflated messages are taken from the latest value store by the listener actor of a dramatiq controller
+    DramatiqControllerBase(listener_name="put_in_process_conflated",
+                           listener_actor_method=lambda message, topic: received.append(message))
+
+    router_data = router_actor.message_router_data
+    router_data.add_subscriber_to_topic(topic="in_process/telemetry", subscribing_actor_name="put_in_process_conflated",
+                                        conflate=True)
+
+    readings = [{"capacitance": i} for i in range(5)]
+
+    try:
+        for reading in readings:
+            router_actor.route_message(reading, "in_process/telemetry")
+    finally:
+        router_data.remove_subscriber_from_topic(topic="in_process/telemetry",
+                                                 subscribing_actor_name="put_in_process_conflated")
+
+    with worker(in_process_broker, worker_timeout=100) as current_worker:
+        in_process_broker.join("default")
+        current_worker.join()
+
+    # only the latest reading is delivered, as is
+    assert len(received) == 1
+    assert received[0] is readings[-1]
+
+
+def test_dedicated_queue_consumed_by_its_own_worker(in_process_broker):
+    import threading
+    import time
+
+    from microdrop_utils.broker_server_helpers import DedicatedQueueWorkers
+    from microdrop_utils.dramatiq_actor_concurrency import set_actor_concurrency
+    from microdrop_utils.dramatiq_controller_base import DramatiqControllerBase
+    from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterActor
+    from microdrop_utils.dramatiq_priority_lanes import PriorityLaneWorker, remove_worker_middleware
+
+    # several worker threads on the dedicated queue, but at most one message handled at once
+    set_actor_concurrency("put_dedicated", queue="test_dedicated", worker_threads=4, concurrency_limit=1)
+
+    dedicated_queue_workers = DedicatedQueueWorkers(worker_timeout=100)
+    in_process_broker.add_middleware(dedicated_queue_workers)
+
+    # the shared lane worker started before the dedicated queue was declared must leave it alone
+    lane_worker = PriorityLaneWorker(in_process_broker, worker_timeout=100)
+    lane_worker.start()
+
+    lock = threading.Lock()
+    handled = []
+    running = [0]
+    max_running = [0]
+
+    def handle(message, topic):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+            handled.append((message, threading.current_thread()))
+
+    router_actor = MessageRouterActor()
+    DramatiqControllerBase(listener_name="put_dedicated", listener_actor_method=handle)
+
+    router_data = router_actor.message_router_data
+    router_data.add_subscriber_to_topic(topic="dedicated/requests/#", subscribing_actor_name="put_dedicated")
+
+    try:
+        # routed as is to the dedicated queue, not to a priority lane
+        assert router_data.get_routes_for_topic("dedicated/requests/move") == [("put_dedicated", "test_dedicated",
+                                                                               False)]
+
+        for i in range(8):
+            router_actor.route_message(i, "dedicated/requests/move")
+
+        in_process_broker.join("test_dedicated")
+        dedicated_queue_workers.workers["test_dedicated"].join()
+    finally:
+        router_data.remove_subscriber_from_topic(topic="dedicated/requests/#", subscribing_actor_name="put_dedicated")
+        dedicated_queue_workers.stop(in_process_broker)
+        lane_worker.stop()
+        remove_worker_middleware(lane_worker)
+
+    assert sorted(message for message, _ in handled) == list(range(8))
+    assert max_running[0] == 1
+
+    dedicated_worker_threads = set(dedicated_queue_workers.workers["test_dedicated"].workers)
+    assert all(thread in dedicated_worker_threads for _, thread in handled)
+
+
+def test_critical_message_overtakes_flooded_dedicated_queue(in_process_broker):
+    import threading
+    import time
+
+    from microdrop_utils.broker_server_helpers import DedicatedQueueWorkers
+    from microdrop_utils.dramatiq_actor_concurrency import set_actor_concurrency
+    from microdrop_utils.dramatiq_controller_base import DramatiqControllerBase
+    from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterActor, set_topic_priority_lane
+    from microdrop_utils.dramatiq_priority_lanes import PriorityLaneWorker, CRITICAL, remove_worker_middleware
+
+    # one ordered lane for a hardware actor, with halt requests on the critical lane
+    set_actor_concurrency("put_hardware", queue="test_hardware", worker_threads=1)
+    set_topic_priority_lane("hardware/requests/halt", CRITICAL)
+
+    dedicated_queue_workers = DedicatedQueueWorkers(worker_timeout=100)
+    in_process_broker.add_middleware(dedicated_queue_workers)
+
+    # the shared critical lane worker must leave the critical queue of the dedicated queue alone
+    critical_lane_worker = PriorityLaneWorker(in_process_broker, lane=CRITICAL, worker_timeout=100)
+    critical_lane_worker.start()
+
+    handled = []
+    halt_handled = threading.Event()
+
+    def handle(message, topic):
+        if topic.endswith("halt"):
+            handled.append((message, time.perf_counter(), threading.current_thread()))
+            halt_handled.set()
+            return
+
+        time.sleep(0.01)
+        handled.append((message, time.perf_counter(), threading.current_thread()))
+
+    router_actor = MessageRouterActor()
+    DramatiqControllerBase(listener_name="put_hardware", listener_actor_method=handle)
+
+    router_data = router_actor.message_router_data
+    router_data.add_subscriber_to_topic(topic="hardware/requests/#", subscribing_actor_name="put_hardware")
+
+    try:
+        assert router_data.get_routes_for_topic("hardware/requests/halt") == [("put_hardware",
+                                                                               "test_hardware.critical", False)]
+
+        # about a second of queued requests
+        for i in range(100):
+            router_actor.route_message(i, "hardware/requests/move")
+
+        time.sleep(0.05)
+        halt_sent = time.perf_counter()
+        router_actor.route_message("halt", "hardware/requests/halt")
+
+        assert halt_handled.wait(timeout=1)
+
+        in_process_broker.join("test_hardware")
+        dedicated_queue_workers.workers["test_hardware"].join()
+    finally:
+        router_data.remove_subscriber_from_topic(topic="hardware/requests/#", subscribing_actor_name="put_hardware")
+        dedicated_queue_workers.stop(in_process_broker)
+        critical_lane_worker.stop()
+        remove_worker_middleware(critical_lane_worker)
+        set_topic_priority_lane("hardware/requests/halt", "control")
+
+    messages = [message for message, _, _ in handled]
+    halt_index = messages.index("halt")
+    _, halt_time, halt_thread = handled[halt_index]
+
+    # the halt waited for the request being handled at most, not for the requests queued before it
+    assert halt_time - halt_sent < 0.1
+    assert len(messages) - halt_index > 50
+    # the requests kept their order, on the one dedicated worker thread
+    assert [message for message in messages if message != "halt"] == list(range(100))
+    assert halt_thread in set(dedicated_queue_workers.workers["test_hardware"].workers)
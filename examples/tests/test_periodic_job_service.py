@@ -0,0 +1,77 @@
+import queue
+
+import pytest
+
+from microdrop_utils.periodic_job_service import PeriodicJobService
+
+
+@pytest.fixture
+def service():
+    service = PeriodicJobService(max_worker_threads=2)
+
+    yield service
+
+    service.shutdown()
+
+
+def test_job_replaced_under_same_name(service):
+    runs = queue.Queue()
+
+    for value in range(3):
+        service.add_or_replace_job("poll", lambda value=value: value, interval_s=0.05, on_result=runs.put)
+
+    assert [job.id for job in service.scheduler.get_jobs()] == ["poll"]
+    # only the last job added runs
+    assert runs.get(timeout=1) == 2
+
+
+def test_job_paused_and_resumed(service):
+    runs = queue.Queue()
+
+    job = service.add_or_replace_job("poll", lambda: "ran", interval_s=0.05, on_result=runs.put)
+    runs.get(timeout=1)
+
+    job.pause()
+    assert job.paused
+    # a run already started may still land
+    while not runs.empty():
+        runs.get()
+    with pytest.raises(queue.Empty):
+        runs.get(timeout=0.2)
+
+    job.resume()
+    assert not job.paused
+    assert runs.get(timeout=1) == "ran"
+
+
+def test_missing_job_ignored(service):
+    assert not service.pause_job("missing")
+    assert not service.resume_job("missing")
+    assert not service.remove_job("missing")
+
+
+def test_job_stats_and_thread_count(service):
+    runs = queue.Queue()
+
+    def fail():
+        runs.put("failed")
+        raise ValueError("poll failed")
+
+    service.add_or_replace_job("poll", lambda: "ran", interval_s=0.05, on_result=runs.put)
+    service.add_or_replace_job("failing_poll", fail, interval_s=0.05)
+    for _ in range(4):
+        runs.get(timeout=1)
+
+    service.pause_job("poll")
+    stats = service.get_job_stats()
+
+    assert stats["poll"]["paused"]
+    assert stats["poll"]["run_count"] >= 1
+    assert stats["poll"]["error_count"] == 0
+    assert stats["poll"]["max_run_time"] >= stats["poll"]["mean_run_time"] > 0
+
+    assert not stats["failing_poll"]["paused"]
+    assert stats["failing_poll"]["error_count"] == stats["failing_poll"]["run_count"] >= 1
+
+    # the scheduler thread, and at most the worker threads allowed
+    assert 2 <= service.thread_count <= 1 + service.max_worker_threads
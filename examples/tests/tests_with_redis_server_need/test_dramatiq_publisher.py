@@ -29,3 +29,146 @@ def test_publish_message_can_send_messages_to_actors():
     broker.actors.clear()
 
 
+def test_publish_many_can_send_messages_to_multiple_actors():
+
+    from microdrop_utils.dramatiq_pub_sub_helpers import publish_many, build_message
+
+    # Given that I have two databases
+    database1 = {}
+    database2 = {}
+
+    # And actors that can write data to these databases
+    @dramatiq.actor
+    def put_many1(message, topic):
+        database1[topic] = message
+
+    @dramatiq.actor
+    def put_many2(message, topic):
+        database2[topic] = message
+
+    # If I publish one message to each actor in one go
+    publish_many([build_message("test1", "test", "put_many1"), build_message("test2", "test", "put_many2")])
+
+    # And I give the workers time to process the messages
+    broker = dramatiq.get_broker()
+    with worker(broker, worker_timeout=100) as current_worker:
+        broker.join("default")
+        current_worker.join()
+
+    # I expect both databases to be populated
+    assert database1 == {"test": "test1"}
+    assert database2 == {"test": "test2"}
+
+    broker.actors.clear()
+
+
+def test_publish_many_sends_messages_in_one_pipeline_through_enqueue():
+
+    from dramatiq.brokers.redis import RedisBroker
+    from microdrop_utils.dramatiq_pub_sub_helpers import publish_many, build_message
+
+    broker = dramatiq.get_broker()
+    assert isinstance(broker, RedisBroker)
+
+    # Given that I count the pipelines sent and the messages enqueued
+    pipelines = []
+    original_pipeline = broker.client.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        pipeline = original_pipeline(*args, **kwargs)
+        pipelines.append(pipeline)
+        return pipeline
+
+    class EnqueueCounter(dramatiq.Middleware):
+        def __init__(self):
+            self.enqueued = []
+
+        def after_enqueue(self, broker, message, delay):
+            self.enqueued.append(message.args[0])
+
+    counter = EnqueueCounter()
+    broker.add_middleware(counter)
+    broker.client.pipeline = counting_pipeline
+
+    database = {}
+
+    @dramatiq.actor
+    def put_pipelined(message, topic):
+        database[message] = topic
+
+    try:
+        # If I publish several messages in one go
+        publish_many([build_message(f"test{i}", "test", "put_pipelined") for i in range(5)])
+    finally:
+        broker.client.pipeline = original_pipeline
+        broker.middleware.remove(counter)
+
+    with worker(broker, worker_timeout=100) as current_worker:
+        broker.join("default")
+        current_worker.join()
+
+    # I expect one pipeline for all of them, each enqueued through the broker
+    assert len(pipelines) == 1
+    assert counter.enqueued == [f"test{i}" for i in range(5)]
+    assert sorted(database) == [f"test{i}" for i in range(5)]
+
+    broker.actors.clear()
+
+
+def test_publish_message_sends_typed_payloads_with_msgpack_codec():
+
+    from microdrop_utils.dramatiq_pub_sub_helpers import publish_message
+    from microdrop_utils.dramatiq_message_codec import set_message_codec, JSON, MSGPACK
+
+    # Given that I have a database
+    database = {}
+
+    # And an actor that can write data to that database
+    @dramatiq.actor
+    def put_typed(message, topic):
+        database[topic] = message
+
+    # If I publish a typed channel states payload with the msgpack codec, and a legacy JSON payload with the JSON codec
+    set_message_codec(MSGPACK)
+    try:
+        publish_message({1: True, 2: False}, "typed", "put_typed")
+    finally:
+        set_message_codec(JSON)
+
+    publish_message('{"1": true}', "legacy", "put_typed")
+
+    # And I give msgpack workers time to process the messages
+    set_message_codec(MSGPACK)
+    broker = dramatiq.get_broker()
+    try:
+        with worker(broker, worker_timeout=100) as current_worker:
+            broker.join("default")
+            current_worker.join()
+    finally:
+        set_message_codec(JSON)
+
+    # I expect both payloads to arrive as they were published
+    assert database == {"typed": {1: True, 2: False}, "legacy": '{"1": true}'}
+
+    broker.actors.clear()
+
+
+def test_message_codec_is_read_from_the_environment(monkeypatch):
+
+    from microdrop_utils.dramatiq_message_codec import set_message_codec, MsgpackEncoder, MESSAGE_CODEC_ENV_VAR, JSON
+
+    # Given that the processes of an app are configured to use the msgpack codec
+    monkeypatch.setenv(MESSAGE_CODEC_ENV_VAR, "msgpack")
+
+    # If I set up the codec of this process without naming one
+    set_message_codec()
+    try:
+        # I expect the configured codec to be used
+        assert isinstance(dramatiq.get_encoder(), MsgpackEncoder)
+
+        # And a JSON configuration to be honoured too
+        monkeypatch.setenv(MESSAGE_CODEC_ENV_VAR, "JSON")
+        set_message_codec()
+        assert isinstance(dramatiq.get_encoder(), dramatiq.JSONEncoder)
+    finally:
+        set_message_codec(JSON)
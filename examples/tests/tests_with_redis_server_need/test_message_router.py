@@ -76,6 +76,171 @@ class TestMessageRouterData:
         router_data.add_subscriber_to_topic(sub, "test_actor")
         assert ("test_actor", "default") not in router_data.get_subscribers_for_topic(topic)
 
+    def test_subscription_trie_reused_until_subscriptions_change(self, router_data):
+        """
+        Test that the subscription trie is only rebuilt when the stored subscriptions change.
+        """
+        router_data.add_subscriber_to_topic("foo/+", "actor1")
+        router_data.get_subscribers_for_topic("foo/bar")
+        matcher = router_data._subscription_matcher
+
+        router_data.get_subscribers_for_topic("foo/baz")
+        assert router_data._subscription_matcher is matcher
+
+        router_data.add_subscriber_to_topic("foo/#", "actor2")
+        assert sorted(router_data.get_subscribers_for_topic("foo/bar")) == [("actor1", "default"),
+                                                                             ("actor2", "default")]
+        assert router_data._subscription_matcher is not matcher
+
+    def test_subscription_trie_sees_other_router_changes(self, router_data):
+        """
+        Test that subscriptions added by another router sharing the same redis hash are picked up.
+        """
+        from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterData
+
+        other_router_data = MessageRouterData(listener_queue="other_queue")
+
+        router_data.add_subscriber_to_topic("foo/bar", "actor1")
+        assert router_data.get_subscribers_for_topic("foo/bar") == [("actor1", "default")]
+
+        other_router_data.add_subscriber_to_topic("foo/+", "actor2")
+        assert sorted(router_data.get_subscribers_for_topic("foo/bar")) == [("actor1", "default"),
+                                                                             ("actor2", "other_queue")]
+
+        other_router_data.remove_subscriber_from_topic("foo/+", "actor2")
+        assert router_data.get_subscribers_for_topic("foo/bar") == [("actor1", "default")]
+
+    def test_add_subscribers_to_topics(self, router_data):
+        """
+        Test adding many subscriptions at once, and that adding them again does not change the subscriptions version.
+        """
+        router_data.add_subscribers_to_topics([("x", "actor1", False), ("x", "actor2", True), ("y/#", "actor1", False)])
+
+        assert router_data.topic_subscriber_map == {"x": [["actor1", "default"], ["actor2", "default"]],
+                                                    "y/#": [["actor1", "default"]]}
+        assert sorted(router_data.get_routes_for_topic("x")) == [("actor1", "default", False),
+                                                                  ("actor2", "default", True)]
+
+        version = router_data.subscription_store.get_version()
+        router_data.add_subscribers_to_topics([("x", "actor1", False), ("x", "actor2", True)])
+        assert router_data.subscription_store.get_version() == version
+
+    def test_concurrent_routers_keep_each_others_subscriptions(self, router_data):
+        """
+        Test that routers adding subscribers to the same topic at the same time do not overwrite each other.
+        """
+        import threading
+        from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterData
+
+        def subscribe(queue):
+            other_router_data = MessageRouterData(listener_queue=queue)
+            for i in range(20):
+                other_router_data.add_subscriber_to_topic("shared/topic", f"actor{i}")
+
+        threads = [threading.Thread(target=subscribe, args=(f"queue{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(router_data.get_subscribers_for_topic("shared/topic")) == 80
+
+    def test_priority_lanes_shared_with_other_routers(self, router_data):
+        """
+        Test that the priority lanes stored by the router of another process are used by this process' router and
+        publishers, which did not add them.
+        """
+        from microdrop_utils.dramatiq_priority_lanes import CRITICAL, DEFAULT_PRIORITY_LANE
+        from microdrop_utils.dramatiq_pub_sub_helpers import get_topic_priority_lane, set_topic_priority_lane
+
+        router_data.add_subscriber_to_topic("shared_lanes/halt", "actor1")
+        assert router_data.get_routes_for_topic("shared_lanes/halt") == [("actor1", "default", False)]
+
+        try:
+            # what add_topic_priority_lanes stores from another process
+            router_data.subscription_store.set_priority_lanes({"shared_lanes/halt": CRITICAL})
+
+            assert router_data.get_routes_for_topic("shared_lanes/halt") == [("actor1", "default.critical", False)]
+            assert get_topic_priority_lane("shared_lanes/halt") == CRITICAL
+        finally:
+            set_topic_priority_lane("shared_lanes/halt", DEFAULT_PRIORITY_LANE)
+
+    def test_expired_lease_subscriptions_garbage_collected(self, router_data):
+        """
+        Test that the subscriptions and the queue of a router that stopped renewing its lease are garbage collected,
+        while the ones of live routers and of routers with no lease are kept.
+        """
+        from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterData, build_message
+        from microdrop_utils.subscription_leases import SubscriptionLease
+
+        broker = dramatiq.get_broker()
+
+        dead_router_data = MessageRouterData(listener_queue="dead_queue")
+        live_router_data = MessageRouterData(listener_queue="live_queue")
+
+        dead_lease = SubscriptionLease(subscription_store=dead_router_data.subscription_store, queue_name="dead_queue")
+        live_lease = SubscriptionLease(subscription_store=live_router_data.subscription_store, queue_name="live_queue")
+
+        dead_lease.heartbeat()
+        dead_router_data.add_subscriber_to_topic("lease/topic", "actor1", conflate=True)
+        live_router_data.add_subscriber_to_topic("lease/topic", "actor1")
+        router_data.add_subscriber_to_topic("lease/topic", "actor1")
+
+        # the dead router's last heartbeat was long ago
+        dead_router_data.subscription_store.renew_lease("dead_queue", 1)
+
+        # a message is left behind in the dead router's queue
+        broker.declare_queue("dead_queue")
+        broker.enqueue(build_message("orphaned", "lease/topic", "actor1", queue_name="dead_queue"))
+
+        live_lease.heartbeat()
+
+        assert sorted(router_data.get_subscribers_for_topic("lease/topic")) == [("actor1", "default"),
+                                                                                 ("actor1", "live_queue")]
+        assert not broker.client.smembers(router_data.subscription_store.conflated_key_name)
+        assert broker.client.llen(f"{broker.namespace}:dead_queue") == 0
+        assert live_lease.metrics == {"live_queues": 1, "orphaned_queues": 0, "collected_queues": 1}
+
+        # on a clean stop, the subscriptions go right away
+        live_lease.release()
+        assert router_data.get_subscribers_for_topic("lease/topic") == [("actor1", "default")]
+
+    @pytest.mark.parametrize("released", [False, True])
+    def test_dedicated_queue_subscriptions_go_with_router_lease(self, router_data, released):
+        """
+        Test that the subscriptions of an actor on its dedicated queue are dropped, and its queues flushed, once the
+        lease of the router that subscribed it expires or is released.
+        """
+        from dramatiq.common import current_millis
+        from microdrop_utils.dramatiq_actor_concurrency import set_actor_concurrency
+        from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterData, build_message
+        from microdrop_utils.subscription_leases import SubscriptionLease
+
+        broker = dramatiq.get_broker()
+        set_actor_concurrency("leased_hardware_listener", queue="leased_hardware")
+
+        leasing_router_data = MessageRouterData(listener_queue="leasing_queue")
+        lease = SubscriptionLease(subscription_store=leasing_router_data.subscription_store,
+                                  queue_name="leasing_queue", dedicated_queues=["leased_hardware"])
+
+        lease.heartbeat()
+        leasing_router_data.add_subscriber_to_topic("lease/hardware", "leased_hardware_listener")
+        assert router_data.get_subscribers_for_topic("lease/hardware") == [("leased_hardware_listener",
+                                                                            "leased_hardware")]
+
+        broker.declare_queue("leased_hardware.critical")
+        broker.enqueue(build_message("orphaned", "lease/hardware", "leased_hardware_listener",
+                                     queue_name="leased_hardware.critical"))
+
+        if released:
+            lease.release()
+        else:
+            other_lease = SubscriptionLease(subscription_store=router_data.subscription_store, queue_name="default")
+            other_lease.collect_orphaned_queues(current_millis() + lease.ttl_ms + 1)
+
+        assert router_data.get_subscribers_for_topic("lease/hardware") == []
+        assert broker.client.llen(f"{broker.namespace}:leased_hardware.critical") == 0
+
 
 class TestMessageRouterActor:
     """
@@ -175,6 +340,186 @@ class TestMessageRouterActor:
 
         assert database3 == {test_topic + "/y/z": test_message}
 
+    def test_topic_resolution_cache_invalidated_on_subscription_change(self, router_actor):
+        router_data = router_actor.message_router_data
+        cache = router_actor.topic_resolution_cache
+        test_topic = "cache_test/x"
+
+        router_data.add_subscriber_to_topic(topic="cache_test/#", subscribing_actor_name="put1")
+
+        # first message resolves the topic, the next ones hit the cache
+        for _ in range(3):
+            router_actor.listener_actor_method("test_message", test_topic)
+
+        info_before = cache.cache_info()
+        assert info_before["hits"] >= 2
+        assert cache.resolve(test_topic, lambda topic: []) == (("put1", router_data.listener_queue, False),)
+
+        # a subscription change invalidates the cached resolution on the next routed message
+        router_data.add_subscriber_to_topic(topic="cache_test/+", subscribing_actor_name="put2")
+        router_actor.listener_actor_method("test_message", test_topic)
+
+        info_after = cache.cache_info()
+        assert info_after["invalidations"] == info_before["invalidations"] + 1
+        assert sorted(cache.resolve(test_topic, lambda topic: [])) == [("put1", router_data.listener_queue, False),
+                                                                       ("put2", router_data.listener_queue, False)]
+
+    def test_direct_routing_publishes_straight_to_subscribers(self, router_actor):
+        from microdrop_utils.dramatiq_pub_sub_helpers import enable_direct_routing, disable_direct_routing
+
+        broker = dramatiq.get_broker()
+        database = {}
+        routed = []
+
+        @dramatiq.actor
+        def put_direct(message, topic):
+            database[topic] = message
+
+        router_actor.message_router_data.add_subscriber_to_topic(topic="direct/#", subscribing_actor_name="put_direct")
+
+        # record any message that still goes through the router actor
+        router_actor.listener_actor_method = lambda message, topic: routed.append(topic)
+
+        enable_direct_routing(router_actor)
+        try:
+            publish_message("test_message", "direct/x")
+        finally:
+            disable_direct_routing()
+            router_actor.listener_actor_method = router_actor._listener_actor_method_default()
+
+        with worker(broker, worker_timeout=100) as current_worker:
+            broker.join("default")
+            current_worker.join()
+
+        assert database == {"direct/x": "test_message"}
+        assert routed == []
+
+    def test_conflating_subscriber_only_gets_latest_message(self, router_actor):
+        from microdrop_utils.dramatiq_controller_base import DramatiqControllerBase
+
+        broker = dramatiq.get_broker()
+        received = []
+
+        # conflated messages are unpacked by the listener actor of a dramatiq controller
+        DramatiqControllerBase(listener_name="put_conflated",
+                               listener_actor_method=lambda message, topic: received.append((topic, message)))
+
+        router_data = router_actor.message_router_data
+        router_data.add_subscriber_to_topic(topic="telemetry/#", subscribing_actor_name="put_conflated", conflate=True)
+        router_data.never_conflate_topics = ["telemetry/halted"]
+
+        # the subscriber falls behind: nothing is consumed while messages are routed
+        try:
+            for i in range(5):
+                router_actor.route_message(f"reading {i}", "telemetry/capacitance")
+                router_actor.route_message(f"halted {i}", "telemetry/halted")
+        finally:
+            router_data.remove_subscriber_from_topic(topic="telemetry/#", subscribing_actor_name="put_conflated")
+            router_data.never_conflate_topics = []
+
+        with worker(broker, worker_timeout=100) as current_worker:
+            broker.join("default")
+            current_worker.join()
+
+        # only the latest reading is delivered, while safety topics are never conflated
+        assert [message for topic, message in received if topic == "telemetry/capacitance"] == ["reading 4"]
+        assert sorted(message for topic, message in received if topic == "telemetry/halted") == [f"halted {i}"
+                                                                                                  for i in range(5)]
+
+    def test_conflating_subscriber_gets_latest_none_message(self, router_actor):
+        from microdrop_utils.dramatiq_controller_base import DramatiqControllerBase
+
+        broker = dramatiq.get_broker()
+        received = []
+
+        DramatiqControllerBase(listener_name="put_conflated_none",
+                               listener_actor_method=lambda message, topic: received.append(message))
+
+        router_data = router_actor.message_router_data
+        router_data.add_subscriber_to_topic(topic="telemetry/#", subscribing_actor_name="put_conflated_none",
+                                            conflate=True)
+
+        try:
+            router_actor.route_message("reading", "telemetry/capacitance")
+            router_actor.route_message(None, "telemetry/capacitance")
+        finally:
+            router_data.remove_subscriber_from_topic(topic="telemetry/#", subscribing_actor_name="put_conflated_none")
+
+        with worker(broker, worker_timeout=100) as current_worker:
+            broker.join("default")
+            current_worker.join()
+
+        # a None message is delivered like any other
+        assert received == [None]
+
+    def test_latest_value_store_tells_none_from_expired_values(self):
+        import time
+        from microdrop_utils.redis_manager import RedisLatestValueStore
+
+        store = RedisLatestValueStore(redis_client=dramatiq.get_broker().client, key_prefix="test:latest_value",
+                                      ttl_ms=50)
+        missing = object()
+
+        store.put_many({"none": None, "expired": "reading"})
+        assert store.take("none", default=missing) is None
+
+        time.sleep(0.1)
+        assert store.take("expired", default=missing) is missing
+
+    def test_halt_overtakes_telemetry_flood_on_critical_lane(self, router_actor):
+        import time
+        from microdrop_utils.broker_server_helpers import start_workers, start_priority_lane_workers
+        from microdrop_utils.dramatiq_priority_lanes import CRITICAL, TELEMETRY, DEFAULT_PRIORITY_LANE
+        from microdrop_utils.dramatiq_pub_sub_helpers import set_topic_priority_lane
+
+        broker = dramatiq.get_broker()
+        telemetry_received = []
+        halt_received = []
+
+        @dramatiq.actor
+        def put_telemetry(message, topic):
+            time.sleep(0.005)  # a busy subscriber
+            telemetry_received.append(time.monotonic())
+
+        @dramatiq.actor
+        def put_halt(message, topic):
+            halt_received.append(time.monotonic())
+
+        router_data = router_actor.message_router_data
+        router_data.add_subscriber_to_topic(topic="lanes/telemetry", subscribing_actor_name="put_telemetry")
+        router_data.add_subscriber_to_topic(topic="lanes/halt", subscribing_actor_name="put_halt")
+        set_topic_priority_lane("lanes/telemetry", TELEMETRY)
+        set_topic_priority_lane("lanes/halt", CRITICAL)
+
+        try:
+            # flood the telemetry lane, then request a halt behind it
+            for i in range(200):
+                publish_message(f"reading {i}", "lanes/telemetry")
+            publish_message("", "lanes/halt")
+
+            halt_sent = time.monotonic()
+
+            workers = [start_workers(worker_timeout=10)] + start_priority_lane_workers(worker_timeout=10)
+            try:
+                broker.join("default.telemetry")
+                broker.join("default.critical")
+                for current_worker in workers:
+                    current_worker.join()
+            finally:
+                for current_worker in workers:
+                    current_worker.stop()
+
+        finally:
+            set_topic_priority_lane("lanes/telemetry", DEFAULT_PRIORITY_LANE)
+            set_topic_priority_lane("lanes/halt", DEFAULT_PRIORITY_LANE)
+
+        assert len(telemetry_received) == 200
+        assert len(halt_received) == 1
+
+        # the halt did not wait for the telemetry flood to be handled
+        assert halt_received[0] - halt_sent < 0.5
+        assert halt_received[0] < telemetry_received[-1]
+
 
 if __name__ == "__main__":
     pytest.main()
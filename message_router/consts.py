@@ -1,4 +1,18 @@
 ACTOR_TOPIC_ROUTES = "actor_topic_routes"
+ACTOR_CONCURRENCY = "actor_concurrency"
+
+# Plugins contribute the priority lanes of the topics they publish, and the topics that must never be conflated, e.g.
+# their safety topics. Other topics travel on the default control lane. The lanes are shared with the other processes
+# through the subscription store, so their publishers use them without running the contributing plugins.
+TOPIC_PRIORITY_LANES = "topic_priority_lanes"
+NEVER_CONFLATE_TOPICS = "never_conflate_topics"
+
+# Router subscriptions are leased to the router process, renewed by a heartbeat. A dead router's lease expires after a
+# few missed heartbeats, and its subscriptions and queues are then garbage collected by the other routers.
+SUBSCRIPTION_LEASE_TTL_MS = 30000
+SUBSCRIPTION_LEASE_HEARTBEAT_INTERVAL_S = 10
+SUBSCRIPTION_LEASE_HEARTBEAT_JOB = "message_router.subscription_lease_heartbeat"
+
 # # This module's package.
 PKG = '.'.join(__name__.split('.')[:-1])
 PKG_name = PKG.title().replace("_", " ")
\ No newline at end of file
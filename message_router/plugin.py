@@ -1,11 +1,18 @@
 from envisage.api import Plugin, ExtensionPoint
-from traits.api import List, Str, Dict, Instance
+from traits.api import List, Str, Dict, Instance, Bool
 import dramatiq
 import uuid
 
-from .consts import ACTOR_TOPIC_ROUTES, PKG, PKG_name
+from .consts import ACTOR_TOPIC_ROUTES, PKG, PKG_name, NEVER_CONFLATE_TOPICS, TOPIC_PRIORITY_LANES, \
+    SUBSCRIPTION_LEASE_TTL_MS, SUBSCRIPTION_LEASE_HEARTBEAT_INTERVAL_S, ACTOR_CONCURRENCY, \
+    SUBSCRIPTION_LEASE_HEARTBEAT_JOB
 from microdrop_utils._logger import get_logger
-from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterActor
+from microdrop_utils.dramatiq_pub_sub_helpers import MessageRouterActor, MessageRouterData, enable_direct_routing, \
+    disable_direct_routing
+from microdrop_utils.dramatiq_priority_lanes import PRIORITY_LANES
+from microdrop_utils.subscription_leases import SubscriptionLease
+from microdrop_utils.periodic_job_service import PeriodicJobService, PeriodicJob
+from microdrop_utils.dramatiq_actor_concurrency import set_actor_concurrency, get_actor_queue
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -21,6 +28,15 @@ class MessageRouterPlugin(Plugin):
     router_actor = Instance(MessageRouterActor)
     listener_queue = "_" + str(uuid.uuid4())  # queue names cannot start with number, has to be letter on underscore.
 
+    # opt-in: publishers in this process route messages to subscribers themselves using this router's subscription
+    # table instead of going through the message router actor.
+    direct_routing = Bool(False, desc="Route published messages directly to subscriber queues from this process")
+
+    # the subscriptions of this router expire with this process, unless the heartbeat keeps renewing its lease.
+    # The lease also exposes live / orphaned queue metrics.
+    subscription_lease = Instance(SubscriptionLease)
+    lease_heartbeat_job = Instance(PeriodicJob, desc="The periodic job renewing the subscription lease")
+
     # This tells us that the plugin offers the 'greetings' extension point,
     # and that plugins that want to contribute to it must each provide a list
     # of strings (Str).
@@ -28,18 +44,111 @@ class MessageRouterPlugin(Plugin):
         List(Dict(Str, List)), id=ACTOR_TOPIC_ROUTES,
 
         desc='actor topic routing information: keys should be different actors. And values for each are a list of '
-             'topics that it acts upon'
+             'topics that it acts upon. A topic can also be given as a dict like {"topic": topic, "conflate": True} '
+             'to only get the latest message on it when the actor falls behind'
+    )
+
+    actor_concurrency = ExtensionPoint(
+        List(Dict(Str, Dict)), id=ACTOR_CONCURRENCY,
+
+        desc='actor concurrency settings: keys should be actor names. And values for each a dict of settings among '
+             '"queue" (a dedicated queue), "worker_threads" (threads consuming the dedicated queue) and '
+             '"concurrency_limit". See microdrop_utils.dramatiq_actor_concurrency'
+    )
+
+    topic_priority_lanes = ExtensionPoint(
+        List(Dict(Str, List(Str))), id=TOPIC_PRIORITY_LANES,
+
+        desc='topic priority lanes: keys should be priority lanes, see microdrop_utils.dramatiq_priority_lanes. And '
+             'values for each a list of the topics travelling on it'
+    )
+
+    never_conflate_topics = ExtensionPoint(
+        List(List(Str)), id=NEVER_CONFLATE_TOPICS,
+
+        desc='lists of topics whose messages are always delivered one by one, even to actors that asked for them to '
+             'be conflated, e.g. safety topics'
     )
 
     def _router_actor_default(self):
         """ Trait initializer for pubsub actor"""
-        return MessageRouterActor(listener_queue=self.listener_queue)
+        message_router_data = MessageRouterData(listener_queue=self.listener_queue)
+
+        return MessageRouterActor(listener_queue=self.listener_queue, message_router_data=message_router_data)
+
+    def _subscription_lease_default(self):
+        return SubscriptionLease(subscription_store=self.router_actor.message_router_data.subscription_store,
+                                 queue_name=self.listener_queue, ttl_ms=SUBSCRIPTION_LEASE_TTL_MS)
 
     def start(self):
-        # assign topics to actors when plugin starts
+        # put urgent topics and telemetry on their own priority lanes, before any message gets routed. The lanes are
+        # shared with the routers and publishers of the other processes, which may not run the contributing plugins.
+        priority_lanes = {}
+        for topics_priority_lanes in self.topic_priority_lanes:
+            for lane, topics in topics_priority_lanes.items():
+                for topic in topics:
+                    priority_lanes[topic] = min(lane, priority_lanes.get(topic, lane), key=PRIORITY_LANES.index)
+
+        self.router_actor.message_router_data.add_topic_priority_lanes(priority_lanes)
+        # take in the lanes already shared by the other processes
+        self.router_actor.message_router_data.sync_subscriptions()
 
+        self.router_actor.message_router_data.never_conflate_topics = [
+            topic for topics in self.never_conflate_topics for topic in topics]
+
+        # give actors their dedicated queues before any subscription routes messages to them. Declaring the queues
+        # starts their workers.
+        for actors_concurrency in self.actor_concurrency:
+            for actor_name, settings in actors_concurrency.items():
+                concurrency = set_actor_concurrency(actor_name, **settings)
+                if concurrency.queue:
+                    dramatiq.get_broker().declare_queue(concurrency.queue)
+
+        # assign topics to actors when plugin starts, all in one go
+        subscriptions = []
         for actor_topics_routes in self.actor_topic_routing:
-            # add subscribers to topics
             for actor_name, topics_list in actor_topics_routes.items():
                 for topic in topics_list:
-                    self.router_actor.message_router_data.add_subscriber_to_topic(topic, actor_name)
+                    topic, conflate = _parse_topic_entry(topic)
+                    subscriptions.append((topic, actor_name, conflate))
+
+        # actors with a dedicated queue are subscribed on it rather than on the listener queue: the lease covers it too
+        self.subscription_lease.dedicated_queues = sorted(
+            {get_actor_queue(actor_name, self.listener_queue) for _, actor_name, _ in subscriptions} -
+            {self.listener_queue})
+
+        # hold the lease before subscribing, so the subscriptions can never outlive this process
+        self.subscription_lease.heartbeat()
+
+        self.lease_heartbeat_job = PeriodicJobService.shared().add_or_replace_job(
+            SUBSCRIPTION_LEASE_HEARTBEAT_JOB, func=self._lease_heartbeat,
+            interval_s=SUBSCRIPTION_LEASE_HEARTBEAT_INTERVAL_S)
+
+        self.router_actor.message_router_data.add_subscribers_to_topics(subscriptions)
+
+        if self.direct_routing:
+            enable_direct_routing(self.router_actor)
+
+    def _lease_heartbeat(self):
+        self.subscription_lease.heartbeat()
+        # also picks up the priority lanes shared by processes started later, while this router has nothing to route
+        self.router_actor.message_router_data.sync_subscriptions()
+
+    def stop(self):
+        if self.direct_routing:
+            disable_direct_routing()
+
+        if self.lease_heartbeat_job is not None:
+            self.lease_heartbeat_job.remove()
+
+        self.subscription_lease.release()
+
+
+def _parse_topic_entry(topic_entry) -> tuple:
+    """
+    Returns the (topic, conflate) pair for an actor topics list entry, either a topic string or a topic options dict
+    """
+    if isinstance(topic_entry, dict):
+        return topic_entry["topic"], topic_entry.get("conflate", False)
+
+    return topic_entry, False
@@ -15,7 +15,7 @@ class BaseDramatiqControllableDropBotQWidget(QWidget):
     and signal declaration logic with the presence of a controller that uses a dramatiq listener actor.
 
     This class declares:
-      - A common controller_signal (emitting a string) for communication.
+      - A common controller_signal (emitting a python object) for communication.
       - A controller property (with getter and setter) that uses a
         factory function to create and assign a controller. The controller must implement
         a controller_signal_handler method. The mixin then connects the view's controller_signal
@@ -24,7 +24,7 @@ class BaseDramatiqControllableDropBotQWidget(QWidget):
         that needs to be created in the controller for updating this widget.
 
     """
-    controller_signal = Signal(str)
+    controller_signal = Signal(object)
 
     def __init__(self, *args, **kwargs):
         super().__init__()
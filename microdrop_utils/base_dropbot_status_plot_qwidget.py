@@ -1,10 +1,10 @@
-import json
 import time
 import pyqtgraph as pg
 from PySide6.QtWidgets import QVBoxLayout
 from PySide6.QtCore import QTimer, Qt
 from microdrop_utils._logger import get_logger
 from microdrop_utils.base_dropbot_qwidget import BaseDramatiqControllableDropBotQWidget
+from microdrop_utils.dramatiq_message_codec import decode_payload
 
 logger = get_logger(__name__)
 
@@ -110,7 +110,7 @@ class BaseDropBotStatusPlotWidget(BaseDramatiqControllableDropBotQWidget):
 
     ################# Capacitance Voltage readings ##################
     def _on_capacitance_updated_triggered(self, body):
-        data = json.loads(body)
+        data = decode_payload(body)
         tracked_value = data.get(self.value_tracked_name, f'0 {self.value_tracked_unit}')
 
         # Update capacitance plot
@@ -1,10 +1,16 @@
 import subprocess
+import threading
 import time
 import logging
 from contextlib import contextmanager
 import os
 
-from dramatiq import get_broker, Worker
+from dramatiq import get_broker, Middleware
+
+from microdrop_utils.dramatiq_priority_lanes import PriorityLaneWorker, DEDICATED_LANE_WORKER_THREADS, \
+    dedicated_queue_names
+from microdrop_utils.dramatiq_actor_concurrency import get_dedicated_queues
+from microdrop_utils.dramatiq_message_codec import set_message_codec
 
 logger = logging.getLogger(__name__)
 
@@ -59,16 +65,74 @@ def remove_middleware_from_dramatiq_broker(middleware_name: str, broker: 'dramat
 
 def start_workers(**kwargs) -> 'dramatiq.worker.Worker':
     """
-    A startup routine for apps that make use of dramatiq.
+    A startup routine for apps that make use of dramatiq. The worker consumes the queues of the default priority lane.
     """
     BROKER = get_broker()
 
-    worker = Worker(broker=BROKER, **kwargs)
+    worker = PriorityLaneWorker(broker=BROKER, **kwargs)
     worker.start()
 
     return worker
 
 
+def start_priority_lane_workers(**kwargs) -> list:
+    """
+    Start one worker with dedicated threads for each dedicated priority lane.
+    """
+    BROKER = get_broker()
+
+    workers = []
+    for lane, worker_threads in DEDICATED_LANE_WORKER_THREADS.items():
+        worker = PriorityLaneWorker(broker=BROKER, lane=lane, worker_threads=worker_threads, **kwargs)
+        worker.start()
+        workers.append(worker)
+
+    return workers
+
+
+class DedicatedQueueWorkers(Middleware):
+    """
+    Starts a worker for each queue dedicated to some actors as soon as the queue is declared, with the number of worker
+    threads of its actor concurrency settings (see dramatiq_actor_concurrency).
+
+    The worker consumes the companion critical queue of the dedicated queue too. It prefetches no more messages than
+    it has threads, so critical messages only wait for the handlers running, not for messages taken off the dedicated
+    queue ahead of them.
+    """
+
+    def __init__(self, **worker_kwargs):
+        self.worker_kwargs = worker_kwargs
+        self.workers = {}
+        self._lock = threading.Lock()
+
+    def after_declare_queue(self, broker, queue_name):
+        worker_threads = get_dedicated_queues().get(queue_name)
+        if worker_threads is None:
+            return
+
+        with self._lock:
+            if queue_name in self.workers:
+                return
+
+            worker = PriorityLaneWorker(broker=broker, queues=set(dedicated_queue_names(queue_name)),
+                                        worker_threads=worker_threads, **self.worker_kwargs)
+            worker.queue_prefetch = worker_threads
+            self.workers[queue_name] = worker
+
+        logger.info(f"Starting a worker with {worker_threads} threads for dedicated queue {queue_name}")
+        worker.start()
+
+    def stop(self, broker):
+        """
+        Stops the dedicated queue workers, and no longer starts any.
+        """
+        if self in broker.middleware:
+            broker.middleware.remove(self)
+
+        for worker in self.workers.values():
+            worker.stop()
+
+
 @contextmanager
 def redis_server_context():
     """
@@ -86,18 +150,35 @@ def redis_server_context():
 
 
 @contextmanager
-def dramatiq_workers_context(**kwargs):
+def dramatiq_workers_context(message_codec: str = None, **kwargs):
     """
     Context manager for apps that make use of dramatiq. They need the workers to exist.
+
+    The message codec is set before the workers start, from the MICRODROP_MESSAGE_CODEC environment variable unless
+    message_codec is given, so that everything in the process encodes and decodes messages the same way.
     """
+    set_message_codec(message_codec)
     remove_middleware_from_dramatiq_broker(middleware_name="dramatiq.middleware.prometheus", broker=get_broker())
+    lane_workers = []
+    dedicated_queue_workers = DedicatedQueueWorkers(
+        **{key: value for key, value in kwargs.items() if key != "worker_threads"})
     try:
         worker = start_workers(**kwargs)
 
+        # priority lane workers get their own threads so urgent messages never wait behind telemetry
+        lane_workers = start_priority_lane_workers(
+            **{key: value for key, value in kwargs.items() if key != "worker_threads"})
+
+        # actors with a dedicated queue, like hardware actors, get their own workers
+        get_broker().add_middleware(dedicated_queue_workers)
+
         yield worker  # This is where the main logic will execute within the context
 
     finally:
         # Shutdown routine
+        dedicated_queue_workers.stop(get_broker())
+        for lane_worker in lane_workers:
+            lane_worker.stop()
         worker.stop()
         get_broker().flush_all()
 
@@ -0,0 +1,84 @@
+"""
+Compact wire format for channel states: a packed bitset along with the channel count.
+
+A JSON object of channel keys to booleans takes over a kilobyte for a 120 channel dropbot, and has to be parsed key by
+key. Packed, the same states take 15 bytes, decoded straight into a boolean mask with np.unpackbits. Channel i is bit
+i % 8 of byte i // 8.
+
+The bitset is sent as raw bytes with the msgpack message codec, and base64 encoded otherwise, as the JSON codec cannot
+carry bytes. Both are decoded.
+"""
+import base64
+
+import dramatiq
+import numpy as np
+
+from microdrop_utils.dramatiq_message_codec import MsgpackEncoder
+
+BITSET = "bitset"
+CHANNEL_COUNT = "channel_count"
+
+
+def is_channels_bitset(payload) -> bool:
+    """
+    Returns True if the payload holds channel states in the bitset format.
+    """
+    return isinstance(payload, dict) and BITSET in payload
+
+
+def pack_channels_states(channels_states, channel_count: int = None, as_base64: bool = None) -> dict:
+    """
+    Packs channel states into a bitset payload.
+
+    Args:
+        channels_states: A dict of channel numbers to states, or a boolean mask indexed by channel.
+        channel_count: Number of channels in the bitset. Defaults to the highest channel + 1 for a dict, and to the
+            mask size for a mask.
+        as_base64: If True, the bitset is base64 encoded. Defaults to True unless the msgpack message codec is set.
+
+    Returns:
+        dict: The bitset payload.
+
+    Example:
+        >>> pack_channels_states({0: True, 1: False, 9: True}, as_base64=False)
+        {'bitset': b'\\x01\\x02', 'channel_count': 10}
+        >>> pack_channels_states({0: True, 1: False, 9: True}, as_base64=True)
+        {'bitset': 'AQI=', 'channel_count': 10}
+    """
+    if isinstance(channels_states, dict):
+        if channel_count is None:
+            channel_count = max(channels_states, default=-1) + 1
+
+        mask = np.zeros(channel_count, dtype=bool)
+        mask[[channel for channel, state in channels_states.items() if state]] = True
+
+    else:
+        mask = np.asarray(channels_states, dtype=bool)
+        if channel_count is None:
+            channel_count = len(mask)
+
+    bitset = np.packbits(mask[:channel_count], bitorder="little").tobytes()
+
+    if as_base64 is None:
+        as_base64 = not isinstance(dramatiq.get_encoder(), MsgpackEncoder)
+
+    if as_base64:
+        bitset = base64.b64encode(bitset).decode("ascii")
+
+    return {BITSET: bitset, CHANNEL_COUNT: channel_count}
+
+
+def unpack_channels_states(payload: dict) -> np.ndarray:
+    """
+    Decodes a bitset payload into a boolean mask of its channel count.
+
+    Example:
+        >>> unpack_channels_states({"bitset": "AQI=", "channel_count": 10}).nonzero()[0].tolist()
+        [0, 9]
+    """
+    bitset = payload[BITSET]
+    if isinstance(bitset, str):
+        bitset = base64.b64decode(bitset)
+
+    return np.unpackbits(np.frombuffer(bitset, dtype=np.uint8), count=payload[CHANNEL_COUNT],
+                         bitorder="little").astype(bool)
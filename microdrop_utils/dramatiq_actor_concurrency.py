@@ -0,0 +1,115 @@
+"""
+Per actor concurrency settings.
+
+By default every actor gets its messages on the queue of the message router, processed by the shared worker pool. An
+actor can instead be given:
+
+- a dedicated queue, consumed by its own worker with its own number of worker threads. Hardware actors get one worker
+  thread, i.e. one ordered lane, so their handlers never run concurrently against the same device. Pure compute actors
+  get several, and as dedicated queue names are fixed, more worker processes can consume them too. Messages to a
+  dedicated queue are not split over priority lanes, so they keep their order, apart from critical messages which
+  overtake them (see dramatiq_priority_lanes).
+- a concurrency limit, capping how many of its messages are processed at once in this process.
+
+Plugins declare the settings of their actors next to their ACTOR_TOPIC_DICT, as a dict of actor names to settings:
+
+    ACTOR_CONCURRENCY_DICT = {"dropbot_controller_listener": {"queue": "dropbot_hardware", "worker_threads": 1}}
+
+The settings have to be set before the dedicated queues are declared, so that the shared workers never consume them.
+"""
+import threading
+from typing import Optional
+
+from traits.api import HasTraits, Str, Int, Any
+
+from microdrop_utils._logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ActorConcurrency(HasTraits):
+    """
+    Concurrency settings of an actor.
+    """
+
+    actor_name = Str(desc="The name of the actor the settings apply to")
+
+    queue = Str(desc="The dedicated queue of the actor. Empty for the queue of the message router")
+
+    worker_threads = Int(1, desc="Number of worker threads consuming the dedicated queue")
+
+    concurrency_limit = Int(0, desc="Maximum number of messages of the actor processed at once in this process. 0 for "
+                                    "no limit")
+
+    limiter = Any(desc="Semaphore enforcing the concurrency limit, None if there is no limit")
+
+    def _limiter_default(self):
+        if self.concurrency_limit > 0:
+            return threading.BoundedSemaphore(self.concurrency_limit)
+
+        return None
+
+
+# actor names mapped to their concurrency settings
+_actor_concurrency = {}
+
+# dedicated queues mapped to their number of worker threads
+_dedicated_queues = {}
+
+
+def set_actor_concurrency(actor_name: str, queue: str = "", worker_threads: int = 1,
+                          concurrency_limit: int = 0) -> ActorConcurrency:
+    """
+    Sets the concurrency settings of an actor in this process.
+    """
+    settings = ActorConcurrency(actor_name=actor_name, queue=queue, worker_threads=worker_threads,
+                                concurrency_limit=concurrency_limit)
+    _actor_concurrency[actor_name] = settings
+
+    if queue:
+        _dedicated_queues[queue] = max(worker_threads, _dedicated_queues.get(queue, 0))
+
+    logger.debug(f"Concurrency of {actor_name}: queue {queue or 'shared'}, {worker_threads} worker threads, "
+                 f"concurrency limit {concurrency_limit or 'none'}")
+
+    return settings
+
+
+def get_actor_concurrency(actor_name: str) -> Optional[ActorConcurrency]:
+    """
+    Returns the concurrency settings of an actor, or None if it has the default ones.
+    """
+    return _actor_concurrency.get(actor_name)
+
+
+def get_actor_queue(actor_name: str, default_queue: str) -> str:
+    """
+    Returns the queue messages to an actor are sent to: its dedicated queue, or the default queue.
+
+    Example:
+        >>> _ = set_actor_concurrency("example_hardware_listener", queue="example_hardware")
+        >>> get_actor_queue("example_hardware_listener", "default")
+        'example_hardware'
+        >>> get_actor_queue("example_ui_listener", "default")
+        'default'
+    """
+    settings = _actor_concurrency.get(actor_name)
+
+    if settings is None or not settings.queue:
+        return default_queue
+
+    return settings.queue
+
+
+def is_dedicated_queue(queue_name: str) -> bool:
+    """
+    Returns True if the queue is dedicated to some actors, and consumed by its own worker.
+    """
+    return queue_name in _dedicated_queues
+
+
+def get_dedicated_queues() -> dict:
+    """
+    Returns the dedicated queues mapped to their number of worker threads.
+    """
+    return dict(_dedicated_queues)
@@ -3,10 +3,20 @@ import warnings
 
 import dramatiq
 from dramatiq import Actor
-from traits.api import Instance, Str, provides, HasTraits, Callable
+from traits.api import Instance, Str, provides, HasTraits, Callable, Any, Dict, Int, Bool, Undefined
 
 from . import logger
 from .i_dramatiq_controller_base import IDramatiqControllerBase
+from .redis_manager import RedisLatestValueStore
+from .in_process_broker import InProcessBroker, InMemoryLatestValueStore
+from .dramatiq_priority_lanes import lane_queue_names, dedicated_queue_names
+from .dramatiq_actor_concurrency import get_actor_concurrency
+
+# redis key prefix of the latest messages stored for conflating subscribers
+CONFLATION_KEY_PREFIX = "microdrop:conflation"
+
+# returned by the latest value stores when no message is pending, as None is a message like any other
+_NO_PENDING_VALUE = object()
 
 
 @provides(IDramatiqControllerBase)
@@ -42,6 +52,8 @@ class DramatiqControllerBase(HasTraits):
     listener_actor_method = Callable(desc="Routine to be wrapped into listener_actor"
                                            "Should accept parent_obj, message, topic parameters")
     listener_actor: Actor = Instance(Actor, desc="Dramatiq actor instance for message handling")
+    latest_value_store = Instance(HasTraits, desc="RedisLatestValueStore or InMemoryLatestValueStore, depending on "
+                                                  "the broker, the latest conflated messages are taken from")
 
     def traits_init(self) -> None:
         """Initialize the controller by setting up the Dramatiq listener.
@@ -67,6 +79,9 @@ class DramatiqControllerBase(HasTraits):
         class_name = re.sub(r'([a-z])([A-Z])', r'\1_\2', class_name).lower()
         return class_name
 
+    def _latest_value_store_default(self):
+        return get_latest_value_store()
+
     def _listener_actor_default(self) -> Actor:
         """Create and configure the Dramatiq actor for message handling.
 
@@ -75,22 +90,62 @@ class DramatiqControllerBase(HasTraits):
 
         Note:
             The created actor will use the class's listener_name and
-            route messages to the listener_routine method.
+            route messages to the listener_routine method. The priority lane queues
+            of its listener_queue are declared too, so that their workers consume them,
+            as are its dedicated queue and its companion queues if it has one.
         """
 
         @dramatiq.actor(actor_name=self.listener_name, queue_name=self.listener_queue)
-        def create_listener_actor(message: str, topic: str) -> None:
+        def create_listener_actor(message: str, topic: str, conflation_key: str = None) -> None:
             """Handle incoming Dramatiq messages.
 
             Args:
                 message: Content of the received message
                 topic: Topic/routing key of the message
+                conflation_key: Set for conflated topics, where message is empty and the latest message on the
+                    topic is taken from the latest value store instead
             """
+            if conflation_key is not None:
+                message = self.latest_value_store.take(conflation_key, default=_NO_PENDING_VALUE)
+
+                # the latest message expired while this listener was busy, or was delivered already
+                if message is _NO_PENDING_VALUE:
+                    logger.warning(f"{self.listener_name}: latest message on {topic} expired before it could be "
+                                   f"delivered")
+                    return
+
+            concurrency = get_actor_concurrency(self.listener_name)
+            if concurrency is not None and concurrency.limiter is not None:
+                with concurrency.limiter:
+                    self.listener_actor_method(message, topic)
+                return
+
             self.listener_actor_method(message, topic)
 
+        for queue_name in lane_queue_names(self.listener_queue):
+            create_listener_actor.broker.declare_queue(queue_name)
+
+        # a dedicated queue gets its own worker once declared, consuming its companion critical queue too
+        concurrency = get_actor_concurrency(self.listener_name)
+        if concurrency is not None and concurrency.queue:
+            for queue_name in dedicated_queue_names(concurrency.queue):
+                create_listener_actor.broker.declare_queue(queue_name)
+
         return create_listener_actor
 
 
+def get_latest_value_store():
+    """
+    Returns the store of the latest messages for conflating subscribers, for the broker of this process.
+    """
+    broker = dramatiq.get_broker()
+
+    if isinstance(broker, InProcessBroker):
+        return InMemoryLatestValueStore.shared()
+
+    return RedisLatestValueStore(redis_client=broker.client, key_prefix=CONFLATION_KEY_PREFIX)
+
+
 def generate_class_method_dramatiq_listener_actor(listener_name, class_method, listener_queue="default") -> Actor:
     """
     Method to generate a Dramatiq Actor for message handling for a class based on one of its methods.
@@ -114,14 +169,174 @@ def generate_class_method_dramatiq_listener_actor(listener_name, class_method, l
         return dramatiq_controller.listener_actor
 
 
+class HandlerDispatchTable(HasTraits):
+    """
+    Maps topics to the handler methods of an object, found once by introspecting the method names.
+
+    Handler names follow a pattern with a '{topic}' placeholder standing for the last segment of the topics they
+    handle, e.g. "_on_{topic}_triggered" handles "devices/sensor" with "_on_sensor_triggered". Topics are resolved to
+    their handler once, then looked up by full topic. Handlers set on a HasTraits object at runtime with setattr are
+    picked up, everything else requires calling rebuild.
+
+    Topics with no handler are counted in unhandled_topic_counts rather than logged on every message.
+
+    Example:
+        >>> class Listener(HasTraits):
+        ...     def _on_sensor_triggered(self, message):
+        ...         print(f"sensor: {message}")
+        >>> listener = Listener()
+        >>> table = HandlerDispatchTable(parent_obj=listener)
+        >>> table.dispatch("devices/sensor", 1)
+        sensor: 1
+        True
+        >>> table.dispatch("devices/valve", 2)
+        False
+        >>> listener._on_valve_triggered = lambda message: print(f"valve: {message}")
+        >>> table.dispatch("devices/valve", 3)
+        valve: 3
+        True
+        >>> dict(table.unhandled_topic_counts)
+        {'devices/valve': 1}
+    """
+
+    parent_obj = Any(desc="The object holding the handler methods")
+
+    handler_name_pattern = Str("_on_{topic}_triggered", desc="Handler method names, with a '{topic}' placeholder "
+                                                             "for the last segment of the handled topics")
+
+    handlers = Dict(Str, Callable, desc="Last topic segments mapped to their bound handler method")
+
+    unhandled_topic_counts = Dict(Str, Int, desc="Topics with no handler mapped to the number of messages received")
+
+    _topic_handlers = Dict(desc="Full topics mapped to their resolved handler, or None if they have none")
+
+    _stale = Bool(False, desc="True when handlers were added to the parent object since the table was built")
+
+    def traits_init(self):
+        self.rebuild()
+
+        if isinstance(self.parent_obj, HasTraits):
+            self.parent_obj.observe(self._on_parent_trait_added, "trait_added")
+
+    def rebuild(self):
+        """
+        Finds every handler method of the parent object again.
+        """
+        pending_names = []
+        self.handlers = find_handler_methods(self.parent_obj, self.handler_name_pattern, pending_names)
+
+        # handlers being added, not set yet
+        self._stale = bool(pending_names)
+        self._topic_handlers = {}
+
+    def get_handler(self, topic: str):
+        """
+        Returns the handler of a topic, or None if it has none.
+        """
+        try:
+            return self._topic_handlers[topic]
+
+        except KeyError:
+            if self._stale:
+                self.rebuild()
+
+            handler = self.handlers.get(topic.rpartition("/")[2])
+            self._topic_handlers[topic] = handler
+            return handler
+
+    def dispatch(self, topic: str, message) -> bool:
+        """
+        Calls the handler of a topic with a message. Errors raised by the handler are logged.
+
+        Returns:
+            bool: False if the topic has no handler.
+        """
+        handler = self.get_handler(topic)
+
+        if handler is None:
+            self.unhandled_topic_counts[topic] = self.unhandled_topic_counts.get(topic, 0) + 1
+            return False
+
+        try:
+            handler(message)
+        except Exception as e:
+            logger.error(f"Error handling message: {message} from topic: {topic} with {handler}: {e}",
+                         exc_info=True)
+
+        return True
+
+    def _on_parent_trait_added(self, event):
+        name = event.new
+        prefix, suffix = self.handler_name_pattern.split("{topic}")
+
+        # the trait is added before the handler is set, so the table is rebuilt on the next lookup instead
+        if name.startswith(prefix) and name.endswith(suffix):
+            self._stale = True
+            self._topic_handlers = {}
+
+
+def find_handler_methods(parent_obj: object, handler_name_pattern: str, pending_names: list = None) -> dict:
+    """
+    Returns the handler methods of an object named after a pattern with a '{topic}' placeholder, keyed by topic.
+
+    Handler names with no value set yet are added to pending_names, if given.
+
+    Example:
+        >>> class Controller:
+        ...     def on_halt_request(self, message): pass
+        ...     def on_halt_signal(self, message): pass
+        >>> list(find_handler_methods(Controller(), "on_{topic}_request"))
+        ['halt']
+    """
+    prefix, suffix = handler_name_pattern.split("{topic}")
+
+    handlers = {}
+    for name in dir(parent_obj):
+        if not (name.startswith(prefix) and name.endswith(suffix) and len(name) > len(prefix) + len(suffix)):
+            continue
+
+        handler = getattr(parent_obj, name, Undefined)
+
+        if handler is Undefined:
+            if pending_names is not None:
+                pending_names.append(name)
+
+        elif callable(handler):
+            handlers[name[len(prefix):len(name) - len(suffix)]] = handler
+
+    return handlers
+
+
+# attribute of the objects routing their messages with basic_listener_actor_routine holding their dispatch tables
+HANDLER_DISPATCH_TABLES_ATTR = "_handler_dispatch_tables"
+
+
+def get_handler_dispatch_table(parent_obj: object, handler_name_pattern: str = "_on_{topic}_triggered") \
+        -> HandlerDispatchTable:
+    """
+    Returns the handler dispatch table of an object for a handler name pattern, building it on the first call.
+
+    The tables are kept on the object itself, since they hold its bound methods: they are collected along with it.
+    """
+    # set in the instance dict directly, for HasTraits objects not to get a trait added for it
+    tables = vars(parent_obj).setdefault(HANDLER_DISPATCH_TABLES_ATTR, {})
+
+    if handler_name_pattern not in tables:
+        tables[handler_name_pattern] = HandlerDispatchTable(parent_obj=parent_obj,
+                                                            handler_name_pattern=handler_name_pattern)
+
+    return tables[handler_name_pattern]
+
+
 def basic_listener_actor_routine(parent_obj: object, message: any, topic: str,
                                  handler_name_pattern: str = "_on_{topic}_triggered") -> None:
     """
-    Dispatches an incoming message to a dynamically determined handler method on the parent object.
+    Dispatches an incoming message to the handler method of the parent object for its topic.
 
-    This function logs the received message and topic, derives a method name using the specified
-    naming pattern (defaulting to "_on_{topic}_triggered"), and then checks if the parent object
-    contains a callable method with that name. If so, it invokes the method with the message.
+    This function logs the received message and topic, then calls the handler found in the handler dispatch table of
+    the parent object: the method named after the last segment of the topic using the specified naming pattern
+    (defaulting to "_on_{topic}_triggered"). The table is built on the first message, unless get_handler_dispatch_table
+    was already called for the parent object, e.g. when creating its listener actor.
 
     Parameters:
         parent_obj (object): The object expected to have a handler method for the given topic.
@@ -134,26 +349,14 @@ def basic_listener_actor_routine(parent_obj: object, message: any, topic: str,
                      of the provided topic. Defaults to "_on_{topic}_triggered".
 
     Example:
-        For a topic "devices/sensor", the computed method name will be "_on_sensor_triggered".
+        For a topic "devices/sensor", the handler method is "_on_sensor_triggered".
 
     Returns:
         None
     """
     logger.info(f"{parent_obj.name}: Received message: {message} from topic: {topic}")
 
-    # Split the topic into parts and take the last segment as the key.
-    topic_parts = topic.split("/")
-    topic_key = topic_parts[-1]
-
-    # Compute the handler method name using the provided pattern.
-    requested_method = handler_name_pattern.format(topic=topic_key)
-
-    # invoke the method, and check if any error_message shows up
-    err_msg = invoke_class_method(parent_obj, requested_method, message)
-
-    if err_msg:
-        logger.error(f"{parent_obj.name}: Received message: {message} from topic: {topic} Failed to execute due to "
-                     f"error: {err_msg}")
+    get_handler_dispatch_table(parent_obj, handler_name_pattern).dispatch(topic, message)
 
 
 def invoke_class_method(parent_obj, requested_method: str, *args, **kwargs):
@@ -0,0 +1,100 @@
+"""
+Pluggable codecs for the dramatiq messages sent through the broker.
+
+Publishers used to json.dumps their payloads, and dramatiq then JSON encoded the whole message a second time. With the
+msgpack codec, typed payloads (dicts with int keys, lists, numbers, ...) go into the broker as one compact binary
+message instead. Messages are still decoded if they were JSON encoded, so processes that have not switched codec yet
+keep working, and decode_payload lets subscribers accept both legacy JSON string payloads and typed payloads.
+"""
+import json
+import os
+
+import dramatiq
+
+from microdrop_utils._logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK = "msgpack"
+JSON = "json"
+MESSAGE_CODECS = (MSGPACK, JSON)
+
+# every process of an app should use the same codec, so it is read from the environment the processes share
+MESSAGE_CODEC_ENV_VAR = "MICRODROP_MESSAGE_CODEC"
+
+
+class MsgpackEncoder(dramatiq.Encoder):
+    """
+    Encodes dramatiq messages with msgpack. JSON encoded messages are decoded too.
+
+    Example:
+        >>> encoder = MsgpackEncoder()
+        >>> encoder.decode(encoder.encode({"args": [{1: True, 2: False}, "topic"]}))
+        {'args': [{1: True, 2: False}, 'topic']}
+        >>> encoder.decode(b'{"args": ["{\\\\"1\\\\": true}", "topic"]}')
+        {'args': ['{"1": true}', 'topic']}
+    """
+
+    def encode(self, data: dict) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, data: bytes) -> dict:
+        # a JSON encoded message is an object, while a msgpack map never starts with "{"
+        if data[:1] == b"{":
+            return json.loads(data)
+
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def get_configured_message_codec() -> str:
+    """
+    Returns the codec set by the MICRODROP_MESSAGE_CODEC environment variable, msgpack by default.
+    """
+    return os.environ.get(MESSAGE_CODEC_ENV_VAR, MSGPACK).strip().lower()
+
+
+def set_message_codec(codec: str = None):
+    """
+    Sets the codec dramatiq uses to encode messages in this process, the configured one by default. Falls back on JSON
+    if msgpack is not installed.
+
+    Call this once at broker setup, before anything publishes or consumes messages.
+    """
+    if codec is None:
+        codec = get_configured_message_codec()
+
+    if codec not in MESSAGE_CODECS:
+        raise ValueError(f"Unknown message codec {codec}. Expected one of {MESSAGE_CODECS}")
+
+    if codec == MSGPACK and msgpack is None:
+        logger.warning("msgpack is not installed: falling back on the JSON message codec")
+        codec = JSON
+
+    dramatiq.set_encoder(MsgpackEncoder() if codec == MSGPACK else dramatiq.JSONEncoder())
+    logger.info(f"Using the {codec} message codec")
+
+
+def decode_payload(message):
+    """
+    Returns the typed payload of a message, parsing legacy JSON string payloads of objects and arrays.
+
+    Example:
+        >>> decode_payload('{"capacitance": "1 pF"}')
+        {'capacitance': '1 pF'}
+        >>> decode_payload({"capacitance": "1 pF"})
+        {'capacitance': '1 pF'}
+        >>> decode_payload("because output current was exceeded")
+        'because output current was exceeded'
+    """
+    if isinstance(message, str) and message.lstrip()[:1] in ("{", "["):
+        try:
+            return json.loads(message)
+        except json.JSONDecodeError:
+            pass
+
+    return message
@@ -0,0 +1,162 @@
+"""
+Priority lanes let urgent messages, like halt requests, overtake queued telemetry.
+
+Every topic travels on one priority lane. Messages on the default lane use their destination queue as is, while
+messages on a dedicated lane use a companion queue named "<queue>.<lane>". Each dedicated lane is consumed by its own
+PriorityLaneWorker, so its messages never wait behind the queues or the worker threads of another lane.
+
+Queues dedicated to some actors (see dramatiq_actor_concurrency) keep their messages in order on one queue, except
+for the critical ones: those use the critical companion queue of the dedicated queue, consumed by the same dedicated
+worker, which only takes the next message off the dedicated queue once the message it handles is done. A critical
+message then waits for the handler running at most, never behind the messages queued before it.
+"""
+from dramatiq import Worker
+from dramatiq.common import q_name
+
+from microdrop_utils.dramatiq_actor_concurrency import is_dedicated_queue
+
+CRITICAL = "critical"
+CONTROL = "control"
+TELEMETRY = "telemetry"
+
+# lanes from most to least urgent
+PRIORITY_LANES = (CRITICAL, CONTROL, TELEMETRY)
+DEFAULT_PRIORITY_LANE = CONTROL
+
+# lanes with their own queues and worker threads, with their number of worker threads
+DEDICATED_LANE_WORKER_THREADS = {CRITICAL: 2, TELEMETRY: 2}
+
+# lanes whose messages to a dedicated queue overtake the messages queued on it
+DEDICATED_QUEUE_LANES = (CRITICAL,)
+
+
+def lane_queue_name(queue_name: str, lane: str) -> str:
+    """
+    Returns the queue carrying the messages of a priority lane for a destination queue.
+
+    Example:
+        >>> lane_queue_name("default", CRITICAL)
+        'default.critical'
+        >>> lane_queue_name("default", DEFAULT_PRIORITY_LANE)
+        'default'
+    """
+    if lane == DEFAULT_PRIORITY_LANE:
+        return queue_name
+
+    return f"{queue_name}.{lane}"
+
+
+def route_queue_name(queue_name: str, lane: str) -> str:
+    """
+    Returns the queue messages of a priority lane are sent to for a destination queue, which may be dedicated to some
+    actors.
+
+    Example:
+        >>> from microdrop_utils.dramatiq_actor_concurrency import set_actor_concurrency
+        >>> _ = set_actor_concurrency("example_hardware_listener", queue="example_hardware")
+        >>> route_queue_name("example_hardware", TELEMETRY)
+        'example_hardware'
+        >>> route_queue_name("example_hardware", CRITICAL)
+        'example_hardware.critical'
+        >>> route_queue_name("default", TELEMETRY)
+        'default.telemetry'
+    """
+    if is_dedicated_queue(queue_name) and lane not in DEDICATED_QUEUE_LANES:
+        return queue_name
+
+    return lane_queue_name(queue_name, lane)
+
+
+def dedicated_queue_names(queue_name: str) -> list:
+    """
+    Returns a dedicated queue along with its companion queues, all consumed by the dedicated queue worker.
+
+    Example:
+        >>> dedicated_queue_names("example_hardware")
+        ['example_hardware', 'example_hardware.critical']
+    """
+    return [queue_name] + [lane_queue_name(queue_name, lane) for lane in DEDICATED_QUEUE_LANES]
+
+
+def get_lane_destination_queue(queue_name: str) -> str:
+    """
+    Returns the destination queue a priority lane queue carries messages for.
+
+    Example:
+        >>> get_lane_destination_queue("default.telemetry")
+        'default'
+        >>> get_lane_destination_queue("default")
+        'default'
+    """
+    destination, _, lane = queue_name.rpartition(".")
+
+    if lane in DEDICATED_LANE_WORKER_THREADS:
+        return destination
+
+    return queue_name
+
+
+def get_queue_priority_lane(queue_name: str) -> str:
+    """
+    Returns the priority lane a queue carries messages for.
+
+    Example:
+        >>> get_queue_priority_lane("default.telemetry")
+        'telemetry'
+        >>> get_queue_priority_lane("default")
+        'control'
+    """
+    _, _, lane = queue_name.rpartition(".")
+
+    if lane in DEDICATED_LANE_WORKER_THREADS:
+        return lane
+
+    return DEFAULT_PRIORITY_LANE
+
+
+def lane_queue_names(queue_name: str) -> list:
+    """
+    Returns the queues of every dedicated priority lane for a destination queue.
+    """
+    return [lane_queue_name(queue_name, lane) for lane in DEDICATED_LANE_WORKER_THREADS]
+
+
+class PriorityLaneWorker(Worker):
+    """
+    A dramatiq worker that only consumes the queues of one priority lane.
+
+    Queues declared after the worker started are picked up too, as long as they belong to its lane. Queues dedicated
+    to some actors, and their companion queues, are left to their own worker. A worker given its queues explicitly
+    consumes them whatever their lane.
+    """
+
+    def __init__(self, broker, lane: str = DEFAULT_PRIORITY_LANE, **kwargs):
+        super().__init__(broker, **kwargs)
+        self.lane = lane
+
+    def _add_consumer(self, queue_name: str, *, delay: bool = False) -> None:
+        if not self.consumer_whitelist:
+            if get_queue_priority_lane(q_name(queue_name)) != self.lane:
+                self.logger.debug("Dropping consumer for queue %r: not in the %r lane.", queue_name, self.lane)
+                return
+
+            if is_dedicated_queue(get_lane_destination_queue(q_name(queue_name))):
+                self.logger.debug("Dropping consumer for queue %r: dedicated to its own worker.", queue_name)
+                return
+
+        super()._add_consumer(queue_name, delay=delay)
+
+    def stop(self, *args, **kwargs) -> None:
+        super().stop(*args, **kwargs)
+
+        # dramatiq keeps the worker middleware of stopped workers, which would start consumers for this worker on
+        # queues declared later, and leave their messages with no worker thread to process them.
+        remove_worker_middleware(self)
+
+
+def remove_worker_middleware(worker: Worker):
+    """
+    Removes the middleware a started worker added to its broker to be told about newly declared queues.
+    """
+    worker.broker.middleware[:] = [middleware for middleware in worker.broker.middleware
+                                   if getattr(middleware, "worker", None) is not worker]
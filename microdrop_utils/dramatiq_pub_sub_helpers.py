@@ -1,8 +1,16 @@
-from traits.api import HasTraits, Dict, Str, Instance
+import copy
+import threading
+from collections import OrderedDict
+
+from traits.api import HasTraits, Dict, Str, Instance, Any, Event, Int, List, Bool, Property, observe
 import dramatiq
+from dramatiq.brokers.redis import RedisBroker
 
-from microdrop_utils.dramatiq_controller_base import DramatiqControllerBase
-from microdrop_utils.redis_manager import RedisHashDictProxy
+from microdrop_utils.dramatiq_controller_base import DramatiqControllerBase, get_latest_value_store
+from microdrop_utils.redis_manager import RedisSubscriptionStore
+from microdrop_utils.in_process_broker import InProcessBroker, InMemorySubscriptionStore
+from microdrop_utils.dramatiq_priority_lanes import PRIORITY_LANES, DEFAULT_PRIORITY_LANE, route_queue_name
+from microdrop_utils.dramatiq_actor_concurrency import get_actor_queue
 
 from microdrop_utils._logger import get_logger
 
@@ -11,21 +19,18 @@ logger = get_logger(__name__)
 DEFAULT_STORAGE_KEY_NAME = "microdrop:message_router_data"
 
 
-def publish_message(message, topic, actor_to_send="message_router_actor", queue_name="default", message_kwargs=None, message_options=None):
+def build_message(message, topic, actor_to_send="message_router_actor", queue_name="default", message_kwargs=None,
+                  message_options=None) -> dramatiq.Message:
     """
-    Publish a message to a given actor with a certain topic
+    Build the dramatiq message carrying a message to a given actor with a certain topic
     """
-    logger.debug(f"Publishing message: {message} to actor: {actor_to_send} on topic: {topic}")
-    # print(f"Publishing message: {message} to actor: {actor_to_send} on topic: {topic}")
-    broker = dramatiq.get_broker()
-
     if message_options is None:
         message_options = {"max_retries": 1}
 
     if message_kwargs is None:
         message_kwargs = {}
 
-    message = dramatiq.Message(
+    return dramatiq.Message(
         queue_name=queue_name,
         actor_name=actor_to_send,
         args=(message, topic),
@@ -33,9 +38,68 @@ def publish_message(message, topic, actor_to_send="message_router_actor", queue_
         options=message_options,
     )
 
+
+def publish_message(message, topic, actor_to_send="message_router_actor", queue_name="default", message_kwargs=None, message_options=None):
+    """
+    Publish a message to a given actor with a certain topic
+
+    The message goes to the queue of the priority lane of its topic (see set_topic_priority_lane).
+
+    If direct routing is enabled (see enable_direct_routing), messages to the message router actor are routed straight
+    to the subscribers instead.
+    """
+    logger.debug(f"Publishing message: {message} to actor: {actor_to_send} on topic: {topic}")
+    # print(f"Publishing message: {message} to actor: {actor_to_send} on topic: {topic}")
+
+    # skip the message router actor hop if this process holds the subscription table itself
+    router = _direct_router
+    if router is not None and actor_to_send == router.listener_name:
+        router.route_message(message, topic)
+        return
+
+    broker = dramatiq.get_broker()
+
+    queue_name = route_queue_name(queue_name, get_topic_priority_lane(topic))
+
+    message = build_message(message, topic, actor_to_send, queue_name, message_kwargs, message_options)
+
     broker.enqueue(message)
 
 
+def publish_many(messages):
+    """
+    Publish several messages built with build_message at once.
+
+    With a redis broker every message is enqueued through a single pipelined round-trip instead of one round-trip per
+    message. Other brokers enqueue the messages one by one.
+
+    The messages are enqueued through broker.enqueue, so the enqueue middleware hooks run for each of them. With a redis
+    broker, the after_enqueue hooks run as the messages are queued onto the pipeline, just before it is sent.
+    """
+    broker = dramatiq.get_broker()
+    messages = list(messages)
+
+    if not isinstance(broker, RedisBroker):
+        for message in messages:
+            broker.enqueue(message)
+        return
+
+    # Messages go through the public RedisBroker.enqueue of a copy of the broker, whose dispatch script is registered
+    # on a pipeline: its script calls are queued onto the pipeline rather than sent one by one. The broker itself is
+    # left untouched, for other threads to keep enqueueing through it meanwhile.
+    pipeline = broker.client.pipeline(transaction=False)
+    pipelined_broker = copy.copy(broker)
+    pipelined_broker.scripts = {**broker.scripts,
+                                "dispatch": pipeline.register_script(broker.scripts["dispatch"].script)}
+
+    for message in messages:
+        pipelined_broker.enqueue(message)
+
+    pipeline.execute()
+
+    logger.debug(f"Published {len(messages)} messages in one pipelined round-trip")
+
+
 class MQTTMatcher:
     """Intended to manage topic filters including wildcards.
 
@@ -122,6 +186,40 @@ class MQTTMatcher:
         return rec(self._root)
 
 
+# Topic filters mapped to the priority lane of their messages, and the resolved lanes of concrete topics
+_topic_priority_lanes = MQTTMatcher()
+_topic_priority_lane_cache = {}
+
+
+def set_topic_priority_lane(topic_filter: str, lane: str):
+    """
+    Make the messages on topics matching the (wildcard) topic filter travel on the given priority lane.
+
+    Lanes are meant to be set up once at startup, before messages are routed. If a topic matches filters on several
+    lanes, the most urgent lane wins. Topics matching no filter travel on the default lane.
+    """
+    if lane not in PRIORITY_LANES:
+        raise ValueError(f"Unknown priority lane {lane}. Expected one of {PRIORITY_LANES}")
+
+    _topic_priority_lanes[topic_filter] = lane
+    _topic_priority_lane_cache.clear()
+
+
+def get_topic_priority_lane(topic: str) -> str:
+    """
+    Returns the priority lane the messages on a topic travel on.
+    """
+    try:
+        return _topic_priority_lane_cache[topic]
+    except KeyError:
+        pass
+
+    lane = min(_topic_priority_lanes.iter_match(topic), key=PRIORITY_LANES.index, default=DEFAULT_PRIORITY_LANE)
+    _topic_priority_lane_cache[topic] = lane
+
+    return lane
+
+
 class MessageRouterData(HasTraits):
     """
     A class that stores topics and their subscribers, with MQTT-style wildcards.
@@ -152,6 +250,18 @@ class MessageRouterData(HasTraits):
 
     This will also be shown in the pytest module for this project.
 
+    The subscriptions are kept in a subscription store: redis with a redis broker, so that they are shared by every
+    message router, or process memory with the in-process broker. Each instance keeps one subscription trie
+    (MQTTMatcher) in memory holding every stored topic filter, so a published topic is resolved in one trie walk. The
+    trie is only rebuilt when the subscriptions version of the store changes, which happens on every
+    add_subscriber_to_topic / add_subscribers_to_topics / remove_subscriber_from_topic call changing the
+    subscriptions, including the ones made by other routers. The topic priority lanes shared through the store (see
+    add_topic_priority_lanes) are set again in this process on each rebuild.
+
+    A subscription can be marked conflating: the subscriber then only cares about the latest message on a topic, and
+    the router keeps at most one message pending for it (see MessageRouterActor). A subscriber is conflated on a topic
+    if any of its matching subscriptions is conflating, unless the topic is one of the never_conflate_topics.
+
     Attributes:
         topic_subscriber_map (Dict): A dictionary mapping topics to a list of their subscribing actor names.
 
@@ -182,28 +292,52 @@ class MessageRouterData(HasTraits):
         >>> router_data.get_subscribers_for_topic("NONEXISTENT")
         []
     """
-    topic_subscriber_map = Instance('RedisHashDictProxy',
-                                    desc="A dictionary of topics and a list of tuples containing topic subscribed "
-                                         "actor name, listening queue pairs stored in redis as a hash")
+    subscription_store = Any(desc="The RedisSubscriptionStore or InMemorySubscriptionStore holding the "
+                                  "subscriptions, depending on the broker")
+
+    topic_subscriber_map = Property(desc="A dictionary of topics and a list of tuples containing topic subscribed "
+                                         "actor name, listening queue pairs, as stored in the subscription store")
 
     storage_key_name = Str(DEFAULT_STORAGE_KEY_NAME, desc="The name of the redis key under which this data will be "
                                                           "stored")
     listener_queue = Str("default", desc="The unique queue for a message router actor that it is listening to")
 
+    never_conflate_topics = List(Str, desc="Topics whose messages are always delivered one by one, even to "
+                                           "conflating subscribers")
+
+    _subscription_matcher = Instance(MQTTMatcher, desc="In memory trie of every stored topic filter mapping its "
+                                                       "(actor name, listening queue) subscribers to their conflate "
+                                                       "flag")
+
+    _subscription_matcher_version = Any(desc="The subscriptions version the subscription matcher was built from")
+
+    subscriptions_changed = Event(desc="Fired whenever the subscription trie is rebuilt from changed subscriptions")
+
     # ------- default trait setters ----------- #
 
-    # ------- trait change handler ---------#
+    def _subscription_store_default(self):
+        broker = dramatiq.get_broker()
+
+        if isinstance(broker, InProcessBroker):
+            return InMemorySubscriptionStore.shared(self.storage_key_name)
 
-    def _topic_subscriber_map_default(self):
-        return RedisHashDictProxy(redis_client=dramatiq.get_broker().client, hash_name=self.storage_key_name)
+        return RedisSubscriptionStore(redis_client=broker.client, storage_key_name=self.storage_key_name)
 
-    def add_subscriber_to_topic(self, topic: Str, subscribing_actor_name: Str):
+    # ------- trait property getters ----------- #
+
+    def _get_topic_subscriber_map(self):
+        return self.subscription_store.topic_subscriber_map
+
+    # ------- trait change handler ---------#
+
+    def add_subscriber_to_topic(self, topic: Str, subscribing_actor_name: Str, conflate: Bool = False):
         """
         Adds a subscriber to a specific topic.
 
         Args:
             topic (str): The topic to subscribe to.
             subscribing_actor_name (str): The name of the subscribing actor.
+            conflate (bool): If only the latest message on the topic matters to the subscriber.
 
         Preconditions:
             - `topic` should be a valid string.
@@ -217,13 +351,19 @@ class MessageRouterData(HasTraits):
 
         """
 
-        # initialize topic with the sub actor. listener queue pair if it does not exist
-        if topic not in self.topic_subscriber_map:
-            self.topic_subscriber_map[topic] = [(subscribing_actor_name, self.listener_queue)]
+        self.subscription_store.add_subscriber(topic, subscribing_actor_name,
+                                               get_actor_queue(subscribing_actor_name, self.listener_queue), conflate)
+
+    def add_subscribers_to_topics(self, subscriptions):
+        """
+        Adds many subscribers to their topics in one atomic call to the subscription store.
 
-        # if the sub actor, listener queue pair is not a value for the topic, then add it
-        elif [subscribing_actor_name, self.listener_queue] not in self.topic_subscriber_map[topic]:
-            self.topic_subscriber_map[topic] += [(subscribing_actor_name, self.listener_queue)]
+        Args:
+            subscriptions (iterable): (topic, subscribing actor name, conflate) subscriptions.
+        """
+        self.subscription_store.add_subscribers([(topic, subscribing_actor_name,
+                                                  get_actor_queue(subscribing_actor_name, self.listener_queue), conflate)
+                                                 for topic, subscribing_actor_name, conflate in subscriptions])
 
     def remove_subscriber_from_topic(self, topic: Str, subscribing_actor_name: Str):
         """
@@ -246,15 +386,24 @@ class MessageRouterData(HasTraits):
             {}
 
         """
-        if topic in self.topic_subscriber_map:
-            new_list = self.topic_subscriber_map[topic]
-            new_list.remove([subscribing_actor_name, self.listener_queue])
+        self.subscription_store.remove_subscriber(topic, subscribing_actor_name,
+                                                  get_actor_queue(subscribing_actor_name, self.listener_queue))
 
-            if len(new_list) == 0:
-                del self.topic_subscriber_map[topic]
+    def add_topic_priority_lanes(self, priority_lanes: dict):
+        """
+        Stores the priority lanes of topic filters in the subscription store, shared by every router, and sets them in
+        this process.
 
-            else:
-                self.topic_subscriber_map[topic] = new_list
+        Every router syncing its subscriptions sets the stored lanes too, so publishers in a process that does not run
+        the plugins contributing them still send their messages on the right lane.
+
+        Args:
+            priority_lanes (dict): topic filters mapped to their priority lane.
+        """
+        for topic_filter, lane in priority_lanes.items():
+            set_topic_priority_lane(topic_filter, lane)
+
+        self.subscription_store.set_priority_lanes(priority_lanes)
 
     def get_subscribers_for_topic(self, topic: str) -> list:
         """
@@ -270,18 +419,72 @@ class MessageRouterData(HasTraits):
             - `topic` should be a valid string.
 
         """
-        bytes_to_str = lambda x: x.decode() if isinstance(x, bytes) else x
+        return [(actor, queue) for actor, queue, conflate in self.get_routes_for_topic(topic)]
+
+    def get_routes_for_topic(self, topic: str) -> list:
+        """
+        Gets the subscribers for a specific topic along with whether their messages on that topic are conflated.
+
+        Args:
+            topic (str): The topic to get subscribers for.
+
+        Returns:
+            list: A list of (actor name, listening queue, conflate) tuples. The listening queue is the one of the
+            priority lane of the topic, unless the subscriber has a dedicated queue, which keeps its messages in order
+            apart from the critical ones.
+        """
+        self.sync_subscriptions()
+
+        routes = {}
+        for filter_subscribers in self._subscription_matcher.iter_match(topic):
+            for subscriber, conflate in filter_subscribers.items():
+                routes[subscriber] = routes.get(subscriber, False) or conflate
+
+        conflatable = topic not in self.never_conflate_topics
+        lane = get_topic_priority_lane(topic)
+
+        return [(actor, route_queue_name(queue, lane), conflate and conflatable)
+                for (actor, queue), conflate in routes.items()]
+
+    # ------- subscription trie helpers ---------#
+
+    def sync_subscriptions(self) -> bool:
+        """
+        Rebuilds the subscription trie only if the stored subscriptions version changed since it was built.
+
+        The version is read before the subscriptions, so a change landing in between results in one extra rebuild on
+        the next call rather than a stale trie.
 
-        subscribers = set()
-        for key, value in self.topic_subscriber_map.items():
-            key = bytes_to_str(key)
-            value = bytes_to_str(value)
+        Returns:
+            bool: True if the trie was rebuilt, in which case subscriptions_changed is fired.
+        """
+        version = self.subscription_store.get_version()
+
+        if self._subscription_matcher is not None and version == self._subscription_matcher_version:
+            return False
+
+        self._subscription_matcher = self._build_subscription_matcher()
+        self._subscription_matcher_version = version
+
+        # the priority lanes are stored along with the subscriptions, so that processes running none of the plugins
+        # that contributed them still route and publish those topics on their lane
+        for topic_filter, lane in self.subscription_store.get_priority_lanes().items():
+            set_topic_priority_lane(topic_filter, lane)
+        self.subscriptions_changed = True
+
+        return True
+
+    def _build_subscription_matcher(self) -> MQTTMatcher:
+        """
+        Build a new subscription trie holding every stored topic filter with its subscribers and their conflate flag.
+        """
+        matcher = MQTTMatcher()
+        for topic, subscribers in self.subscription_store.get_subscriptions().items():
+            matcher[topic] = subscribers
 
-            if self._topic_matches_pattern(key, topic):
-                for actor in value:
-                    subscribers.add(tuple(actor))
+        logger.debug(f"Rebuilt subscription trie for {self.storage_key_name}")
 
-        return list(subscribers)
+        return matcher
 
     @staticmethod
     def _topic_matches_pattern(pattern: str, topic: str) -> bool:
@@ -322,19 +525,151 @@ class MessageRouterData(HasTraits):
             return False
 
 
+class TopicResolutionCache:
+    """
+    A thread safe bounded LRU cache mapping concrete published topics to their resolved subscribers.
+
+    The whole cache is dropped by invalidate() whenever subscriptions change. A resolution that was started before an
+    invalidation is returned to its caller but not stored, so a stale subscriber set can never outlive the change.
+
+    Example:
+        >>> cache = TopicResolutionCache(maxsize=2)
+        >>> cache.resolve("SENSOR/1", lambda topic: [("actor1", "default")])
+        (('actor1', 'default'),)
+        >>> cache.resolve("SENSOR/1", lambda topic: [])
+        (('actor1', 'default'),)
+        >>> cache.cache_info()
+        {'hits': 1, 'misses': 1, 'invalidations': 0, 'size': 1, 'maxsize': 2}
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, topic: str, resolver) -> tuple:
+        """
+        Returns the cached subscribers for the topic, calling resolver(topic) to find them on a miss.
+        """
+        with self._lock:
+            if topic in self._entries:
+                self._entries.move_to_end(topic)
+                self.hits += 1
+                return self._entries[topic]
+
+            self.misses += 1
+            generation = self._generation
+
+        subscribers = tuple(resolver(topic))
+
+        with self._lock:
+            # only keep the resolution if no subscription change happened while resolving
+            if generation == self._generation:
+                self._entries[topic] = subscribers
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        return subscribers
+
+    def invalidate(self):
+        """
+        Drops every cached topic resolution.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def cache_info(self) -> dict:
+        """
+        Returns the hit / miss counters along with the cache size.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "size": len(self._entries), "maxsize": self.maxsize}
+
+
 class MessageRouterActor(DramatiqControllerBase):
     """
     A class that routes messages to subscribers based on topics.
 
     Each instance of this class has one message router actor with a specific queue unique to it.
+
+    Messages to conflating subscribers are not enqueued as is. The router stores the message as the latest value for
+    the subscriber and topic, and only enqueues a small delivery token carrying a conflation_key if no earlier token is
+    still pending. The subscriber listener takes the latest value when handling the token (see DramatiqControllerBase),
+    so at most one message per topic is ever pending, and a newer message replaces it.
     """
 
     ######## Message Router Interface #######################################################
     message_router_data = Instance(MessageRouterData)
 
+    topic_cache_size = Int(1024, desc="Maximum number of concrete topics kept in the topic resolution cache")
+
+    topic_resolution_cache = Instance(TopicResolutionCache, desc="LRU cache of topics to resolved subscribers. "
+                                                                 "Use its cache_info() for the hit / miss counters")
+
+    latest_value_store = Instance(HasTraits, desc="Store of the latest messages for conflating subscribers, "
+                                                  "depending on the broker")
+
     def _message_router_data_default(self):
         return MessageRouterData(listener_queue=self.listener_queue)
 
+    def _latest_value_store_default(self):
+        return get_latest_value_store()
+
+    def _topic_resolution_cache_default(self):
+        return TopicResolutionCache(maxsize=self.topic_cache_size)
+
+    @observe("message_router_data:subscriptions_changed")
+    def _invalidate_topic_resolution_cache(self, event):
+        self.topic_resolution_cache.invalidate()
+
+    def route_message(self, message, topic):
+        """
+        Publish a message to every actor subscribed to its topic, on the queue each subscriber listens to.
+        """
+        # invalidates the topic resolution cache if any router changed the subscriptions
+        self.message_router_data.sync_subscriptions()
+
+        subscribing_actor_queue_info = self.topic_resolution_cache.resolve(
+            topic, self.message_router_data.get_routes_for_topic)
+
+        messages = [build_message(message, topic, subscribing_actor, queue_name=queue)
+                    for subscribing_actor, queue, conflate in subscribing_actor_queue_info if not conflate]
+
+        conflated_subscribers = [(subscribing_actor, queue)
+                                 for subscribing_actor, queue, conflate in subscribing_actor_queue_info if conflate]
+
+        if conflated_subscribers:
+            messages += self._conflate_message(message, topic, conflated_subscribers)
+
+        # fan out every subscriber copy in one go
+        publish_many(messages)
+
+        logger.debug(
+            f"MESSAGE_ROUTER: Message: {message} on topic {topic} published to {len(subscribing_actor_queue_info)} subscribers")
+
+    def _conflate_message(self, message, topic, conflated_subscribers) -> list:
+        """
+        Store the message as the latest value for each conflating subscriber.
+
+        Returns:
+            list: Delivery token messages for the subscribers that had no message pending on this topic.
+        """
+        conflation_keys = {f"{queue}:{subscribing_actor}:{topic}": (subscribing_actor, queue)
+                           for subscribing_actor, queue in conflated_subscribers}
+
+        newly_pending = self.latest_value_store.put_many(dict.fromkeys(conflation_keys, message))
+
+        return [build_message(None, topic, *conflation_keys[key], message_kwargs={"conflation_key": key})
+                for key in newly_pending]
+
     ##################### Dramatiq Controller Base Interface #######################
 
     def _listener_actor_method_default(self):
@@ -343,14 +678,32 @@ class MessageRouterActor(DramatiqControllerBase):
         def listener_actor_method(message: Str, topic: Str):
             logger.debug(f"MESSAGE_ROUTER: Received message: {message} on topic: {topic}")
 
-            subscribing_actor_queue_info = self.message_router_data.get_subscribers_for_topic(topic)
+            self.route_message(message, topic)
 
-            for subscribing_actor, queue in subscribing_actor_queue_info:
-                logger.debug(f"MESSAGE_ROUTER: Publishing message: {message} to actor: {subscribing_actor}")
+        return listener_actor_method
 
-                publish_message(message, topic, subscribing_actor, queue_name=queue)
 
-            logger.debug(
-                f"MESSAGE_ROUTER: Message: {message} on topic {topic} published to {len(subscribing_actor_queue_info)} subscribers")
+# Message router used by publish_message to route messages itself when direct routing is enabled in this process
+_direct_router = None
 
-        return listener_actor_method
+
+def enable_direct_routing(router: MessageRouterActor):
+    """
+    Opt this process in to direct routing.
+
+    publish_message calls addressed to the message router actor are then routed in the publishing thread by the given
+    router, from its locally mirrored subscription table, straight to the subscriber queues. This skips the extra
+    broker hop through the message_router_actor. The router actor stays declared, so processes that did not opt in
+    keep routing through it.
+    """
+    global _direct_router
+    _direct_router = router
+    logger.info(f"Direct routing enabled through {router.listener_name}")
+
+
+def disable_direct_routing():
+    """
+    Route published messages through the message_router_actor again.
+    """
+    global _direct_router
+    _direct_router = None
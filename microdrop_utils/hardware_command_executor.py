@@ -0,0 +1,401 @@
+"""
+Executor serializing every call to a hardware proxy on a single thread.
+
+Serial proxies are not safe to call from several threads at once, yet requests come from dramatiq worker threads,
+scheduler threads and signal callbacks. The executor owns the proxy instead: every proxy call is submitted to it as a
+command, and run on its own thread, one at a time.
+
+Queued commands are run by priority, then in the order they were submitted:
+
+- a command submitted with preempt=True, like a halt, cancels every queued command of a lower priority, as running
+  them after it would undo it. A command already running on the proxy is let finish: a halt waits for it, so long
+  operations, like the DropBot self tests, are better submitted as several shorter commands.
+- a write to a register merges with a write to the same register still queued: only the last value is written, in
+  the place of the first write in the queue. A write submitted with merge=False is never merged, and later writes do
+  not merge into the writes queued before it, so that every state it is part of is written in order.
+
+Each command reports how long it waited in the queue and how long it ran, and the executor keeps latency stats per
+command name.
+"""
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+from traits.api import HasTraits, Str, Int, Float, Bool, Any, Callable, Property, List
+
+from microdrop_utils._logger import get_logger
+
+logger = get_logger(__name__)
+
+# command priorities, the lower the sooner
+HALT_PRIORITY = 0
+CONTROL_PRIORITY = 1
+BACKGROUND_PRIORITY = 2
+
+
+class HardwareCommandCancelled(Exception):
+    """
+    Raised when waiting on a command cancelled before being run.
+    """
+
+
+class HardwareCommand(HasTraits):
+    """
+    A call to the proxy, queued in a HardwareCommandExecutor, with its latencies once run.
+    """
+
+    name = Str(desc="The name of the command, the latency stats are kept by")
+
+    func = Callable(desc="The function called with the proxy")
+
+    priority = Int(CONTROL_PRIORITY, desc="The priority of the command, the lower the sooner it is run")
+
+    register = Str(desc="The register written by the command. Queued writes to the same register are merged into the "
+                        "last one. Empty for commands never merged")
+
+    merged_count = Int(desc="Number of later writes merged into this command")
+
+    cancelled = Bool(False, desc="True if the command was cancelled before being run")
+
+    result = Any(desc="The value returned by func")
+
+    error = Any(desc="The exception raised by func, if any")
+
+    enqueued_at = Float(desc="perf_counter time the command was queued at")
+
+    started_at = Float(desc="perf_counter time the command started running at")
+
+    finished_at = Float(desc="perf_counter time the command finished running at")
+
+    queue_wait = Property(Float, observe="enqueued_at, started_at", desc="Time spent queued, in seconds")
+
+    execution_duration = Property(Float, observe="started_at, finished_at", desc="Time spent running, in seconds")
+
+    done = Any(desc="threading.Event set once the command is run or cancelled")
+
+    # callbacks called once the command is done, guarded by _done_lock
+    _done_callbacks = List()
+
+    _done_lock = Any()
+
+    def traits_init(self):
+        self._done_lock = threading.Lock()
+
+    def _done_default(self):
+        return threading.Event()
+
+    def _get_queue_wait(self):
+        return self.started_at - self.enqueued_at if self.started_at else 0.0
+
+    def _get_execution_duration(self):
+        return self.finished_at - self.started_at if self.finished_at else 0.0
+
+    def wait(self, timeout: float = None):
+        """
+        Waits for the command to be run, and returns its result.
+
+        Raises:
+            TimeoutError: If the command is not done after timeout seconds.
+            HardwareCommandCancelled: If the command was cancelled.
+            Exception: The error the command raised, if any.
+        """
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Hardware command {self.name} not done after {timeout} s")
+
+        if self.cancelled:
+            raise HardwareCommandCancelled(f"Hardware command {self.name} was cancelled")
+
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+    def add_done_callback(self, callback):
+        """
+        Calls callback with the command once it is run or cancelled, right away if it already is.
+
+        The callback is called on the thread finishing the command, the executor thread for commands run, so it should
+        be quick, and not wait on other commands. Errors it raises are logged.
+        """
+        with self._done_lock:
+            if not self.done.is_set():
+                self._done_callbacks.append(callback)
+                return
+
+        self._call_done_callback(callback)
+
+    def _set_done(self):
+        with self._done_lock:
+            self.done.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+
+        for callback in callbacks:
+            self._call_done_callback(callback)
+
+    def _call_done_callback(self, callback):
+        try:
+            callback(self)
+        except Exception as e:
+            logger.error(f"Done callback of hardware command {self.name} failed: {e}", exc_info=True)
+
+
+class HardwareCommandExecutor(HasTraits):
+    """
+    Runs the commands submitted for a proxy on a dedicated thread, by priority.
+
+    Example:
+        >>> executor = HardwareCommandExecutor(proxy={"voltage": 0})
+        >>> executor.start()
+        >>> executor.call("read_voltage", lambda proxy: proxy["voltage"])
+        0
+        >>> executor.stop()
+    """
+
+    name = Str("hardware_command_executor", desc="Name of the executor thread")
+
+    proxy = Any(desc="The hardware proxy the commands are called with. Only ever used from the executor thread")
+
+    max_queue_size = Int(64, desc="Maximum number of queued commands. Commands that preempt are always queued")
+
+    submit_timeout = Float(5.0, desc="Time in seconds submit waits for room in a full queue before raising queue.Full")
+
+    executed_command_count = Int(desc="Number of commands run")
+
+    merged_command_count = Int(desc="Number of writes merged into an already queued write to the same register")
+
+    cancelled_command_count = Int(desc="Number of queued commands cancelled by a preempting command or on stop")
+
+    running = Bool(False, desc="True while the executor thread runs commands")
+
+    # ------- state shared with the executor thread, guarded by _condition ----------- #
+
+    _condition = Any()
+
+    # heap of (priority, sequence number, command) tuples
+    _queue = Any()
+
+    _sequence = Any()
+
+    # registers mapped to their queued write
+    _queued_writes = Any()
+
+    _thread = Any()
+
+    # command names mapped to their latency totals
+    _latency_totals = Any()
+
+    def traits_init(self):
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._queued_writes = {}
+        self._latency_totals = {}
+
+    def start(self):
+        """
+        Starts the executor thread.
+        """
+        with self._condition:
+            if self.running:
+                return
+
+            self.running = True
+
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+        logger.info(f"Started {self.name}")
+
+    def stop(self, timeout: float = None):
+        """
+        Cancels the queued commands, and stops the executor thread once the running command, if any, is done.
+        """
+        with self._condition:
+            self.running = False
+            cancelled_commands = self._cancel_queued_commands(lambda command: True)
+            self._condition.notify_all()
+
+        self._set_commands_done(cancelled_commands)
+
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+        logger.info(f"Stopped {self.name}")
+
+    def submit(self, name: str, func, priority: int = CONTROL_PRIORITY, register: str = "",
+               preempt: bool = False, merge: bool = True) -> HardwareCommand:
+        """
+        Queues a call of func with the proxy.
+
+        Args:
+            name: The name of the command.
+            func: The function to call with the proxy.
+            priority: The priority of the command, the lower the sooner it is run.
+            register: The register the command writes, for queued writes to the same register to be merged. The
+                command returned is then the queued write, whichever call submitted it.
+            preempt: If True, queued commands of a lower priority are cancelled.
+            merge: If False, the write to the register is neither merged nor merged into.
+
+        Returns:
+            HardwareCommand: The queued command, to wait on for its result.
+
+        Raises:
+            RuntimeError: If the executor is not running.
+            queue.Full: If the queue stays full for submit_timeout seconds.
+        """
+        cancelled_commands = []
+
+        with self._condition:
+            if not self.running:
+                raise RuntimeError(f"Cannot submit {name}: {self.name} is not running")
+
+            if register and not merge:
+                # later writes are queued after this one
+                self._queued_writes.pop(register, None)
+
+            elif register and register in self._queued_writes:
+                queued_write = self._queued_writes[register]
+                queued_write.func = func
+                queued_write.merged_count += 1
+                self.merged_command_count += 1
+
+                return queued_write
+
+            if preempt:
+                cancelled_commands = self._cancel_queued_commands(
+                    lambda queued_command: queued_command.priority > priority)
+
+            else:
+                has_room = self._condition.wait_for(lambda: len(self._queue) < self.max_queue_size or not self.running,
+                                                    timeout=self.submit_timeout)
+                if not has_room:
+                    raise queue.Full(f"Cannot submit {name}: {self.name} queue full")
+
+                if not self.running:
+                    raise RuntimeError(f"Cannot submit {name}: {self.name} was stopped")
+
+            command = HardwareCommand(name=name, func=func, priority=priority, register=register,
+                                      enqueued_at=time.perf_counter())
+
+            heapq.heappush(self._queue, (priority, next(self._sequence), command))
+            if register and merge:
+                self._queued_writes[register] = command
+
+            self._condition.notify_all()
+
+        self._set_commands_done(cancelled_commands)
+
+        return command
+
+    def call(self, name: str, func, priority: int = CONTROL_PRIORITY, register: str = "", preempt: bool = False,
+             merge: bool = True, timeout: float = None):
+        """
+        Submits a command and waits for its result. See submit and HardwareCommand.wait.
+
+        Called from a command already running on the executor thread, func is called right away instead.
+        """
+        if threading.current_thread() is self._thread:
+            return func(self.proxy)
+
+        return self.submit(name, func, priority=priority, register=register, preempt=preempt,
+                           merge=merge).wait(timeout)
+
+    def get_latency_stats(self) -> dict:
+        """
+        Returns the count, mean and max queue wait and execution duration in seconds of the commands run, keyed by
+        command name.
+        """
+        with self._condition:
+            return {name: {"count": totals["count"],
+                           "mean_queue_wait": totals["queue_wait"] / totals["count"],
+                           "max_queue_wait": totals["max_queue_wait"],
+                           "mean_execution_duration": totals["execution_duration"] / totals["count"],
+                           "max_execution_duration": totals["max_execution_duration"]}
+                    for name, totals in self._latency_totals.items()}
+
+    ################################# Protected methods ######################################
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or not self.running)
+
+                if not self.running:
+                    return
+
+                _, _, command = heapq.heappop(self._queue)
+
+                # later writes to the register are queued anew
+                self._forget_queued_write(command)
+
+                # room for a submit waiting on a full queue
+                self._condition.notify_all()
+
+            self._execute(command)
+
+    def _execute(self, command: HardwareCommand):
+        command.started_at = time.perf_counter()
+
+        try:
+            command.result = command.func(self.proxy)
+
+        except Exception as e:
+            command.error = e
+            logger.error(f"Hardware command {command.name} failed: {e}", exc_info=True)
+
+        finally:
+            command.finished_at = time.perf_counter()
+            self._record_latency(command)
+            command._set_done()
+
+        logger.debug(f"Hardware command {command.name}: waited {command.queue_wait * 1000:.2f} ms, "
+                     f"ran {command.execution_duration * 1000:.2f} ms")
+
+    def _record_latency(self, command: HardwareCommand):
+        with self._condition:
+            totals = self._latency_totals.setdefault(command.name, {"count": 0,
+                                                                    "queue_wait": 0.0, "max_queue_wait": 0.0,
+                                                                    "execution_duration": 0.0,
+                                                                    "max_execution_duration": 0.0})
+            totals["count"] += 1
+            totals["queue_wait"] += command.queue_wait
+            totals["max_queue_wait"] = max(totals["max_queue_wait"], command.queue_wait)
+            totals["execution_duration"] += command.execution_duration
+            totals["max_execution_duration"] = max(totals["max_execution_duration"], command.execution_duration)
+
+            self.executed_command_count += 1
+
+    def _forget_queued_write(self, command: HardwareCommand):
+        # to be called holding _condition
+        if command.register and self._queued_writes.get(command.register) is command:
+            del self._queued_writes[command.register]
+
+    def _cancel_queued_commands(self, should_cancel) -> list:
+        # to be called holding _condition. The cancelled commands returned are to be set done once it is released,
+        # for their callbacks not to run holding it.
+        kept = []
+        cancelled = []
+        for entry in self._queue:
+            command = entry[2]
+            if should_cancel(command):
+                command.cancelled = True
+                self._forget_queued_write(command)
+                self.cancelled_command_count += 1
+                cancelled.append(command)
+            else:
+                kept.append(entry)
+
+        if cancelled:
+            logger.info(f"{self.name}: cancelled {len(cancelled)} queued commands")
+
+        heapq.heapify(kept)
+        self._queue = kept
+
+        return cancelled
+
+    @staticmethod
+    def _set_commands_done(commands: list):
+        for command in commands:
+            command._set_done()
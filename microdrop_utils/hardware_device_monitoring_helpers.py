@@ -1,3 +1,4 @@
+import functools
 import re
 from serial.tools.list_ports import grep
 from microdrop_utils._logger import get_logger
@@ -11,20 +12,22 @@ def check_connected_ports_hwid(id_to_screen, regexp='USB Serial'):
     """
 
     connected_ports = grep(regexp)
-    valid_ports = []
+    pattern = _hwid_pattern(id_to_screen)
 
-    for port in connected_ports:
-        pattern = re.compile(f".*{id_to_screen}.*")
-        teensy = re.search(pattern, port.hwid)
-        if bool(teensy):
-            valid_ports.append(port)
+    return [port for port in connected_ports if pattern.search(port.hwid)]
 
-    return valid_ports
+
+@functools.lru_cache(maxsize=None)
+def _hwid_pattern(id_to_screen):
+    return re.compile(f".*{id_to_screen}.*")
 
 
 def check_devices_available(hwids_to_check):
     """
     Method to find the USB port of the DropBot if it is connected.
+
+    Returns:
+        str: The port name, or None if no DropBot is connected.
     """
 
     for hwid in hwids_to_check:
@@ -36,8 +39,8 @@ def check_devices_available(hwids_to_check):
             logger.info(f'DropBot found on port {port_name}, topic is dropbot/info')
             return port_name
 
-        else:
-            raise Exception('DropBot not found')
+    logger.debug('DropBot not found')
+    return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+"""
+Event driven detection of hardware devices plugged in, on Linux.
+
+Rather than enumerating the serial ports every few seconds, the watcher waits on inotify events of the device
+directory, /dev, and calls back only when a device whose name matches its pattern appears there, e.g. a new
+/dev/ttyACM0 when a DropBot is plugged in. No dependency is needed: inotify is called through libc.
+
+Where inotify is not available (see DeviceHotplugWatcher.is_supported), callers fall back on polling.
+"""
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+
+from traits.api import HasTraits, Str, Float, Bool, Callable, Any
+
+from microdrop_utils._logger import get_logger
+
+logger = get_logger(__name__)
+
+# inotify event masks, see inotify(7)
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+# struct inotify_event header: wd, mask, cookie, len. The name, padded with null bytes, follows.
+_INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+# bytes written to the wake pipe of the watcher thread
+_RESCAN = b"r"
+_STOP = b"s"
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+
+    if not hasattr(libc, "inotify_init1"):
+        return None
+
+    return libc
+
+
+def parse_inotify_events(data: bytes) -> list:
+    """
+    Returns the names of the files the inotify events read from an inotify file descriptor are about.
+    """
+    names = []
+    offset = 0
+    while offset + _INOTIFY_EVENT_HEADER.size <= len(data):
+        _, _, _, name_length = _INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+        offset += _INOTIFY_EVENT_HEADER.size
+
+        names.append(data[offset:offset + name_length].rstrip(b"\0").decode(errors="replace"))
+        offset += name_length
+
+    return names
+
+
+class DeviceHotplugWatcher(HasTraits):
+    """
+    Calls on_device_added from its own thread when a device matching device_pattern appears in device_dir.
+
+    on_device_added is also called with None to rescan the devices already there: once when the watcher starts, and
+    on every call to rescan.
+    """
+
+    device_dir = Str("/dev", desc="The directory devices appear in")
+
+    device_pattern = Str(r"^tty(ACM|USB)\d+$", desc="Regular expression the names of the devices watched match")
+
+    on_device_added = Callable(desc="Called with the path of the device added, or None for a rescan")
+
+    settle_delay = Float(0.5, desc="Time in seconds waited after a device appears for it to be set up before calling "
+                                   "on_device_added")
+
+    paused = Bool(False, desc="True while devices added are ignored")
+
+    running = Bool(False, desc="True while the watcher thread runs")
+
+    _libc = Any()
+
+    _inotify_fd = Any()
+
+    _wake_pipe = Any()
+
+    _thread = Any()
+
+    @staticmethod
+    def is_supported() -> bool:
+        """
+        Returns True if inotify is available to watch devices on this platform.
+        """
+        return _load_libc() is not None
+
+    def start(self):
+        """
+        Starts watching device_dir.
+
+        Raises:
+            OSError: If inotify is not available, or device_dir cannot be watched.
+        """
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError(f"inotify is not available on {sys.platform}")
+
+        inotify_fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if inotify_fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        if self._libc.inotify_add_watch(inotify_fd, os.fsencode(self.device_dir), IN_CREATE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(inotify_fd)
+            raise OSError(errno, f"Cannot watch {self.device_dir}: {os.strerror(errno)}")
+
+        self._inotify_fd = inotify_fd
+        self._wake_pipe = os.pipe()
+        self.running = True
+
+        self._thread = threading.Thread(target=self._watch, name="device_hotplug_watcher", daemon=True)
+        self._thread.start()
+
+        logger.info(f"Watching {self.device_dir} for devices matching {self.device_pattern}")
+
+        # devices plugged in before the watcher started
+        self.rescan()
+
+    def stop(self, timeout: float = None):
+        """
+        Stops watching device_dir.
+        """
+        if not self.running:
+            return
+
+        self.running = False
+        os.write(self._wake_pipe[1], _STOP)
+
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def rescan(self):
+        """
+        Calls on_device_added with None from the watcher thread, for the devices already there to be checked again.
+        """
+        if self.running:
+            os.write(self._wake_pipe[1], _RESCAN)
+
+    def pause(self):
+        """
+        Ignores the devices added until resume is called.
+        """
+        self.paused = True
+
+    def resume(self):
+        """
+        Watches the devices added again, and rescans the devices already there.
+        """
+        self.paused = False
+        self.rescan()
+
+    ################################# Protected methods ######################################
+
+    def _watch(self):
+        device_pattern = re.compile(self.device_pattern)
+        wake_fd = self._wake_pipe[0]
+
+        try:
+            while True:
+                readable, _, _ = select.select([self._inotify_fd, wake_fd], [], [])
+
+                if wake_fd in readable:
+                    wake_bytes = os.read(wake_fd, 64)
+                    if _STOP in wake_bytes:
+                        return
+
+                    self._notify(None)
+
+                if self._inotify_fd in readable:
+                    names = parse_inotify_events(os.read(self._inotify_fd, 4096))
+
+                    for name in names:
+                        if device_pattern.match(name) and not self.paused:
+                            logger.debug(f"Device {name} added to {self.device_dir}")
+                            time.sleep(self.settle_delay)
+                            self._notify(os.path.join(self.device_dir, name))
+
+        finally:
+            os.close(self._inotify_fd)
+            os.close(self._wake_pipe[0])
+            os.close(self._wake_pipe[1])
+
+    def _notify(self, device_path):
+        try:
+            self.on_device_added(device_path)
+        except Exception as e:
+            logger.error(f"Error handling device {device_path or 'rescan'}: {e}", exc_info=True)
@@ -0,0 +1,296 @@
+"""
+In-process dramatiq broker, for apps running the message router, the hardware controllers and the UI in one process.
+
+Messages never leave the process, so they are not serialized at all: the Message objects, and the Python objects in
+their arguments, are handed by reference from the publishing thread to the actor running on a worker thread. The
+subscriptions and the latest conflated messages are kept in process memory as well, so no redis server is needed.
+
+The broker is selected at startup, before any plugin or actor is imported, with set_dramatiq_broker:
+
+    from microdrop_utils.in_process_broker import set_dramatiq_broker, IN_PROCESS
+    set_dramatiq_broker(IN_PROCESS)
+
+Redis is still needed when the backend and the frontend run as separate processes.
+"""
+import threading
+import uuid
+from queue import Empty
+from typing import Optional
+
+import dramatiq
+from dramatiq import MessageProxy, Consumer
+from dramatiq.brokers.stub import StubBroker
+from dramatiq.common import dq_name, current_millis
+from dramatiq.errors import QueueNotFound
+from traits.api import HasTraits, Dict, Any, Str, Int
+
+from microdrop_utils._logger import get_logger
+
+logger = get_logger(__name__)
+
+REDIS = "redis"
+IN_PROCESS = "in_process"
+BROKER_BACKENDS = (REDIS, IN_PROCESS)
+
+
+class InProcessBroker(StubBroker):
+    """
+    A dramatiq broker passing messages between the threads of one process by reference, without encoding them.
+    """
+
+    def __init__(self, middleware=None):
+        # a failing actor must not make join raise: this broker runs apps, not only tests
+        super().__init__(middleware, fail_fast_default=False)
+
+    def consume(self, queue_name: str, prefetch: int = 1, timeout: int = 100) -> Consumer:
+        try:
+            return _InProcessConsumer(self.queues[queue_name], self.dead_letters_by_queue[queue_name], prefetch,
+                                      timeout)
+        except KeyError:
+            raise QueueNotFound(queue_name) from None
+
+    def enqueue(self, message: dramatiq.Message, *, delay: Optional[int] = None) -> dramatiq.Message:
+        # StubBroker.enqueue puts the encoded message on the queue. Put the message itself instead.
+        queue_name = message.queue_name
+        if delay is not None:
+            message = message.copy(queue_name=dq_name(queue_name), options={"eta": current_millis() + delay})
+
+        if message.queue_name not in self.queues:
+            raise QueueNotFound(message.queue_name)
+
+        self.emit_before("enqueue", message, delay)
+        self.queues[message.queue_name].put(message)
+        self.emit_after("enqueue", message, delay)
+
+        return message
+
+
+class _InProcessConsumer(Consumer):
+    """
+    Consumes the Message objects put on an InProcessBroker queue.
+    """
+
+    def __init__(self, queue, dead_letters, prefetch, timeout):
+        self.queue = queue
+        self.dead_letters = dead_letters
+        self.timeout = timeout
+
+        # slots for the messages taken off the queue but not acked yet
+        self.prefetch_semaphore = threading.Semaphore(value=prefetch)
+
+    def ack(self, message):
+        self.queue.task_done()
+        self.prefetch_semaphore.release()
+
+    def nack(self, message):
+        self.queue.task_done()
+        self.dead_letters.append(message)
+        self.prefetch_semaphore.release()
+
+    def requeue(self, messages):
+        for message in messages:
+            self.queue.put(message._message)
+            self.queue.task_done()
+            self.prefetch_semaphore.release()
+
+    def __next__(self):
+        if not self.prefetch_semaphore.acquire(timeout=self.timeout / 1000):
+            return None
+
+        try:
+            return MessageProxy(self.queue.get(timeout=self.timeout / 1000))
+        except Empty:
+            self.prefetch_semaphore.release()
+            return None
+
+
+def set_dramatiq_broker(backend: str = REDIS) -> dramatiq.Broker:
+    """
+    Sets the dramatiq broker of this process. Call this at startup, before any actor is declared.
+
+    The redis broker is the dramatiq default, so only the in-process broker needs setting.
+    """
+    if backend not in BROKER_BACKENDS:
+        raise ValueError(f"Unknown broker backend {backend}. Expected one of {BROKER_BACKENDS}")
+
+    if backend == IN_PROCESS:
+        dramatiq.set_broker(InProcessBroker())
+
+    logger.info(f"Using the {backend} dramatiq broker")
+
+    return dramatiq.get_broker()
+
+
+class InMemorySubscriptionStore(HasTraits):
+    """
+    Topic subscriptions kept in process memory, for message routers running on the in-process broker.
+
+    It has the same interface as the RedisSubscriptionStore. The routers of a process share one store per storage key,
+    like they would share the redis keys.
+    """
+
+    #: topics mapped to their (actor name, listening queue) subscribers and conflate flag
+    subscriptions = Dict(desc="Topics mapped to their (actor name, listening queue) subscribers and conflate flag")
+
+    version = Any(desc="Token changing every time the subscriptions change")
+
+    leases = Dict(Str, Int, desc="Listening queues mapped to their lease expiry time in ms")
+
+    priority_lanes = Dict(Str, Str, desc="Topic filters mapped to their priority lane")
+
+    _lock = Any()
+
+    _shared_stores = {}
+
+    def traits_init(self):
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, storage_key_name: str) -> "InMemorySubscriptionStore":
+        """
+        Returns the store shared by every router of this process for a storage key.
+        """
+        return cls._shared_stores.setdefault(storage_key_name, cls())
+
+    @property
+    def topic_subscriber_map(self) -> dict:
+        """
+        The topics and their [actor name, listening queue] subscribers.
+        """
+        with self._lock:
+            return {topic: sorted(list(subscriber) for subscriber in subscribers)
+                    for topic, subscribers in self.subscriptions.items()}
+
+    def add_subscriber(self, topic: str, actor_name: str, queue_name: str, conflate: bool = False) -> bool:
+        return self.add_subscribers([(topic, actor_name, queue_name, conflate)])
+
+    def add_subscribers(self, subscriptions) -> bool:
+        changed = False
+        with self._lock:
+            for topic, actor_name, queue_name, conflate in subscriptions:
+                subscribers = self.subscriptions.setdefault(topic, {})
+                if subscribers.get((actor_name, queue_name)) != bool(conflate):
+                    subscribers[(actor_name, queue_name)] = bool(conflate)
+                    changed = True
+
+            if changed:
+                self.version = uuid.uuid4().hex
+
+        return changed
+
+    def remove_subscriber(self, topic: str, actor_name: str, queue_name: str) -> bool:
+        return self.remove_subscribers([(topic, actor_name, queue_name)])
+
+    def remove_subscribers(self, subscriptions) -> bool:
+        changed = False
+        with self._lock:
+            for topic, actor_name, queue_name in subscriptions:
+                subscribers = self.subscriptions.get(topic, {})
+                if subscribers.pop((actor_name, queue_name), None) is None:
+                    continue
+
+                if not subscribers:
+                    del self.subscriptions[topic]
+
+                changed = True
+
+            if changed:
+                self.version = uuid.uuid4().hex
+
+        return changed
+
+    def renew_lease(self, queue_name: str, expiry_ms: int):
+        with self._lock:
+            self.leases[queue_name] = expiry_ms
+
+    def collect_expired_leases(self, now_ms: int) -> list:
+        with self._lock:
+            expired = [queue_name for queue_name, expiry_ms in self.leases.items() if expiry_ms <= now_ms]
+            if not expired:
+                return expired
+
+            for queue_name in expired:
+                del self.leases[queue_name]
+
+            for topic, subscribers in list(self.subscriptions.items()):
+                for actor_name, queue_name in list(subscribers):
+                    if queue_name in expired:
+                        del subscribers[(actor_name, queue_name)]
+
+                if not subscribers:
+                    del self.subscriptions[topic]
+
+            self.version = uuid.uuid4().hex
+
+        return expired
+
+    def get_lease_counts(self, now_ms: int) -> tuple:
+        with self._lock:
+            live = sum(expiry_ms > now_ms for expiry_ms in self.leases.values())
+            return live, len(self.leases) - live
+
+    def set_priority_lanes(self, priority_lanes: dict) -> bool:
+        with self._lock:
+            changed = {topic: lane for topic, lane in priority_lanes.items() if self.priority_lanes.get(topic) != lane}
+            if changed:
+                self.priority_lanes.update(changed)
+                self.version = uuid.uuid4().hex
+
+        return bool(changed)
+
+    def get_priority_lanes(self) -> dict:
+        with self._lock:
+            return dict(self.priority_lanes)
+
+    def clear(self):
+        with self._lock:
+            self.subscriptions.clear()
+            self.leases.clear()
+            self.priority_lanes.clear()
+            self.version = uuid.uuid4().hex
+
+    def get_version(self):
+        return self.version
+
+    def get_subscriptions(self) -> dict:
+        with self._lock:
+            return {topic: dict(subscribers) for topic, subscribers in self.subscriptions.items()}
+
+
+class InMemoryLatestValueStore(HasTraits):
+    """
+    Latest conflated values kept in process memory, with the same interface as the RedisLatestValueStore.
+
+    Values are not encoded: the latest value itself is handed to the consumer.
+    """
+
+    #: keys mapped to their latest value, for the keys with a value pending delivery
+    latest_values = Dict(desc="Keys mapped to their latest value, for the keys with a value pending delivery")
+
+    _lock = Any()
+
+    _shared_store = None
+
+    def traits_init(self):
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "InMemoryLatestValueStore":
+        """
+        Returns the store shared by the routers and the listeners of this process.
+        """
+        if cls._shared_store is None:
+            cls._shared_store = cls()
+
+        return cls._shared_store
+
+    def put_many(self, values: dict) -> list:
+        with self._lock:
+            newly_pending = [key for key in values if key not in self.latest_values]
+            self.latest_values.update(values)
+
+        return newly_pending
+
+    def take(self, key, default=None):
+        with self._lock:
+            return self.latest_values.pop(key, default)
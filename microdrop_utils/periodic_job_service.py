@@ -0,0 +1,220 @@
+"""
+One process wide scheduler for the periodic jobs of every plugin.
+
+Rather than each poller starting its own BackgroundScheduler, with its own threads, pollers register named jobs with
+the shared PeriodicJobService. Adding a job under a name already taken replaces it, so that registering again, e.g.
+on every device monitoring request, never piles up jobs. Jobs can be paused and resumed by name, and the service
+reports the threads it runs on and how long each job takes.
+"""
+import threading
+import time
+
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from traits.api import HasTraits, Int, Str, Any, Instance, Property
+
+from microdrop_utils._logger import get_logger
+
+logger = get_logger(__name__)
+
+_shared_service = None
+_shared_service_lock = threading.Lock()
+
+
+class PeriodicJob(HasTraits):
+    """
+    Handle on a job registered with a PeriodicJobService, to pause, resume or remove it.
+    """
+
+    name = Str(desc="The name of the job")
+
+    service = Instance("PeriodicJobService", desc="The service the job is registered with")
+
+    paused = Property(desc="True while the job is paused")
+
+    def _get_paused(self):
+        return self.service.is_job_paused(self.name)
+
+    def pause(self):
+        self.service.pause_job(self.name)
+
+    def resume(self):
+        self.service.resume_job(self.name)
+
+    def remove(self):
+        self.service.remove_job(self.name)
+
+
+class PeriodicJobService(HasTraits):
+    """
+    Runs named periodic jobs on a single BackgroundScheduler.
+
+    A job missing its run because the previous one is still going is skipped, and runs missed while the process was
+    busy are run once.
+
+    Example:
+        >>> service = PeriodicJobService()
+        >>> job = service.add_or_replace_job("example_poll", lambda: None, interval_s=60)
+        >>> job.pause()
+        >>> job.paused
+        True
+        >>> service.add_or_replace_job("example_poll", lambda: None, interval_s=30).paused
+        False
+        >>> service.shutdown()
+    """
+
+    max_worker_threads = Int(4, desc="Maximum number of threads running jobs at once")
+
+    scheduler = Instance(BackgroundScheduler, desc="The scheduler running the jobs")
+
+    thread_count = Property(Int, desc="Number of threads of the service: its scheduler thread, and the worker threads "
+                                      "alive that ran jobs")
+
+    # job names mapped to their run time totals
+    _job_stats = Any()
+
+    # worker threads that ran jobs
+    _worker_threads = Any()
+
+    _lock = Any()
+
+    @classmethod
+    def shared(cls) -> "PeriodicJobService":
+        """
+        Returns the service shared by the whole process.
+        """
+        global _shared_service
+
+        with _shared_service_lock:
+            if _shared_service is None:
+                _shared_service = cls()
+
+            return _shared_service
+
+    def traits_init(self):
+        self._job_stats = {}
+        self._worker_threads = set()
+        self._lock = threading.Lock()
+
+    def _scheduler_default(self):
+        return BackgroundScheduler(executors={"default": ThreadPoolExecutor(self.max_worker_threads)},
+                                   job_defaults={"coalesce": True, "max_instances": 1})
+
+    def _get_thread_count(self):
+        with self._lock:
+            alive_worker_threads = [thread for thread in self._worker_threads if thread.is_alive()]
+
+        return len(alive_worker_threads) + (1 if self.scheduler.running else 0)
+
+    def add_or_replace_job(self, name: str, func, interval_s: float, on_result=None) -> PeriodicJob:
+        """
+        Runs func every interval_s seconds, under name. A job already registered under name is replaced.
+
+        Args:
+            name: The name of the job.
+            func: The function called with no arguments.
+            interval_s: Time in seconds between runs. The first run is interval_s after the job is added.
+            on_result: Optional function called with the value func returns.
+
+        Returns:
+            PeriodicJob: A handle on the job.
+        """
+        if not self.scheduler.running:
+            self.scheduler.start()
+
+        self.scheduler.add_job(func=self._run_job, args=(name, func, on_result), trigger=IntervalTrigger(
+            seconds=interval_s), id=name, name=name, replace_existing=True)
+
+        logger.debug(f"Periodic job {name} running every {interval_s} s")
+
+        return PeriodicJob(name=name, service=self)
+
+    def pause_job(self, name: str) -> bool:
+        """
+        Pauses a job. Returns False if there is no job under name.
+        """
+        return self._apply_to_job(self.scheduler.pause_job, name)
+
+    def resume_job(self, name: str) -> bool:
+        """
+        Resumes a job. Returns False if there is no job under name.
+        """
+        return self._apply_to_job(self.scheduler.resume_job, name)
+
+    def remove_job(self, name: str) -> bool:
+        """
+        Removes a job. Returns False if there is no job under name.
+        """
+        return self._apply_to_job(self.scheduler.remove_job, name)
+
+    def is_job_paused(self, name: str) -> bool:
+        """
+        Returns True if the job is paused, or there is no job under name.
+        """
+        job = self.scheduler.get_job(name)
+
+        return job is None or job.next_run_time is None
+
+    def get_job_stats(self) -> dict:
+        """
+        Returns whether each job is paused, its number of runs and failures, and its mean, max and last run time in
+        seconds, keyed by job name.
+        """
+        with self._lock:
+            job_stats = {name: dict(stats) for name, stats in self._job_stats.items()}
+
+        for job in self.scheduler.get_jobs():
+            stats = job_stats.setdefault(job.id, {"run_count": 0, "error_count": 0, "total_run_time": 0.0,
+                                                  "max_run_time": 0.0, "last_run_time": 0.0})
+            stats["paused"] = job.next_run_time is None
+
+        for stats in job_stats.values():
+            stats["mean_run_time"] = stats.pop("total_run_time") / stats["run_count"] if stats["run_count"] else 0.0
+
+        return job_stats
+
+    def shutdown(self, wait: bool = False):
+        """
+        Stops the scheduler, along with every job.
+        """
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=wait)
+
+    ################################# Protected methods ######################################
+
+    def _apply_to_job(self, method, name: str) -> bool:
+        try:
+            method(name)
+        except JobLookupError:
+            logger.warning(f"No periodic job {name}")
+            return False
+
+        return True
+
+    def _run_job(self, name: str, func, on_result):
+        start = time.perf_counter()
+        failed = False
+
+        try:
+            result = func()
+        except Exception as e:
+            failed = True
+            logger.error(f"Periodic job {name} failed: {e}", exc_info=True)
+
+        run_time = time.perf_counter() - start
+
+        with self._lock:
+            self._worker_threads.add(threading.current_thread())
+
+            stats = self._job_stats.setdefault(name, {"run_count": 0, "error_count": 0, "total_run_time": 0.0,
+                                                      "max_run_time": 0.0, "last_run_time": 0.0})
+            stats["run_count"] += 1
+            stats["error_count"] += failed
+            stats["total_run_time"] += run_time
+            stats["max_run_time"] = max(stats["max_run_time"], run_time)
+            stats["last_run_time"] = run_time
+
+        if not failed and on_result is not None:
+            on_result(result)
@@ -1,5 +1,8 @@
 import json
-from traits.api import HasTraits, Instance, Str
+import uuid
+
+import dramatiq
+from traits.api import HasTraits, Instance, Str, Int, Any
 
 
 class RedisHashDictProxy(HasTraits):
@@ -107,6 +110,377 @@ class RedisHashDictProxy(HasTraits):
         self.redis_client.hmset(self.hash_name, mapping={k: json.dumps(v) for k, v in data.items()})
 
 
+# Adds (topic, subscriber, conflated subscription, conflate flag) groups of arguments in one atomic call, and only
+# changes the version token if a subscription was added or had its conflate flag changed.
+ADD_SUBSCRIBERS_SCRIPT = """
+local changed = 0
+for i = 3, #ARGV, 4 do
+    redis.call("SADD", KEYS[1], ARGV[i])
+    changed = changed + redis.call("SADD", ARGV[2] .. ARGV[i], ARGV[i + 1])
+    if ARGV[i + 3] == "1" then
+        changed = changed + redis.call("SADD", KEYS[2], ARGV[i + 2])
+    else
+        changed = changed + redis.call("SREM", KEYS[2], ARGV[i + 2])
+    end
+end
+if changed > 0 then
+    redis.call("SET", KEYS[3], ARGV[1])
+end
+return changed
+"""
+
+# Removes (topic, subscriber, conflated subscription) groups of arguments in one atomic call, dropping topics left
+# with no subscriber from the topics set.
+REMOVE_SUBSCRIBERS_SCRIPT = """
+local changed = 0
+for i = 3, #ARGV, 3 do
+    local topic_key = ARGV[2] .. ARGV[i]
+    changed = changed + redis.call("SREM", topic_key, ARGV[i + 1])
+    redis.call("SREM", KEYS[2], ARGV[i + 2])
+    if redis.call("SCARD", topic_key) == 0 then
+        redis.call("SREM", KEYS[1], ARGV[i])
+    end
+end
+if changed > 0 then
+    redis.call("SET", KEYS[3], ARGV[1])
+end
+return changed
+"""
+
+# Removes every subscription of the listening queues whose lease expired, along with their leases, in one atomic call.
+# Returns the expired queues.
+COLLECT_EXPIRED_LEASES_SCRIPT = """
+local expired = redis.call("ZRANGEBYSCORE", KEYS[4], "-inf", ARGV[3])
+if #expired == 0 then
+    return expired
+end
+
+local is_expired = {}
+for _, queue in ipairs(expired) do
+    is_expired[queue] = true
+end
+
+for _, topic in ipairs(redis.call("SMEMBERS", KEYS[1])) do
+    local topic_key = ARGV[2] .. topic
+    for _, subscriber in ipairs(redis.call("SMEMBERS", topic_key)) do
+        if is_expired[cjson.decode(subscriber)[2]] then
+            redis.call("SREM", topic_key, subscriber)
+        end
+    end
+    if redis.call("SCARD", topic_key) == 0 then
+        redis.call("SREM", KEYS[1], topic)
+    end
+end
+
+for _, conflated in ipairs(redis.call("SMEMBERS", KEYS[2])) do
+    if is_expired[cjson.decode(conflated)[3]] then
+        redis.call("SREM", KEYS[2], conflated)
+    end
+end
+
+redis.call("ZREM", KEYS[4], unpack(expired))
+redis.call("SET", KEYS[3], ARGV[1])
+return expired
+"""
+
+
+class RedisSubscriptionStore(HasTraits):
+    """
+    Topic subscriptions of (actor name, listening queue) subscribers, shared through redis by every message router.
+
+    Every topic has a redis set of its subscribers, listed in a redis set of topics, with the conflating subscriptions
+    in one more redis set. Subscriptions are added and removed in bulk by lua scripts, so registering all the
+    subscriptions of an app is one atomic round-trip, and concurrent routers never overwrite each other's changes. A
+    version token, changed on every modification, lets routers know when to reload them.
+
+    A listening queue can hold a lease, kept in a redis sorted set of queues by expiry time. Once the lease expires,
+    e.g. because the router process owning the queue died without renewing it, collect_expired_leases removes every
+    subscription of the queue. Queues that never held a lease keep their subscriptions.
+    """
+
+    redis_client = Instance('redis.StrictRedis')
+
+    storage_key_name = Str(desc="The name prefixing the redis keys under which the subscriptions are stored")
+
+    topics_key_name = Str(desc="The name of the redis set holding every subscribed topic")
+
+    version_key_name = Str(desc="The name of the redis key holding a token that changes every time the stored "
+                                "subscriptions change")
+
+    conflated_key_name = Str(desc="The name of the redis set holding the conflating (topic, actor name, listening "
+                                  "queue) subscriptions")
+
+    leases_key_name = Str(desc="The name of the redis sorted set of listening queues by lease expiry time in ms")
+
+    priority_lanes_key_name = Str(desc="The name of the redis hash of topic filters and their priority lane")
+
+    add_subscribers_script = Any(desc="Lua script adding subscriptions, registered on the redis client")
+    remove_subscribers_script = Any(desc="Lua script removing subscriptions, registered on the redis client")
+    collect_expired_leases_script = Any(desc="Lua script removing the subscriptions of expired leases, registered on "
+                                             "the redis client")
+
+    def _topics_key_name_default(self):
+        return f"{self.storage_key_name}:topics"
+
+    def _version_key_name_default(self):
+        return f"{self.storage_key_name}:version"
+
+    def _conflated_key_name_default(self):
+        return f"{self.storage_key_name}:conflated"
+
+    def _leases_key_name_default(self):
+        return f"{self.storage_key_name}:leases"
+
+    def _priority_lanes_key_name_default(self):
+        return f"{self.storage_key_name}:priority_lanes"
+
+    def _add_subscribers_script_default(self):
+        return self.redis_client.register_script(ADD_SUBSCRIBERS_SCRIPT)
+
+    def _remove_subscribers_script_default(self):
+        return self.redis_client.register_script(REMOVE_SUBSCRIBERS_SCRIPT)
+
+    def _collect_expired_leases_script_default(self):
+        return self.redis_client.register_script(COLLECT_EXPIRED_LEASES_SCRIPT)
+
+    @property
+    def topic_key_prefix(self) -> str:
+        """
+        The prefix of the redis sets holding the subscribers of each topic.
+        """
+        return f"{self.storage_key_name}:topic:"
+
+    @property
+    def topic_subscriber_map(self) -> dict:
+        """
+        The topics and their [actor name, listening queue] subscribers.
+        """
+        return {topic: sorted([actor, queue] for actor, queue in subscribers)
+                for topic, subscribers in self.get_subscriptions().items()}
+
+    def add_subscriber(self, topic: str, actor_name: str, queue_name: str, conflate: bool = False) -> bool:
+        """
+        Adds a subscriber to a topic, or updates its conflate flag.
+
+        Returns:
+            bool: True if the stored subscriptions changed.
+        """
+        return self.add_subscribers([(topic, actor_name, queue_name, conflate)])
+
+    def add_subscribers(self, subscriptions) -> bool:
+        """
+        Adds (topic, actor name, listening queue, conflate) subscriptions in one atomic call.
+
+        Returns:
+            bool: True if the stored subscriptions changed.
+        """
+        args = []
+        for topic, actor_name, queue_name, conflate in subscriptions:
+            args += [topic, json.dumps([actor_name, queue_name]), json.dumps([topic, actor_name, queue_name]),
+                     int(bool(conflate))]
+
+        if not args:
+            return False
+
+        return bool(self.add_subscribers_script(keys=[self.topics_key_name, self.conflated_key_name,
+                                                      self.version_key_name],
+                                                args=[uuid.uuid4().hex, self.topic_key_prefix] + args))
+
+    def remove_subscriber(self, topic: str, actor_name: str, queue_name: str) -> bool:
+        """
+        Removes a subscriber from a topic. If the topic has no more subscribers, it is removed from the topics.
+
+        Returns:
+            bool: True if the stored subscriptions changed.
+        """
+        return self.remove_subscribers([(topic, actor_name, queue_name)])
+
+    def remove_subscribers(self, subscriptions) -> bool:
+        """
+        Removes (topic, actor name, listening queue) subscriptions in one atomic call.
+
+        Returns:
+            bool: True if the stored subscriptions changed.
+        """
+        args = []
+        for topic, actor_name, queue_name in subscriptions:
+            args += [topic, json.dumps([actor_name, queue_name]), json.dumps([topic, actor_name, queue_name])]
+
+        if not args:
+            return False
+
+        return bool(self.remove_subscribers_script(keys=[self.topics_key_name, self.conflated_key_name,
+                                                         self.version_key_name],
+                                                   args=[uuid.uuid4().hex, self.topic_key_prefix] + args))
+
+    def renew_lease(self, queue_name: str, expiry_ms: int):
+        """
+        Sets when the lease of a listening queue expires, in ms since the epoch. An expiry of 0 expires it right away.
+        """
+        self.redis_client.zadd(self.leases_key_name, {queue_name: expiry_ms})
+
+    def collect_expired_leases(self, now_ms: int) -> list:
+        """
+        Removes the leases expired by now_ms along with every subscription of their listening queues.
+
+        Returns:
+            list: The listening queues whose lease expired.
+        """
+        expired = self.collect_expired_leases_script(keys=[self.topics_key_name, self.conflated_key_name,
+                                                           self.version_key_name, self.leases_key_name],
+                                                     args=[uuid.uuid4().hex, self.topic_key_prefix, now_ms])
+
+        return [_bytes_to_str(queue_name) for queue_name in expired]
+
+    def get_lease_counts(self, now_ms: int) -> tuple:
+        """
+        Returns:
+            tuple: The number of live leases, and of expired leases not collected yet.
+        """
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.zcount(self.leases_key_name, f"({now_ms}", "+inf")
+        pipeline.zcount(self.leases_key_name, "-inf", now_ms)
+
+        return tuple(pipeline.execute())
+
+    def set_priority_lanes(self, priority_lanes: dict) -> bool:
+        """
+        Stores the priority lane of topic filters, for every router and publisher to route their messages on.
+
+        Returns:
+            bool: True if the stored priority lanes changed.
+        """
+        stored = self.get_priority_lanes()
+        changed = {topic: lane for topic, lane in priority_lanes.items() if stored.get(topic) != lane}
+
+        if not changed:
+            return False
+
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.hset(self.priority_lanes_key_name, mapping=changed)
+        self._update_version(pipeline)
+        pipeline.execute()
+
+        return True
+
+    def get_priority_lanes(self) -> dict:
+        """
+        Returns every stored topic filter mapped to its priority lane.
+        """
+        return {_bytes_to_str(topic): _bytes_to_str(lane)
+                for topic, lane in self.redis_client.hgetall(self.priority_lanes_key_name).items()}
+
+    def clear(self):
+        """
+        Removes every stored subscription, lease and priority lane.
+        """
+        topics = [_bytes_to_str(topic) for topic in self.redis_client.smembers(self.topics_key_name)]
+
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.delete(self.topics_key_name, self.conflated_key_name, self.leases_key_name,
+                        self.priority_lanes_key_name, *(self.topic_key_prefix + topic for topic in topics))
+        self._update_version(pipeline)
+        pipeline.execute()
+
+    def get_version(self):
+        """
+        Returns the token identifying the current state of the stored subscriptions.
+        """
+        return self.redis_client.get(self.version_key_name)
+
+    def get_subscriptions(self) -> dict:
+        """
+        Returns every stored topic filter mapping its (actor name, listening queue) subscribers to their conflate flag.
+        """
+        topics = [_bytes_to_str(topic) for topic in self.redis_client.smembers(self.topics_key_name)]
+
+        pipeline = self.redis_client.pipeline(transaction=True)
+        for topic in topics:
+            pipeline.smembers(self.topic_key_prefix + topic)
+        pipeline.smembers(self.conflated_key_name)
+
+        *topic_subscribers, conflated_members = pipeline.execute()
+
+        conflated_subscriptions = {tuple(json.loads(member)) for member in conflated_members}
+
+        subscriptions = {}
+        for topic, subscribers in zip(topics, topic_subscribers):
+            # a topic can lose its last subscriber between the two round-trips
+            if not subscribers:
+                continue
+
+            subscriptions[topic] = {}
+            for subscriber in subscribers:
+                actor, queue = json.loads(subscriber)
+                subscriptions[topic][(actor, queue)] = (topic, actor, queue) in conflated_subscriptions
+
+        return subscriptions
+
+    def _update_version(self, client=None):
+        """
+        Store a new subscriptions version token in redis so that every router reloads the subscriptions.
+
+        A random token is used rather than a counter so that a flushed and repopulated redis can never report a
+        version that stale subscriptions were loaded from.
+        """
+        (client or self.redis_client).set(self.version_key_name, uuid.uuid4().hex)
+
+
+def _bytes_to_str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisLatestValueStore(HasTraits):
+    """
+    Keeps only the latest value per key, along with a flag telling if that value is still pending delivery.
+
+    A producer puts values, and is told which keys had nothing pending, i.e. which keys need a new delivery to be
+    scheduled. A consumer takes the latest value, which clears the pending flag. Both happen in redis transactions so
+    that a value put while another is being taken always ends up either taken or scheduled for delivery.
+
+    Values are encoded with the dramatiq message codec.
+    """
+
+    redis_client = Instance('redis.StrictRedis')
+    key_prefix = Str("microdrop:latest_value")
+    ttl_ms = Int(60000, desc="Expiry of stored values, so abandoned keys do not stay in redis. A value whose consumer "
+                             "is busy for longer is lost, which the consumer logs")
+
+    def put_many(self, values: dict) -> list:
+        """
+        Stores the latest value for each key.
+
+        Returns:
+            list: The keys that had no value pending delivery before this call.
+        """
+        encoder = dramatiq.get_encoder()
+
+        pipeline = self.redis_client.pipeline(transaction=True)
+        for key, value in values.items():
+            pipeline.set(f"{self.key_prefix}:{key}:latest", encoder.encode({"value": value}), px=self.ttl_ms)
+            pipeline.set(f"{self.key_prefix}:{key}:pending", 1, nx=True, px=self.ttl_ms)
+
+        newly_pending = pipeline.execute()[1::2]
+
+        return [key for key, is_newly_pending in zip(values, newly_pending) if is_newly_pending]
+
+    def take(self, key, default=None):
+        """
+        Takes the latest value for a key, or default if there is none, e.g. as it expired. None is a value like any
+        other, so pass a sentinel as default to tell them apart.
+        """
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.delete(f"{self.key_prefix}:{key}:pending")
+        pipeline.get(f"{self.key_prefix}:{key}:latest")
+        pipeline.delete(f"{self.key_prefix}:{key}:latest")
+
+        encoded_value = pipeline.execute()[1]
+        if encoded_value is None:
+            return default
+
+        return dramatiq.get_encoder().decode(encoded_value)["value"]
+
+
 # Example usage
 if __name__ == "__main__":
     from microdrop_utils.broker_server_helpers import redis_server_context
@@ -0,0 +1,106 @@
+"""
+Leases tying the subscriptions of a message router to the life of its process.
+
+Every message router listens on its own queue, named anew at each launch. A router holding a lease renews it with a
+heartbeat. When a router process dies, its lease expires, and the next heartbeat of any router garbage collects the
+subscriptions of its queue along with the messages left in the queue, so that messages stop being fanned out to
+queues nobody consumes.
+
+Actors with a dedicated queue (see dramatiq_actor_concurrency) are subscribed on that queue rather than on the router
+queue, so a router leases the dedicated queues of the actors it subscribes along with its own queue.
+"""
+import dramatiq
+from dramatiq.brokers.stub import StubBroker
+from dramatiq.common import current_millis
+from traits.api import HasTraits, Any, Str, Int, List, Property
+
+from microdrop_utils._logger import get_logger
+from microdrop_utils.dramatiq_priority_lanes import lane_queue_names
+
+logger = get_logger(__name__)
+
+
+class SubscriptionLease(HasTraits):
+    """
+    The lease of a router listening queue on its subscriptions, renewed by calling heartbeat periodically.
+
+    Each heartbeat also collects every expired lease in the subscription store, and updates the lease metrics.
+    """
+
+    subscription_store = Any(desc="The RedisSubscriptionStore or InMemorySubscriptionStore holding the subscriptions")
+
+    queue_name = Str(desc="The listening queue the lease is held for")
+
+    dedicated_queues = List(Str, desc="The dedicated queues of the actors subscribed by the router, leased along "
+                                      "with its listening queue")
+
+    ttl_ms = Int(30000, desc="Time after the last heartbeat for the lease to expire. Should be a few heartbeat "
+                             "intervals")
+
+    # ------- lease metrics, updated on every heartbeat ----------- #
+
+    live_queue_count = Int(desc="Number of listening queues holding a live lease")
+
+    orphaned_queue_count = Int(desc="Number of listening queues with an expired lease, not collected yet")
+
+    collected_queue_count = Int(desc="Number of orphaned queues garbage collected by this lease's heartbeats")
+
+    metrics = Property(observe="live_queue_count, orphaned_queue_count, collected_queue_count")
+
+    def _get_metrics(self):
+        return {
+            "live_queues": self.live_queue_count,
+            "orphaned_queues": self.orphaned_queue_count,
+            "collected_queues": self.collected_queue_count,
+        }
+
+    def heartbeat(self):
+        """
+        Renews the lease, then garbage collects the orphaned queues.
+        """
+        now = current_millis()
+        for queue_name in self._get_leased_queues():
+            self.subscription_store.renew_lease(queue_name, now + self.ttl_ms)
+        self.collect_orphaned_queues(now)
+
+        self.live_queue_count, self.orphaned_queue_count = self.subscription_store.get_lease_counts(now)
+
+    def release(self):
+        """
+        Expires the lease right away, dropping the subscriptions of the queues. To be called on a clean shutdown.
+        """
+        for queue_name in self._get_leased_queues():
+            self.subscription_store.renew_lease(queue_name, 0)
+        self.collect_orphaned_queues(current_millis())
+
+    def collect_orphaned_queues(self, now_ms: int) -> list:
+        """
+        Removes the subscriptions of every queue whose lease expired by now_ms, and flushes the messages left in them.
+
+        Returns:
+            list: The orphaned queues collected.
+        """
+        orphaned_queues = self.subscription_store.collect_expired_leases(now_ms)
+
+        broker = dramatiq.get_broker()
+        for queue_name in orphaned_queues:
+            for name in [queue_name] + lane_queue_names(queue_name):
+                _flush_queue(broker, name)
+
+        if orphaned_queues:
+            logger.info(f"Garbage collected orphaned queues {orphaned_queues}")
+
+        self.collected_queue_count += len(orphaned_queues)
+
+        return orphaned_queues
+
+    def _get_leased_queues(self) -> list:
+        return [self.queue_name] + self.dedicated_queues
+
+
+def _flush_queue(broker: dramatiq.Broker, queue_name: str):
+    # queues only exist in a stub broker once declared, while a redis broker can flush the queues of other processes
+    if isinstance(broker, StubBroker) and queue_name not in broker.queues:
+        return
+
+    broker.flush(queue_name)